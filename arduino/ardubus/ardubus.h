@@ -2,16 +2,153 @@
 #define ardubus_h
 #include <Arduino.h>
 #ifndef ARDUBUS_REPORT_INTERVAL
-#define ARDUBUS_REPORT_INTERVAL 5000 // Milliseconds
+#define ARDUBUS_REPORT_INTERVAL 5000 // Milliseconds between the periodic full reports, 0 disables them (the host can still ask with "Q")
+#endif
+#ifndef ARDUBUS_PONG_INTERVAL
+#define ARDUBUS_PONG_INTERVAL 5000 // Milliseconds, the host uses PONG to tell the board is alive so this is sent even when reports are disabled
+#endif
+// Report sections, bits of ARDUBUS_REPORT_SECTIONS and of the "Q" command mask
+#define ARDUBUS_REPORT_DIGITAL_IN 0x1
+#define ARDUBUS_REPORT_DIGITAL_OUT 0x2
+#define ARDUBUS_REPORT_ANALOG_IN 0x4
+#define ARDUBUS_REPORT_PWM_OUT 0x8
+#define ARDUBUS_REPORT_SERVO 0x10
+#define ARDUBUS_REPORT_PCA9635RGBJBOL 0x20
+#define ARDUBUS_REPORT_SPI74XX595 0x40
+#define ARDUBUS_REPORT_PCA9535_IN 0x80
+#define ARDUBUS_REPORT_PCA9535_OUT 0x100
+#define ARDUBUS_REPORT_AIRCORE 0x200
+#define ARDUBUS_REPORT_I2CASCII 0x400
+#define ARDUBUS_REPORT_PULSE_IN 0x800
+#ifndef ARDUBUS_REPORT_SECTIONS
+#define ARDUBUS_REPORT_SECTIONS 0xFFFF // Sections included in the periodic report, all by default
 #endif
 #ifndef ARDUBUS_COMMAND_STRING_SIZE
+#ifdef ARDUBUS_PCA9635RGBJBOL_BOARDS
+#define ARDUBUS_COMMAND_STRING_SIZE 100 // Room for "M" command with all 48 leds of a board
+#else
 #define ARDUBUS_COMMAND_STRING_SIZE 10 //Remember to allocate for the null termination
 #endif
+#endif
 #ifndef ARDUBUS_INDEX_OFFSET
 // TODO: Use hex encoded values everywhere to avoid this
 #define ARDUBUS_INDEX_OFFSET 32 // We need to offset the pin/index numbers to above CR and LF which are control characters to us
 #endif
 
+#ifdef ARDUBUS_BINARY_FRAMING
+#ifndef ARDUBUS_FRAME_BUFFER_SIZE
+#define ARDUBUS_FRAME_BUFFER_SIZE 64 // Longest message we can send in binary framing mode, longer ones are truncated
+#endif
+// The host enables binary framing with the "F1" command, board always starts in the CRLF terminated ASCII mode
+bool ardubus_binary_mode = false;
+bool ardubus_binary_skip_lf = false; // The "F1" line ended with CR, its LF is still coming in ASCII
+byte ardubus_incoming_eol; // The CR or LF that ended the current ASCII command
+
+/**
+ * CRC-8 with polynomial 0x07, same as ardubus_core.framing.crc8
+ */
+inline byte ardubus_crc8(const byte *data, byte len)
+{
+    byte crc = 0x0;
+    for (byte i=0; i < len; i++)
+    {
+        crc ^= data[i];
+        for (byte bit=0; bit < 8; bit++)
+        {
+            if (crc & 0x80)
+            {
+                crc = (crc << 1) ^ 0x07;
+            }
+            else
+            {
+                crc <<= 1;
+            }
+        }
+    }
+    return crc;
+}
+
+/**
+ * Passes everything through to Serial in ASCII mode, in binary mode buffers the message and
+ * sends it COBS encoded (with CRC8 appended) and terminated with null when println is called
+ */
+class ardubus_framed_serial : public Print
+{
+    public:
+        byte buffer[ARDUBUS_FRAME_BUFFER_SIZE+1]; // +1 for the CRC
+        byte position;
+
+        virtual size_t write(uint8_t b)
+        {
+            if (!ardubus_binary_mode)
+            {
+                return Serial.write(b);
+            }
+            if (position >= ARDUBUS_FRAME_BUFFER_SIZE)
+            {
+                return 0;
+            }
+            buffer[position++] = b;
+            return 1;
+        }
+        using Print::write;
+
+        void end_message()
+        {
+            if (!ardubus_binary_mode)
+            {
+                Serial.print(F("\r\n"));
+                return;
+            }
+            buffer[position] = ardubus_crc8(buffer, position);
+            position++;
+            // COBS encode, our buffer is always shorter than 254 bytes so the blocks end at nulls or end of data
+            byte start = 0;
+            while (true)
+            {
+                byte end = start;
+                while (   end < position
+                       && buffer[end] != 0x0)
+                {
+                    end++;
+                }
+                Serial.write((byte)(end - start + 1));
+                Serial.write(&buffer[start], end - start);
+                if (end >= position)
+                {
+                    break;
+                }
+                start = end + 1; // Skip the null
+            }
+            Serial.write((byte)0x0);
+            position = 0;
+        }
+
+        // These hide all the Print::println variants so the message always ends via end_message
+        size_t println()
+        {
+            end_message();
+            return 0;
+        }
+        template <typename T> size_t println(T value)
+        {
+            size_t n = print(value);
+            end_message();
+            return n;
+        }
+        template <typename T, typename F> size_t println(T value, F format)
+        {
+            size_t n = print(value, format);
+            end_message();
+            return n;
+        }
+};
+ardubus_framed_serial ardubus_framed;
+#define ARDUBUS_SERIAL ardubus_framed
+#else
+#define ARDUBUS_SERIAL Serial
+#endif
+
 /**
  * Parses ASCII [0-9A-F] hexadecimal to byte value
  */
@@ -47,26 +184,33 @@ inline int ardubus_hex2int(byte hexchar0, byte hexchar1, byte hexchar2, byte hex
 inline void ardubus_ack()
 {
     /*
-    Serial.write(0x6);
-    Serial.println(F(""));
+    ARDUBUS_SERIAL.write(0x6);
+    ARDUBUS_SERIAL.println(F(""));
     */
     // This ought to work too
-    Serial.println(0x6);
+    ARDUBUS_SERIAL.println(0x6);
 }
 
 inline void ardubus_nack()
 {
-    Serial.println(0x15); // NACK
+    ARDUBUS_SERIAL.println(0x15); // NACK
 }
 
-// Utility functions for outputting fixed lenght nex encoded numbers
+// Utility functions for outputting fixed lenght nex encoded numbers (raw bytes in binary framing mode)
 inline void ardubus_print_byte_as_2hex(byte input)
 {
+#ifdef ARDUBUS_BINARY_FRAMING
+    if (ardubus_binary_mode)
+    {
+        ARDUBUS_SERIAL.write(input);
+        return;
+    }
+#endif
     if (input < 0x10)
     {
-        Serial.print(F("0"));
+        ARDUBUS_SERIAL.print(F("0"));
     }
-    Serial.print(input, HEX);
+    ARDUBUS_SERIAL.print(input, HEX);
 }
 
 inline void ardubus_print_ulong_as_8hex(unsigned long input)
@@ -171,58 +315,101 @@ void ardubus_setup()
 }
 
 
-// Call the report function on all supported submodules
+// Call the report function on the supported submodules that have their bit set in sections
 unsigned long ardubus_last_report_time;
-void ardubus_report()
+void ardubus_report(unsigned int sections)
 {
-    // Ued to make sure the device is still alive
-    Serial.println(F("PONG"));
 #ifdef ARDUBUS_DIGITAL_INPUTS
-    ardubus_digital_in_report();
+    if (sections & ARDUBUS_REPORT_DIGITAL_IN)
+    {
+        ardubus_digital_in_report();
+    }
 #endif
 #ifdef ARDUBUS_DIGITAL_OUTPUTS
-    ardubus_digital_out_report();
+    if (sections & ARDUBUS_REPORT_DIGITAL_OUT)
+    {
+        ardubus_digital_out_report();
+    }
 #endif
 #ifdef ARDUBUS_ANALOG_INPUTS
-    ardubus_analog_in_report();
+    if (sections & ARDUBUS_REPORT_ANALOG_IN)
+    {
+        ardubus_analog_in_report();
+    }
 #endif
 #ifdef ARDUBUS_PWM_OUTPUTS
-    ardubus_pwm_out_report();
+    if (sections & ARDUBUS_REPORT_PWM_OUT)
+    {
+        ardubus_pwm_out_report();
+    }
 #endif
 #ifdef ARDUBUS_SERVO_OUTPUTS
-    ardubus_servo_report();
+    if (sections & ARDUBUS_REPORT_SERVO)
+    {
+        ardubus_servo_report();
+    }
 #endif
 #ifdef ARDUBUS_PCA9635RGBJBOL_BOARDS
-    ardubus_pca9635RGBJBOL_report();
+    if (sections & ARDUBUS_REPORT_PCA9635RGBJBOL)
+    {
+        ardubus_pca9635RGBJBOL_report();
+    }
 #endif
 #ifdef ARDUBUS_SPI74XX595_REGISTER_COUNT
-    ardubus_spi74XX595_report();
+    if (sections & ARDUBUS_REPORT_SPI74XX595)
+    {
+        ardubus_spi74XX595_report();
+    }
 #endif
 #ifdef ARDUBUS_PCA9535_INPUTS
-    ardubus_pca9535_in_report();
+    if (sections & ARDUBUS_REPORT_PCA9535_IN)
+    {
+        ardubus_pca9535_in_report();
+    }
 #endif
 #ifdef ARDUBUS_PCA9535_OUTPUTS
-    ardubus_pca9535_out_report();
+    if (sections & ARDUBUS_REPORT_PCA9535_OUT)
+    {
+        ardubus_pca9535_out_report();
+    }
 #endif
 #ifdef ARDUBUS_AIRCORE_BOARDS
-    ardubus_aircore_report();
+    if (sections & ARDUBUS_REPORT_AIRCORE)
+    {
+        ardubus_aircore_report();
+    }
 #endif
 #ifdef ARDUBUS_I2CASCII_BOARDS
-    ardubus_i2cascii_report();
+    if (sections & ARDUBUS_REPORT_I2CASCII)
+    {
+        ardubus_i2cascii_report();
+    }
 #endif
 #ifdef ARDUBUS_PULSE_INPUTS
-    ardubus_pulse_in_report();
+    if (sections & ARDUBUS_REPORT_PULSE_IN)
+    {
+        ardubus_pulse_in_report();
+    }
 #endif
-    ardubus_last_report_time = millis();
 }
 
-// Check if we should send the report (called in ardubus_update)
+// Check if we should send the PONG and the periodic report (called in ardubus_update)
+unsigned long ardubus_last_pong_time;
 inline void ardubus_check_report()
 {
+    if ((millis() - ardubus_last_pong_time) > ARDUBUS_PONG_INTERVAL)
+    {
+        // Used to make sure the device is still alive
+        ARDUBUS_SERIAL.println(F("PONG"));
+        ardubus_last_pong_time = millis();
+    }
+#if ARDUBUS_REPORT_INTERVAL > 0
     if ((millis() - ardubus_last_report_time) > ARDUBUS_REPORT_INTERVAL)
     {
-        ardubus_report();
+        ardubus_report(ARDUBUS_REPORT_SECTIONS);
+        ardubus_last_report_time = millis();
     }
+#endif
 }
 
 
@@ -231,6 +418,28 @@ char ardubus_incoming_command[ARDUBUS_COMMAND_STRING_SIZE+2]; //Reserve space fo
 byte ardubus_incoming_position;
 void ardubus_process_command()
 {
+#ifdef ARDUBUS_BINARY_FRAMING
+    if (ardubus_incoming_command[0] == 0x46) // ASCII "F" (F<0|1>) binary framing off/on, the response is still sent in the old mode
+    {
+        ARDUBUS_SERIAL.print(F("F"));
+        ARDUBUS_SERIAL.print(ardubus_incoming_command[1]);
+        ardubus_ack();
+        ardubus_binary_mode = (ardubus_incoming_command[1] == 0x31);
+        ardubus_binary_skip_lf = (ardubus_binary_mode && ardubus_incoming_eol == 0xD);
+        return;
+    }
+#endif
+    if (ardubus_incoming_command[0] == 0x51) // ASCII "Q" (Q[<sections_as_4hex>]) full report now, sections default to all, the response is sent after the report
+    {
+        unsigned int sections = 0xFFFF;
+        if (ardubus_incoming_command[1] != 0x0)
+        {
+            sections = ardubus_hex2int(ardubus_incoming_command[1], ardubus_incoming_command[2], ardubus_incoming_command[3], ardubus_incoming_command[4]);
+        }
+        ardubus_report(sections);
+        ARDUBUS_SERIAL.print(F("Q"));
+        return ardubus_ack();
+    }
 #ifdef ARDUBUS_DIGITAL_INPUTS
     ardubus_digital_in_process_command(ardubus_incoming_command);
 #endif
@@ -269,9 +478,102 @@ void ardubus_process_command()
 #endif
 }
 
+#ifdef ARDUBUS_BINARY_FRAMING
+byte ardubus_incoming_frame[ARDUBUS_COMMAND_STRING_SIZE+4]; // Room for CRC and COBS overhead
+byte ardubus_incoming_frame_position;
+
+// Decode the COBS frame to the command buffer, returns the decoded length (0 on failure)
+inline byte ardubus_decode_frame()
+{
+    byte out = 0;
+    byte i = 0;
+    while (i < ardubus_incoming_frame_position)
+    {
+        byte code = ardubus_incoming_frame[i++];
+        if (code == 0x0)
+        {
+            return 0;
+        }
+        for (byte j=1; j < code; j++)
+        {
+            if (   i >= ardubus_incoming_frame_position
+                || out >= ARDUBUS_COMMAND_STRING_SIZE+2)
+            {
+                return 0;
+            }
+            ardubus_incoming_command[out++] = ardubus_incoming_frame[i++];
+        }
+        if (   code < 0xFF
+            && i < ardubus_incoming_frame_position)
+        {
+            if (out >= ARDUBUS_COMMAND_STRING_SIZE+2)
+            {
+                return 0;
+            }
+            ardubus_incoming_command[out++] = 0x0;
+        }
+    }
+    return out;
+}
+
+// Binary framing version of ardubus_read_command_bytes, frames end with null
+inline void ardubus_read_command_frames()
+{
+    for (byte d = Serial.available(); d > 0; d--)
+    {
+        byte incoming = Serial.read();
+        if (ardubus_binary_skip_lf)
+        {
+            ardubus_binary_skip_lf = false;
+            if (incoming == 0xA) // LF
+            {
+                continue;
+            }
+        }
+        if (incoming != 0x0)
+        {
+            if (ardubus_incoming_frame_position < sizeof(ardubus_incoming_frame))
+            {
+                ardubus_incoming_frame[ardubus_incoming_frame_position] = incoming;
+            }
+            if (ardubus_incoming_frame_position <= sizeof(ardubus_incoming_frame))
+            {
+                ardubus_incoming_frame_position++;
+            }
+            continue;
+        }
+        memset(&ardubus_incoming_command, 0, ARDUBUS_COMMAND_STRING_SIZE+2);
+        byte len = 0;
+        if (ardubus_incoming_frame_position <= sizeof(ardubus_incoming_frame))
+        {
+            len = ardubus_decode_frame();
+        }
+        if (   len < 2
+            || ardubus_crc8((byte*)ardubus_incoming_command, len-1) != (byte)ardubus_incoming_command[len-1])
+        {
+            ardubus_nack();
+        }
+        else
+        {
+            ardubus_incoming_command[len-1] = 0x0; // Drop the CRC
+            ardubus_process_command();
+        }
+        memset(&ardubus_incoming_command, 0, ARDUBUS_COMMAND_STRING_SIZE+2);
+        ardubus_incoming_frame_position = 0;
+        return;
+    }
+}
+#endif
+
 // Handle incoming Serial data, try to find a command in there
 inline void ardubus_read_command_bytes()
 {
+#ifdef ARDUBUS_BINARY_FRAMING
+    if (ardubus_binary_mode)
+    {
+        return ardubus_read_command_frames();
+    }
+#endif
     for (byte d = Serial.available(); d > 0; d--)
     {
         ardubus_incoming_command[ardubus_incoming_position] = Serial.read();
@@ -279,6 +581,9 @@ inline void ardubus_read_command_bytes()
         if (   ardubus_incoming_command[ardubus_incoming_position] == 0xA // LF
             || ardubus_incoming_command[ardubus_incoming_position] == 0xD) // CR
         {
+#ifdef ARDUBUS_BINARY_FRAMING
+            ardubus_incoming_eol = ardubus_incoming_command[ardubus_incoming_position];
+#endif
             ardubus_incoming_command[ardubus_incoming_position] = 0x0;
             if (   ardubus_incoming_position > 0
                 && (   ardubus_incoming_command[ardubus_incoming_position-1] == 0xD // CR
@@ -298,10 +603,10 @@ inline void ardubus_read_command_bytes()
         // Sanity check buffer sizes
         if (ardubus_incoming_position > ARDUBUS_COMMAND_STRING_SIZE+2)
         {
-            Serial.println(0x15); // NACK
-            Serial.print(F("PANIC: No end-of-line seen and ardubus_incoming_position="));
-            Serial.print(ardubus_incoming_position, DEC);
-            Serial.println(F(" clearing buffers"));
+            ARDUBUS_SERIAL.println(0x15); // NACK
+            ARDUBUS_SERIAL.print(F("PANIC: No end-of-line seen and ardubus_incoming_position="));
+            ARDUBUS_SERIAL.print(ardubus_incoming_position, DEC);
+            ARDUBUS_SERIAL.println(F(" clearing buffers"));
 
             memset(&ardubus_incoming_command, 0, ARDUBUS_COMMAND_STRING_SIZE+2);
             ardubus_incoming_position = 0;
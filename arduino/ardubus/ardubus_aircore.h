@@ -33,10 +33,10 @@ inline void ardubus_aircore_process_command(char *incoming_command)
     {
         case 0x41: // ASCII "A" (A<indexbyte><motorbyte><value>) //Note that the indexbyte is index of the aircores-array, not pin number, ledbyte is the number of the led on the board
             bool status = ardubus_aircores[incoming_command[1]-ARDUBUS_INDEX_OFFSET].write(incoming_command[2]-ARDUBUS_INDEX_OFFSET, incoming_command[3]);
-            Serial.print(F("A"));
-            Serial.print(incoming_command[1]);
-            Serial.print(incoming_command[2]);
-            Serial.print(incoming_command[3]);
+            ARDUBUS_SERIAL.print(F("A"));
+            ARDUBUS_SERIAL.print(incoming_command[1]);
+            ARDUBUS_SERIAL.print(incoming_command[2]);
+            ARDUBUS_SERIAL.print(incoming_command[3]);
             if (!status)
             {
               return ardubus_nack();
@@ -6,9 +6,17 @@
 #endif
 
 
-const byte ardubus_analog_in_pins[] = ARDUBUS_ANALOG_INPUTS; // Analog inputs, unfiltered
-int ardubus_analog_in_lastvals[sizeof(ardubus_analog_in_pins)]; // Store last value so we have at least the most rudimentary form of filtering for changes
+const byte ardubus_analog_in_pins[] = ARDUBUS_ANALOG_INPUTS; // Analog inputs
+int ardubus_analog_in_lastvals[sizeof(ardubus_analog_in_pins)]; // Last reported value, changes are compared to this
 unsigned long ardubus_analog_in_timestamps[sizeof(ardubus_analog_in_pins)]; // Store last change timestamp
+#ifdef ARDUBUS_ANALOG_IN_DEADBANDS
+// Change must be larger than this to be reported (per pin, codegenerator emits these from devices.yml)
+const int ardubus_analog_in_deadbands[sizeof(ardubus_analog_in_pins)] = ARDUBUS_ANALOG_IN_DEADBANDS;
+#endif
+#ifdef ARDUBUS_ANALOG_IN_MIN_INTERVALS
+// Milliseconds, minimum time between change reports (per pin), a change is reported once the time has passed
+const unsigned int ardubus_analog_in_min_intervals[sizeof(ardubus_analog_in_pins)] = ARDUBUS_ANALOG_IN_MIN_INTERVALS;
+#endif
 
 
 
@@ -28,15 +36,35 @@ inline void ardubus_analog_in_read_inputs()
     for (byte i=0; i < sizeof(ardubus_analog_in_pins); i++)
     {
         int tmp = analogRead(ardubus_analog_in_pins[i]);
-        if (tmp != ardubus_analog_in_lastvals[i])
+        int diff = tmp - ardubus_analog_in_lastvals[i];
+        if (diff < 0)
+        {
+            diff = -diff;
+        }
+#ifdef ARDUBUS_ANALOG_IN_DEADBANDS
+        if (diff <= ardubus_analog_in_deadbands[i])
+        {
+            continue;
+        }
+#else
+        if (diff == 0)
         {
-            ardubus_analog_in_lastvals[i] = tmp;
-            ardubus_analog_in_timestamps[i] = millis();
-            Serial.print(F("CA")); // CA<index_byte><value in hex>
-            Serial.write(i);
-            ardubus_print_int_as_4hex(ardubus_analog_in_lastvals[i]);
-            Serial.println(F(""));
+            continue;
         }
+#endif
+#ifdef ARDUBUS_ANALOG_IN_MIN_INTERVALS
+        // lastvals is not updated so the change gets reported on a later round
+        if ((millis() - ardubus_analog_in_timestamps[i]) < ardubus_analog_in_min_intervals[i])
+        {
+            continue;
+        }
+#endif
+        ardubus_analog_in_lastvals[i] = tmp;
+        ardubus_analog_in_timestamps[i] = millis();
+        ARDUBUS_SERIAL.print(F("CA")); // CA<index_byte><value in hex>
+        ARDUBUS_SERIAL.write(i);
+        ardubus_print_int_as_4hex(ardubus_analog_in_lastvals[i]);
+        ARDUBUS_SERIAL.println(F(""));
     }
     ardubus_digital_in_last_read_time = millis();
 }
@@ -53,11 +81,11 @@ inline void ardubus_analog_in_report()
 {
     for (byte i=0; i < sizeof(ardubus_analog_in_pins); i++)
     {
-        Serial.print(F("RA")); // RA<index_byte><value in hex>
-        Serial.write(i);
+        ARDUBUS_SERIAL.print(F("RA")); // RA<index_byte><value in hex>
+        ARDUBUS_SERIAL.write(i);
         ardubus_print_int_as_4hex(ardubus_analog_in_lastvals[i]);
         ardubus_print_ulong_as_8hex(millis()-ardubus_analog_in_timestamps[i]);
-        Serial.println(F(""));
+        ARDUBUS_SERIAL.println(F(""));
     }
 }
 
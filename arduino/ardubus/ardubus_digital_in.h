@@ -44,9 +44,9 @@ inline void ardubus_digital_in_update_bouncers()
         if (ardubus_digital_in_bouncers[i].update())
         {
             // State changed
-            Serial.print(F("CD")); // CD<index_byte><state_byte>
-            Serial.write(i);
-            Serial.println(ardubus_digital_in_bouncers[i].read());
+            ARDUBUS_SERIAL.print(F("CD")); // CD<index_byte><state_byte>
+            ARDUBUS_SERIAL.write(i);
+            ARDUBUS_SERIAL.println(ardubus_digital_in_bouncers[i].read());
         }
     }
     ardubus_digital_in_last_debounce_time = millis();
@@ -64,11 +64,11 @@ inline void ardubus_digital_in_report()
 {
     for (byte i=0; i < sizeof(ardubus_digital_in_pins); i++)
     {
-        Serial.print(F("RD")); // RD<index_byte><state_byte><time_long_as_hex>
-        Serial.write(i);
-        Serial.print(ardubus_digital_in_bouncers[i].read());
+        ARDUBUS_SERIAL.print(F("RD")); // RD<index_byte><state_byte><time_long_as_hex>
+        ARDUBUS_SERIAL.write(i);
+        ARDUBUS_SERIAL.print(ardubus_digital_in_bouncers[i].read());
         ardubus_print_ulong_as_8hex(ardubus_digital_in_bouncers[i].duration());
-        Serial.println(F(""));
+        ARDUBUS_SERIAL.println(F(""));
     }
 }
 
@@ -36,9 +36,9 @@ inline void ardubus_digital_out_process_command(char *incoming_command)
             {
                 digitalWrite(pin, LOW);
             }
-            Serial.print(F("D"));
-            Serial.print(incoming_command[1]);
-            Serial.print(incoming_command[2]);
+            ARDUBUS_SERIAL.print(F("D"));
+            ARDUBUS_SERIAL.print(incoming_command[1]);
+            ARDUBUS_SERIAL.print(incoming_command[2]);
             return ardubus_ack();
             break;
     }
@@ -39,9 +39,9 @@ inline void ardubus_i2cascii_process_command(char *incoming_command)
             // Write the buffer
             I2c.write(addr, 0x0, (uint8_t*)ardubus_i2cascii_buffer, (uint8_t)strlen(ardubus_i2cascii_buffer));
 
-            Serial.print(F("w"));
-            Serial.print(incoming_command[1]);
-            Serial.print(ardubus_i2cascii_buffer);
+            ARDUBUS_SERIAL.print(F("w"));
+            ARDUBUS_SERIAL.print(incoming_command[1]);
+            ARDUBUS_SERIAL.print(ardubus_i2cascii_buffer);
             return ardubus_ack();
             break;
     }
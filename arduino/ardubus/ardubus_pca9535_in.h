@@ -11,6 +11,7 @@
 #ifndef ARDUBUS_PCA9535_IN_DEBOUNCE_UPDATE_TIME
 #define ARDUBUS_PCA9535_IN_DEBOUNCE_UPDATE_TIME 5 // Milliseconds, how often to call update() on the deardubus_pca9535_in_bouncers, see Bounce library
 #endif
+// Define ARDUBUS_PCA9535_IN_BITMASK to send one CW/RW line per expander instead of one CP/RP line per pin
 
 // Enumerate the input pins from the preprocessor (from pin numbers 0 to N, will run across the ARDUBUS_PCA9535_BOARDS array [so pin 16 is portA pin 0 on index 1 of ardubus_pca9535_boards])
 const byte ardubus_pca9535_in_pins[] = ARDUBUS_PCA9535_INPUTS; 
@@ -36,17 +37,50 @@ inline void ardubus_pca9535_in_update_bouncers()
     {
         ardubus_pca9535s[i].read_data();
     }
+#ifdef ARDUBUS_PCA9535_IN_BITMASK
+    unsigned int states[sizeof(ardubus_pca9535_boards)];
+    unsigned int changed[sizeof(ardubus_pca9535_boards)];
+    memset(&states, 0, sizeof(states));
+    memset(&changed, 0, sizeof(changed));
+#endif
     // Update debouncer states
     for (byte i=0; i < sizeof(ardubus_pca9535_in_pins); i++)
     {
+#ifdef ARDUBUS_PCA9535_IN_BITMASK
+        byte board_idx = ardubus_pca9535_pin2board_idx(ardubus_pca9535_in_pins[i]);
+        unsigned int bit = 1 << (ardubus_pca9535_in_pins[i] % 16);
+        if (ardubus_pca9535_in_bouncers[i].update())
+        {
+            changed[board_idx] |= bit;
+        }
+        if (ardubus_pca9535_in_bouncers[i].read())
+        {
+            states[board_idx] |= bit;
+        }
+#else
         if (ardubus_pca9535_in_bouncers[i].update())
         {
             // State changed
-            Serial.print(F("CP")); // CD<index_byte><state_byte>
-            Serial.write(i);
-            Serial.println(ardubus_pca9535_in_bouncers[i].read());
+            ARDUBUS_SERIAL.print(F("CP")); // CD<index_byte><state_byte>
+            ARDUBUS_SERIAL.write(i);
+            ARDUBUS_SERIAL.println(ardubus_pca9535_in_bouncers[i].read());
+        }
+#endif
+    }
+#ifdef ARDUBUS_PCA9535_IN_BITMASK
+    for (byte board_idx=0; board_idx < sizeof(ardubus_pca9535_boards); board_idx++)
+    {
+        if (!changed[board_idx])
+        {
+            continue;
         }
+        ARDUBUS_SERIAL.print(F("CW")); // CW<board_index_byte><states_as_4hex><changed_bits_as_4hex>
+        ARDUBUS_SERIAL.write(board_idx);
+        ardubus_print_int_as_4hex(states[board_idx]);
+        ardubus_print_int_as_4hex(changed[board_idx]);
+        ARDUBUS_SERIAL.println(F(""));
     }
+#endif
     ardubus_pca9535_in_last_debounce_time = millis();
 }
 
@@ -58,17 +92,57 @@ inline void ardubus_pca9535_in_update()
     }
 }
 
+#ifdef ARDUBUS_PCA9535_IN_BITMASK
+// The duration is the time since the latest change of any input on the board, so a lower bound for each pin
+inline void ardubus_pca9535_in_report()
+{
+    for (byte board_idx=0; board_idx < sizeof(ardubus_pca9535_boards); board_idx++)
+    {
+        unsigned int states = 0;
+        unsigned int inputs = 0;
+        unsigned long duration = 0xFFFFFFFF;
+        for (byte i=0; i < sizeof(ardubus_pca9535_in_pins); i++)
+        {
+            if (ardubus_pca9535_pin2board_idx(ardubus_pca9535_in_pins[i]) != board_idx)
+            {
+                continue;
+            }
+            unsigned int bit = 1 << (ardubus_pca9535_in_pins[i] % 16);
+            inputs |= bit;
+            if (ardubus_pca9535_in_bouncers[i].read())
+            {
+                states |= bit;
+            }
+            if (ardubus_pca9535_in_bouncers[i].duration() < duration)
+            {
+                duration = ardubus_pca9535_in_bouncers[i].duration();
+            }
+        }
+        if (!inputs)
+        {
+            continue;
+        }
+        ARDUBUS_SERIAL.print(F("RW")); // RW<board_index_byte><states_as_4hex><input_bits_as_4hex><time_long_as_hex>
+        ARDUBUS_SERIAL.write(board_idx);
+        ardubus_print_int_as_4hex(states);
+        ardubus_print_int_as_4hex(inputs);
+        ardubus_print_ulong_as_8hex(duration);
+        ARDUBUS_SERIAL.println(F(""));
+    }
+}
+#else
 inline void ardubus_pca9535_in_report()
 {
     for (byte i=0; i < sizeof(ardubus_pca9535_in_pins); i++)
     {
-        Serial.print(F("RP")); // RD<index_byte><state_byte><time_long_as_hex>
-        Serial.write(i);
-        Serial.print(ardubus_pca9535_in_bouncers[i].read());
+        ARDUBUS_SERIAL.print(F("RP")); // RD<index_byte><state_byte><time_long_as_hex>
+        ARDUBUS_SERIAL.write(i);
+        ARDUBUS_SERIAL.print(ardubus_pca9535_in_bouncers[i].read());
         ardubus_print_ulong_as_8hex(ardubus_pca9535_in_bouncers[i].duration());
-        Serial.println(F(""));
+        ARDUBUS_SERIAL.println(F(""));
     }
 }
+#endif
 
 inline void ardubus_pca9535_in_process_command(char *incoming_command)
 {
@@ -42,9 +42,9 @@ inline void ardubus_pca9535_out_process_command(char *incoming_command)
             {
                 status = ardubus_pca9535s[ardubus_pca9535_pin2board_idx(pin)].digitalWrite((pin % 16), LOW);
             }
-            Serial.print(F("E"));
-            Serial.print(incoming_command[1]);
-            Serial.print(incoming_command[2]);
+            ARDUBUS_SERIAL.print(F("E"));
+            ARDUBUS_SERIAL.print(incoming_command[1]);
+            ARDUBUS_SERIAL.print(incoming_command[2]);
             if (!status)
             {
               return ardubus_nack();
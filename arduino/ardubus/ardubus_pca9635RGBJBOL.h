@@ -33,7 +33,7 @@ inline void ardubus_pca9635RGBJBOL_process_command(char *incoming_command)
     {
         case 0x6A: // ASCII "j" reset all PCA9635 devices
             bool status = PCA9635.reset();
-            Serial.print(F("j"));
+            ARDUBUS_SERIAL.print(F("j"));
             if (!status)
             {
               return ardubus_nack();
@@ -41,16 +41,36 @@ inline void ardubus_pca9635RGBJBOL_process_command(char *incoming_command)
             return ardubus_ack();
         case 0x4A: // ASCII "J" (J<indexbyte><ledbyte><value>) //Note that the indexbyte is index of the pca9635RGBJBOLs-array, not pin number, ledbyte is the number of the led on the board
             bool status = ardubus_pca9635RGBJBOLs[incoming_command[1]-ARDUBUS_INDEX_OFFSET].set_led_pwm(incoming_command[2]-ARDUBUS_INDEX_OFFSET, incoming_command[3]);
-            Serial.print(F("J"));
-            Serial.print(incoming_command[1]);
-            Serial.print(incoming_command[2]);
-            Serial.print(incoming_command[3]);
+            ARDUBUS_SERIAL.print(F("J"));
+            ARDUBUS_SERIAL.print(incoming_command[1]);
+            ARDUBUS_SERIAL.print(incoming_command[2]);
+            ARDUBUS_SERIAL.print(incoming_command[3]);
             if (!status)
             {
               return ardubus_nack();
             }
             return ardubus_ack();
             break;
+        case 0x4D: // ASCII "M" (M<indexbyte><ledbyte><value>[<ledbyte><value>...]) //Set many leds on the same board in one command, see "J" for the bytes
+        {
+            bool status = true;
+            // ledbytes are offset so they are never null, null means end of command
+            for (byte i=2; i < ARDUBUS_COMMAND_STRING_SIZE && incoming_command[i] != 0x0; i += 2)
+            {
+                if (!ardubus_pca9635RGBJBOLs[incoming_command[1]-ARDUBUS_INDEX_OFFSET].set_led_pwm(incoming_command[i]-ARDUBUS_INDEX_OFFSET, incoming_command[i+1]))
+                {
+                    status = false;
+                }
+            }
+            ARDUBUS_SERIAL.print(F("M"));
+            ARDUBUS_SERIAL.print(incoming_command[1]);
+            if (!status)
+            {
+              return ardubus_nack();
+            }
+            return ardubus_ack();
+        }
+            break;
     }
 }
 
@@ -66,10 +66,10 @@ inline void ardubus_pulse_in_update()
         {
             ardubus_pulse_in_calc_pulse_length(&ardubus_pulse_in_inputs[i]);
             // TODO: output value
-            Serial.print(F("CS")); // CS<index_byte><pulse_duration_in_us>
-            Serial.write(i);
+            ARDUBUS_SERIAL.print(F("CS")); // CS<index_byte><pulse_duration_in_us>
+            ARDUBUS_SERIAL.write(i);
             ardubus_print_int_as_4hex(ardubus_pulse_in_inputs[i].pulse_length);
-            Serial.println(F(""));
+            ARDUBUS_SERIAL.println(F(""));
         }
     }
 }
@@ -78,10 +78,10 @@ inline void ardubus_pulse_in_report()
 {
     for (uint8_t i=0; i < ardubus_pulse_in_inputs_len; i++)
     {
-        Serial.print(F("RS")); // RS<index_byte><position_in_us>
-        Serial.write(i);
+        ARDUBUS_SERIAL.print(F("RS")); // RS<index_byte><position_in_us>
+        ARDUBUS_SERIAL.write(i);
         ardubus_print_int_as_4hex(ardubus_pulse_in_inputs[i].pulse_length);
-        Serial.println(F(""));
+        ARDUBUS_SERIAL.println(F(""));
     }
 }
 
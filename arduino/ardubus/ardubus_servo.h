@@ -28,10 +28,10 @@ inline void ardubus_servo_report()
      * Not used yet anywhere, also: convert to output 4 hex int
     for (byte i=0; i < sizeof(ardubus_servo_output_pins); i++)
     {
-        Serial.print(F("RS")); // RS<index_byte><value in hex>
-        Serial.write(i);
+        ARDUBUS_SERIAL.print(F("RS")); // RS<index_byte><value in hex>
+        ARDUBUS_SERIAL.write(i);
         ardubus_print_byte_as_2hex(ardubus_servos[i].read());
-        Serial.println(F(""));
+        ARDUBUS_SERIAL.println(F(""));
         // TODO: Keep track of duration ??
     }
      */
@@ -43,20 +43,20 @@ inline void ardubus_servo_process_command(char *incoming_command)
     {
         case 0x53: // ASCII "S" (P<indexbyte><value>) //Note that the indexbyte is index of the servos-array, not pin number
             ardubus_servos[incoming_command[1]-ARDUBUS_INDEX_OFFSET].write(incoming_command[2]);
-            Serial.print(F("S"));
-            Serial.print(incoming_command[1]);
-            Serial.print(incoming_command[2]);
+            ARDUBUS_SERIAL.print(F("S"));
+            ARDUBUS_SERIAL.print(incoming_command[1]);
+            ARDUBUS_SERIAL.print(incoming_command[2]);
             return ardubus_ack();
             break;
         case 0x73: // ASCII "s" (P<indexbyte><int_as_hex) //Note that the indexbyte is index of the servos-array, not pin number
             int value = ardubus_hex2int(incoming_command[2], incoming_command[3], incoming_command[4], incoming_command[5]);
             ardubus_servos[incoming_command[1]-ARDUBUS_INDEX_OFFSET].write(value);
-            Serial.print(F("S"));
-            Serial.print(incoming_command[1]);
-            Serial.print(incoming_command[2]);
-            Serial.print(incoming_command[3]);
-            Serial.print(incoming_command[4]);
-            Serial.print(incoming_command[5]);
+            ARDUBUS_SERIAL.print(F("S"));
+            ARDUBUS_SERIAL.print(incoming_command[1]);
+            ARDUBUS_SERIAL.print(incoming_command[2]);
+            ARDUBUS_SERIAL.print(incoming_command[3]);
+            ARDUBUS_SERIAL.print(incoming_command[4]);
+            ARDUBUS_SERIAL.print(incoming_command[5]);
             return ardubus_ack();
             break;
     }
@@ -40,10 +40,10 @@ inline void ardubus_spi74XX595_write()
         byte reg = (ARDUBUS_SPI74XX595_REGISTER_COUNT-1)-i;
         SPI.transfer(ardubus_spi74XX595_values[reg]);
         /*
-        Serial.print(F("DEBUG: wrote ardubus_spi74XX595_values["));
-        Serial.print(reg, DEC);
-        Serial.print(F("] value B"));
-        Serial.println(ardubus_spi74XX595_values[reg], BIN);
+        ARDUBUS_SERIAL.print(F("DEBUG: wrote ardubus_spi74XX595_values["));
+        ARDUBUS_SERIAL.print(reg, DEC);
+        ARDUBUS_SERIAL.print(F("] value B"));
+        ARDUBUS_SERIAL.println(ardubus_spi74XX595_values[reg], BIN);
         */
     }
     digitalWrite(ARDUBUS_SPI74XX595_LATCHPIN, HIGH);
@@ -111,9 +111,9 @@ inline void ardubus_spi74XX595_process_command(char *incoming_command)
             // Set only the given bit in the correct register
             ardubus_spi74XX595_values[reg_index] = (ardubus_spi74XX595_values[reg_index] & mask) | bit_value;
             ardubus_spi74XX595_write();
-            Serial.print(F("B"));
-            Serial.print(incoming_command[1]);
-            Serial.print(incoming_command[2]);
+            ARDUBUS_SERIAL.print(F("B"));
+            ARDUBUS_SERIAL.print(incoming_command[1]);
+            ARDUBUS_SERIAL.print(incoming_command[2]);
             return ardubus_ack();
             break;
         }
@@ -122,10 +122,10 @@ inline void ardubus_spi74XX595_process_command(char *incoming_command)
             byte reg_index = incoming_command[1]-ARDUBUS_INDEX_OFFSET;
             ardubus_spi74XX595_values[reg_index] = ardubus_hex2byte(incoming_command[2], incoming_command[3]);
             ardubus_spi74XX595_write();
-            Serial.print(F("W"));
-            Serial.print(incoming_command[1]);
-            Serial.print(incoming_command[2]);
-            Serial.print(incoming_command[3]);
+            ARDUBUS_SERIAL.print(F("W"));
+            ARDUBUS_SERIAL.print(incoming_command[1]);
+            ARDUBUS_SERIAL.print(incoming_command[2]);
+            ARDUBUS_SERIAL.print(incoming_command[3]);
             return ardubus_ack();
             break;
         }
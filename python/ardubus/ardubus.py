@@ -9,10 +9,19 @@ import dbus
 import binascii,time
 import yaml
 import select
+import Queue
 
 # We need to offset the pin numbers to CR and LF which are control characters to us (NOTE: this *must* be same as in ardubus.h)
 # TODO: Use hex encoded values everywhere to avoid this
 PIN_OFFSET=32 
+# Flush the state_batch signal early when it gets this many states
+STATE_BATCH_MAX=1000
+# Sections whose states in a state_batch are coalesced to the latest value (for digital inputs every edge is kept)
+STATE_BATCH_COALESCED=('analog_in_pins', 'pulse_input_pins')
+# Max leds per "M" command (NOTE: ardubus.h reserves the command buffer for this many)
+JBOL_MANY_MAX_LEDS=48
+# Max queued writes the writer thread joins into one serial write
+WRITE_MAX_JOINED=100
 
 class ardubus(dbushelpers.service.baseclass):
     def __init__(self, config, launcher_instance, **kwargs):
@@ -20,6 +29,9 @@ class ardubus(dbushelpers.service.baseclass):
         self.object_name = kwargs['device_name']
         self.serial_device = kwargs['serial_device']
         self.serial_speed = kwargs['serial_speed']
+        self.pending_states = [] # (section, index, value, time) waiting for the state_batch signal
+        self.pending_coalesced = {} # (section, index): position in pending_states
+        self.pending_states_started = None
         self.config_reloaded() # Triggers all config normalizations and mapping rebuilds
         self.last_response_time = None
         self.print_debug = False
@@ -27,14 +39,82 @@ class ardubus(dbushelpers.service.baseclass):
         self.initialize_serial()
         print "Board initialized as %s:%s with config %s" % (self.dbus_interface_name, self.dbus_object_path, repr(self.config))
 
+    def check_serial_writer(self):
+        """Raises if the writer thread has stopped on an error, the commands would just pile up in the queue"""
+        if self.writer_error is not None:
+            raise IOError("Serial writer of %s stopped: %s" % (self.object_name, self.writer_error))
+
     def send_serial_command(self, command):
-        command = command + "\n"
-        for c in command:
-            self.serial_port.write(c)
-        self.serial_port.flush()
+        """Queues the command for the writer thread, returns right away"""
+        self.check_serial_writer()
+        self.write_queue.put(command + "\n")
         # TODO Check for the ACK from board somehow (not exactly trivial when another thread is constantly reading the port for reports [though now the sketch acknowledges the command it parses in full so we could look into the history])
-        #print 'DEBUG: sent command %s' % repr(command)
+        #print 'DEBUG: queued command %s' % repr(command)
+        return True
+
+    def send_serial_commands(self, commands):
+        """Queues many commands to go out with one write"""
+        if not commands:
+            return True
+        self.check_serial_writer()
+        self.write_queue.put("".join([ command + "\n" for command in commands ]))
         return True
+
+    def serial_writer(self):
+        """Joins whatever commands are queued into one write, a None in the queue stops the thread"""
+        try:
+            while True:
+                chunks = [ self.write_queue.get() ]
+                try:
+                    while len(chunks) < WRITE_MAX_JOINED:
+                        chunks.append(self.write_queue.get_nowait())
+                except Queue.Empty:
+                    pass
+                stop = None in chunks
+                if stop:
+                    chunks = chunks[:chunks.index(None)]
+                if chunks:
+                    started = time.time()
+                    self.serial_port.write("".join(chunks))
+                    self.serial_port.flush()
+                    blocked = time.time() - started
+                    self.write_time_total += blocked
+                    self.write_time_max = max(self.write_time_max, blocked)
+                    self.write_count += 1
+                if stop:
+                    return
+        except Exception, e:
+            # SerialException, IOError or whatever, send_serial_command raises from now on
+            print "serial_writer: Got exception %s, stopping" % e
+            self.writer_error = repr(e)
+
+    def get_write_properties(self):
+        """The writer properties as dbus types"""
+        return {
+            'write_queue_depth': dbus.UInt32(self.write_queue.qsize()),
+            'write_count': dbus.UInt32(self.write_count),
+            'write_time_total': dbus.Double(self.write_time_total),
+            'write_time_max': dbus.Double(self.write_time_max),
+            'write_error': dbus.String(self.writer_error or ''),
+        }
+
+    @dbus.service.method(dbus.PROPERTIES_IFACE, in_signature='ss', out_signature='v')
+    def Get(self, interface_name, property_name):
+        """Standard properties interface, see GetAll for the properties"""
+        return self.GetAll(interface_name)[property_name]
+
+    @dbus.service.method(dbus.PROPERTIES_IFACE, in_signature='s', out_signature='a{sv}')
+    def GetAll(self, interface_name):
+        """Writer statistics: commands waiting in the queue, writes done, the seconds they blocked (total and max) and the error that stopped the writer"""
+        if interface_name != 'fi.hacklab.ardubus':
+            raise dbus.exceptions.DBusException('Unknown interface %s' % interface_name, name='org.freedesktop.DBus.Error.UnknownInterface')
+        return self.get_write_properties()
+
+    def safe_value(self, value):
+        """Offset values that map to CR or LF by one"""
+        if value in [ 13, 10]:
+            value += 1
+        return value
         
     def p2b(self, pin):
         """Convert pin number integer to a byte to be sent to the sketch"""
@@ -78,13 +158,13 @@ class ardubus(dbushelpers.service.baseclass):
         pass
 
     def rebuild_alias_maps(self):
-        # Config key to method mapping
+        # Config key to command encoder mapping
         supports_aliased_output = {
-            'digital_out_pins': self.set_dio,
-            'servo_pins': self.set_servo,
-            'digital_pwmout_pins': self.set_pwm,
+            'digital_out_pins': self.dio_command,
+            'servo_pins': self.servo_command,
+            'digital_pwmout_pins': self.pwm_command,
         }
-        # In the format of aliases['alias'] = (index, method)
+        # In the format of aliases['alias'] = (index, encoder)
         self.aliases = {}
         for section in supports_aliased_output.keys():
             if not self.config.has_key(section):
@@ -103,13 +183,25 @@ class ardubus(dbushelpers.service.baseclass):
     def set_alias(self, alias, value):
         """Aliased output, supports only the simple ones where one value is enough"""
         idx = self.aliases[alias][0]
-        callback = self.aliases[alias][1]
-        callback(idx, value)
+        encoder = self.aliases[alias][1]
+        self.send_serial_command(encoder(idx, value))
+
+    @dbus.service.method('fi.hacklab.ardubus', in_signature='a{sn}')
+    def set_aliases(self, values):
+        """Many aliased outputs (alias: value) in one write, nothing is sent if any of the aliases is unknown"""
+        commands = []
+        for alias, value in values.items():
+            idx, encoder = self.aliases[alias]
+            commands.append(encoder(idx, value))
+        self.send_serial_commands(commands)
 
     def config_reloaded(self):
         """Recalculates all config mappings etc"""
         self.normalize_config()
         self.rebuild_alias_maps()
+        # Opt-in state_batch signal, the reader flushes whatever is pending if this goes to 0
+        self.state_batch_window = float(self.config.get('state_batch_ms', 0)) / 1000
+        self.state_batch_only = bool(self.config.get('state_batch_only', False))
 
     @dbus.service.method('fi.hacklab.ardubus')
     def get_config(self):
@@ -122,6 +214,9 @@ class ardubus(dbushelpers.service.baseclass):
     def stop_serial(self):
         self.serial_alive = False
         self.receiver_thread.join()
+        # Whatever is queued before this still gets written
+        self.write_queue.put(None)
+        self.writer_thread.join()
         self.serial_port.close()
 
     @dbus.service.method('fi.hacklab.ardubus')
@@ -134,11 +229,17 @@ class ardubus(dbushelpers.service.baseclass):
     def hello(self):
         return "Hello,World! My name is " + self.object_name
 
+    def pwm_command(self, pwm_index, cycle):
+        return "P%s%s" % (self.p2b(pwm_index), chr(self.safe_value(cycle)))
+
     @dbus.service.method('fi.hacklab.ardubus', in_signature='yy') # "y" is the signature for a byte
     def set_pwm(self, pwm_index, cycle):
-        if cycle in [ 13, 10]: #Offset values that map to CR or LF by one
-            cycle += 1
-        self.send_serial_command("P%s%s" % (self.p2b(pwm_index), chr(cycle)))
+        self.send_serial_command(self.pwm_command(pwm_index, cycle))
+
+    @dbus.service.method('fi.hacklab.ardubus', in_signature='ay')
+    def set_pwm_array(self, cycles):
+        """Sets the PWM outputs from index 0 onwards in one write"""
+        self.send_serial_commands([ self.pwm_command(pwm_index, cycles[pwm_index]) for pwm_index in range(len(cycles)) ])
 
     @dbus.service.method('fi.hacklab.ardubus', in_signature='yyy') # "y" is the signature for a byte
     def set_aircore_position(self, board_index, motorno, cycle):
@@ -156,25 +257,38 @@ class ardubus(dbushelpers.service.baseclass):
             cycle += 1
         self.send_serial_command("A%s%s%s" % (self.p2b(board_index), self.p2b(motorno), chr(cycle)))
 
-    @dbus.service.method('fi.hacklab.ardubus', in_signature='yyy') # "y" is the signature for a byte
-    def set_jbol_pwm(self, jbol_index, ledno, cycle):
+    def jbol_ledno(self, jbol_index, ledno):
+        """Maps the led number via pca9635RGBJBOL_maps, unmapped leds are used as is"""
         try:
             ledno = self.config['pca9635RGBJBOL_maps'][int(jbol_index)][int(ledno)]
-        except Exception,e:
-            print "set_jbol_pwm: got exception %s" % e
-            pass
-            
-        if cycle in [ 13, 10]: #Offset values that map to CR or LF by one
-            cycle += 1
-        self.send_serial_command("J%s%s%s" % (self.p2b(jbol_index), self.p2b(ledno), chr(cycle)))
+        except (KeyError, IndexError, TypeError):
+            return ledno
+        if type(ledno) == dict:
+            ledno = ledno['pin']
+        return ledno
 
-    @dbus.service.method('fi.hacklab.ardubus', in_signature='yy') # "y" is the signature for a byte
-    def set_servo(self, servo_index, value):
+    @dbus.service.method('fi.hacklab.ardubus', in_signature='yyy') # "y" is the signature for a byte
+    def set_jbol_pwm(self, jbol_index, ledno, cycle):
+        ledno = self.jbol_ledno(jbol_index, ledno)
+        self.send_serial_command("J%s%s%s" % (self.p2b(jbol_index), self.p2b(ledno), chr(self.safe_value(cycle))))
+
+    @dbus.service.method('fi.hacklab.ardubus', in_signature='yay')
+    def set_jbol_frame(self, jbol_index, cycles):
+        """Sets the leds of a JBOL board from led 0 onwards, with "M" commands in one write"""
+        pairs = [ self.p2b(self.jbol_ledno(jbol_index, ledno)) + chr(self.safe_value(cycles[ledno])) for ledno in range(len(cycles)) ]
+        commands = []
+        for start in range(0, len(pairs), JBOL_MANY_MAX_LEDS):
+            commands.append("M%s%s" % (self.p2b(jbol_index), "".join(pairs[start:start + JBOL_MANY_MAX_LEDS])))
+        self.send_serial_commands(commands)
+
+    def servo_command(self, servo_index, value):
         if value > 180:
             value = 180 # Servo library accepts values from 0 to 180 (degrees)
-        if value in [ 13, 10]: #Offset values that map to CR or LF by one
-            value += 1
-        self.send_serial_command("S%s%s" % (self.p2b(servo_index), chr(value)))
+        return "S%s%s" % (self.p2b(servo_index), chr(self.safe_value(value)))
+
+    @dbus.service.method('fi.hacklab.ardubus', in_signature='yy') # "y" is the signature for a byte
+    def set_servo(self, servo_index, value):
+        self.send_serial_command(self.servo_command(servo_index, value))
 
     @dbus.service.method('fi.hacklab.ardubus', in_signature='yn') # "y" is the signature for a byte, n is 16bit signed integer
     def set_servo_us(self, servo_index, value):
@@ -192,12 +306,14 @@ class ardubus(dbushelpers.service.baseclass):
     def set_595byte(self, reg_index, state):
         self.send_serial_command("W%s%s" % (self.p2b(reg_index), binascii.hexlify(str(state)).upper()))
 
+    def dio_command(self, digital_index, state):
+        if state:
+            return "D%s1" % self.p2b(digital_index)
+        return "D%s0" % self.p2b(digital_index)
+
     @dbus.service.method('fi.hacklab.ardubus', in_signature='yb') # "y" is the signature for a byte
     def set_dio(self, digital_index, state):
-        if state:
-            self.send_serial_command("D%s1" % self.p2b(digital_index))
-        else:
-            self.send_serial_command("D%s0" % self.p2b(digital_index))
+        self.send_serial_command(self.dio_command(digital_index, state))
 
     @dbus.service.method('fi.hacklab.ardubus', in_signature='yb') # "y" is the signature for a byte
     def set_pca9535_bit(self, digital_index, state):
@@ -280,6 +396,56 @@ class ardubus(dbushelpers.service.baseclass):
         #print "SIGNALLING: servo-pin(index) %d changed to %d on %s" % (p_index, value, sender)
         pass
 
+    @dbus.service.signal('fi.hacklab.ardubus', signature='a(syiu)s')
+    def state_batch(self, states, sender):
+        """The input states received in the last state_batch_ms, (section, index, value, ms the value has been held)"""
+        #print "SIGNALLING: %d states on %s" % (len(states), sender)
+        pass
+
+    def batch_state(self, section, p_index, value, time_ms):
+        """Adds the state to the next state_batch signal if batching is enabled, returns True if the per message signals are not wanted"""
+        if not self.state_batch_window:
+            return False
+        if not self.pending_states:
+            self.pending_states_started = time.time()
+        state = (section, p_index, int(value), time_ms)
+        if section in STATE_BATCH_COALESCED:
+            key = (section, p_index)
+            if self.pending_coalesced.has_key(key):
+                # Newer value replaces the pending one in place
+                self.pending_states[self.pending_coalesced[key]] = state
+                return self.state_batch_only
+            self.pending_coalesced[key] = len(self.pending_states)
+        self.pending_states.append(state)
+        if len(self.pending_states) >= STATE_BATCH_MAX:
+            self.flush_state_batch()
+        return self.state_batch_only
+
+    def flush_state_batch(self):
+        """Emits the pending states as one state_batch signal"""
+        if not self.pending_states:
+            return
+        states = self.pending_states
+        self.pending_states = []
+        self.pending_coalesced = {}
+        self.pending_states_started = None
+        self.state_batch(states, self.object_name)
+
+    def check_state_batch(self):
+        """Flushes the pending states if the window has passed, returns seconds until it does (None if nothing is pending)"""
+        if not self.pending_states:
+            return None
+        remaining = self.pending_states_started + self.state_batch_window - time.time()
+        if remaining <= 0 or not self.state_batch_window:
+            self.flush_state_batch()
+            return None
+        return remaining
+
+
+    @dbus.service.method('fi.hacklab.ardubus')
+    def request_report(self):
+        """Ask the board for a full report now, comes as the usual *_report signals"""
+        self.send_serial_command("Q")
 
     @dbus.service.method('fi.hacklab.ardubus')
     def reset(self):
@@ -290,46 +456,71 @@ class ardubus(dbushelpers.service.baseclass):
     def initialize_serial(self):
         import threading, serial
         print "initialize_serial called"
-        self.input_buffer = ""
-        self.serial_port = serial.Serial(self.serial_device, self.serial_speed, xonxoff=False, timeout=0.00001)
+        self.input_buffer = bytearray()
+        # Non-blocking, the reader only reads what select says is there
+        self.serial_port = serial.Serial(self.serial_device, self.serial_speed, xonxoff=False, timeout=0)
+        self.write_queue = Queue.Queue()
+        self.write_count = 0
+        self.write_time_total = 0.0 # Seconds the writes have blocked the writer thread
+        self.write_time_max = 0.0
+        self.writer_error = None
         self.receiver_thread = threading.Thread(target=self.serial_reader)
         self.receiver_thread.setDaemon(1)
         self.receiver_thread.start()
-        print "%s serial thread started" % self.dbus_object_path
+        self.writer_thread = threading.Thread(target=self.serial_writer)
+        self.writer_thread.setDaemon(1)
+        self.writer_thread.start()
+        print "%s serial threads started" % self.dbus_object_path
 
 
     def message_received(self, input_buffer):
         #print "message_received called with buffer %s" % repr(input_buffer)
         self.last_response_time = time.time()
         try:
-            if (   len(self.input_buffer) >= 4
-                and self.input_buffer[:4] == 'PONG'):
+            if (   len(input_buffer) >= 4
+                and input_buffer[:4] == 'PONG'):
                 return
-            if (self.input_buffer[:2] == 'CD'):
+            if (input_buffer[:2] == 'CD'):
                 # State change
-                self.dio_change(ord(input_buffer[2]), bool(int(input_buffer[3])), self.object_name)
+                p_index, state = ord(input_buffer[2]), bool(int(input_buffer[3]))
+                if not self.batch_state('digital_in_pins', p_index, state, 0):
+                    self.dio_change(p_index, state, self.object_name)
                 return
-            if (self.input_buffer[:2] == 'CP'):
+            if (input_buffer[:2] == 'CP'):
                 # State change
-                self.pca9535_change(ord(input_buffer[2]), bool(int(input_buffer[3])), self.object_name)
+                p_index, state = ord(input_buffer[2]), bool(int(input_buffer[3]))
+                if not self.batch_state('pca9535_inputs', p_index, state, 0):
+                    self.pca9535_change(p_index, state, self.object_name)
                 return
-            if (self.input_buffer[:2] == 'RD'):
-                self.dio_report(ord(input_buffer[2]), bool(int(input_buffer[3])), int(input_buffer[4:12], 16), self.object_name)
+            if (input_buffer[:2] == 'RD'):
+                p_index, state, time_ms = ord(input_buffer[2]), bool(int(input_buffer[3])), int(input_buffer[4:12], 16)
+                if not self.batch_state('digital_in_pins', p_index, state, time_ms):
+                    self.dio_report(p_index, state, time_ms, self.object_name)
                 pass
-            if (self.input_buffer[:2] == 'RP'):
-                self.pca9535_report(ord(input_buffer[2]), bool(int(input_buffer[3])), int(input_buffer[4:12], 16), self.object_name)
+            if (input_buffer[:2] == 'RP'):
+                p_index, state, time_ms = ord(input_buffer[2]), bool(int(input_buffer[3])), int(input_buffer[4:12], 16)
+                if not self.batch_state('pca9535_inputs', p_index, state, time_ms):
+                    self.pca9535_report(p_index, state, time_ms, self.object_name)
                 pass
-            if (self.input_buffer[:2] == 'CA'):
-                self.aio_change(ord(input_buffer[2]), int(input_buffer[3:7], 16), self.object_name)
+            if (input_buffer[:2] == 'CA'):
+                p_index, value = ord(input_buffer[2]), int(input_buffer[3:7], 16)
+                if not self.batch_state('analog_in_pins', p_index, value, 0):
+                    self.aio_change(p_index, value, self.object_name)
                 pass
-            if (self.input_buffer[:2] == 'CS'):
-                self.pulsein_change(ord(input_buffer[2]), int(input_buffer[3:7], 16), self.object_name)
+            if (input_buffer[:2] == 'CS'):
+                p_index, value = ord(input_buffer[2]), int(input_buffer[3:7], 16)
+                if not self.batch_state('pulse_input_pins', p_index, value, 0):
+                    self.pulsein_change(p_index, value, self.object_name)
                 pass
-            if (self.input_buffer[:2] == 'RS'):
-                self.pulsein_report(ord(input_buffer[2]), int(input_buffer[3:7], 16), self.object_name)
+            if (input_buffer[:2] == 'RS'):
+                p_index, value = ord(input_buffer[2]), int(input_buffer[3:7], 16)
+                if not self.batch_state('pulse_input_pins', p_index, value, 0):
+                    self.pulsein_report(p_index, value, self.object_name)
                 pass
-            if (self.input_buffer[:2] == 'RA'):
-                self.aio_report(ord(input_buffer[2]), int(input_buffer[3:7], 16), int(input_buffer[6:15], 16), self.object_name)
+            if (input_buffer[:2] == 'RA'):
+                p_index, value, time_ms = ord(input_buffer[2]), int(input_buffer[3:7], 16), int(input_buffer[7:15], 16)
+                if not self.batch_state('analog_in_pins', p_index, value, time_ms):
+                    self.aio_report(p_index, value, time_ms, self.object_name)
                 pass
         except Exception,e:
             print "message_received: Got exception %s" % e
@@ -337,8 +528,25 @@ class ardubus(dbushelpers.service.baseclass):
             pass
 
 
+    def input_received(self, data):
+        """Adds the data to the input buffer and passes each complete CRLF terminated message to message_received"""
+        self.input_buffer += data
+        start = 0
+        while True:
+            # TODO: make the linebreak configurable
+            end = self.input_buffer.find("\r\n", start)
+            if end < 0:
+                break
+            # Trim prefix NULLs and linebreaks
+            message = bytes(self.input_buffer[start:end]).lstrip(chr(0x0) + "\r\n")
+            start = end + 2
+            if message:
+                self.message_received(message)
+        if start:
+            # Keep only the incomplete message
+            del self.input_buffer[:start]
+
     def serial_reader(self):
-        import string,binascii
         import serial # We need the exceptions from here
         self.serial_alive = True
         try:
@@ -350,34 +558,20 @@ class ardubus(dbushelpers.service.baseclass):
                         self.serial_alive = False
                         continue
                         # TODO: Raise a specific error ??
-                rd, wd, ed  = select.select([ self.serial_port, ], [], [ self.serial_port, ], 5) # Wait up to 5s for new data
-                if not self.serial_port.inWaiting():
-                    # Don't try to read if there is no data, instead sleep (yield) a bit
-                    time.sleep(0)
+                timeout = self.check_state_batch()
+                if timeout is None:
+                    timeout = 5 # Wait up to 5s for new data
+                rd, wd, ed  = select.select([ self.serial_port, ], [], [ self.serial_port, ], timeout)
+                if not rd and not ed:
                     continue
-                data = self.serial_port.read(1)
+                # Everything that is there in one read, a hung up port raises SerialException here
+                data = self.serial_port.read(self.serial_port.inWaiting() or 1)
                 if len(data) == 0:
                     continue
                 if self.print_debug:
-                    # hex-encode unprintable characters
-                    #if data not in string.letters.join(string.digits).join(string.punctuation).join("\r\n"):
-                    #    sys.stdout.write("\\0x".join(binascii.hexlify(data)))
-                    # OTOH repr was better afterall
-                    if data not in "\r\n":
-                        sys.stdout.write(repr(data))
-                    else:
-                        sys.stdout.write(data)
-                # Put the data into inpit buffer and check for CRLF
-                self.input_buffer += data
-                # TODO: make the linebreak configurable
-                # Trim prefix NULLs and linebreaks
-                self.input_buffer = self.input_buffer.lstrip(chr(0x0) + "\r\n")
-                #print "input_buffer=%s" % repr(self.input_buffer)
-                if (    len(self.input_buffer) > 1
-                    and self.input_buffer[-2:] == "\r\n"):
-                    # Got a message, parse it (sans the CRLF) and empty the buffer
-                    self.message_received(self.input_buffer[:-2])
-                    self.input_buffer = ""
+                    # repr hex-encodes the unprintable characters, keep the linebreaks readable though
+                    sys.stdout.write(repr(data)[1:-1].replace("\\r\\n", "\r\n"))
+                self.input_received(data)
 
         except (IOError, serial.SerialException), e:
             print "Got exception %s" % e
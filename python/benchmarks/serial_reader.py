@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""CPU time of the service serial reader, the old byte at a time loop vs the chunked one, per 10k messages"""
+import errno
+import fcntl
+import os
+import select
+import struct
+import sys
+import termios
+import threading
+import time
+
+from ardubus.ardubus import ardubus
+
+WRITE_CHUNK = 4096  # bytes, the feeder writes the stream to the pipe in these
+
+
+class PipePort(object):
+    """Enough of a non-blocking pyserial port for serial_reader, the recorded stream comes from a pipe"""
+    def __init__(self, fd):
+        self.fd = fd
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def fileno(self):
+        return self.fd
+
+    def inWaiting(self):
+        return struct.unpack('I', fcntl.ioctl(self.fd, termios.FIONREAD, '\0\0\0\0'))[0]
+
+    def read(self, size=1):
+        try:
+            return os.read(self.fd, size)
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+            return ''
+
+
+class BenchmarkBoard(ardubus):
+    """The reader parts of the service without D-Bus, counts the messages instead of parsing them"""
+    def __init__(self, port, expected):
+        self.serial_port = port
+        self.expected = expected
+        self.received = 0
+        self.input_buffer = bytearray()
+        self.last_response_time = None
+        self.print_debug = False
+        self.dead_board_timeout = 15
+        # state_batch off, like a config without state_batch_ms
+        self.pending_states = []
+        self.pending_coalesced = {}
+        self.pending_states_started = None
+        self.state_batch_window = 0
+        self.state_batch_only = False
+
+    def message_received(self, input_buffer):
+        self.received += 1
+        if self.received >= self.expected:
+            self.serial_alive = False
+
+
+def old_serial_reader(self):
+    """The reader loop before the chunked reads, for comparison"""
+    self.input_buffer = ""
+    self.serial_alive = True
+    while self.serial_alive:
+        rd, wd, ed  = select.select([ self.serial_port, ], [], [ self.serial_port, ], 5)
+        if not self.serial_port.inWaiting():
+            time.sleep(0)
+            continue
+        data = self.serial_port.read(1)
+        if len(data) == 0:
+            continue
+        self.input_buffer += data
+        self.input_buffer = self.input_buffer.lstrip(chr(0x0) + "\r\n")
+        if (    len(self.input_buffer) > 1
+            and self.input_buffer[-2:] == "\r\n"):
+            self.message_received(self.input_buffer[:-2])
+            self.input_buffer = ""
+
+
+def synthetic_stream(count):
+    """Change and report messages like a busy board sends, count messages"""
+    messages = []
+    for num in range(count):
+        kind = num % 5
+        if kind == 0:
+            messages.append('CD%s%d' % (chr(num % 48), num % 2))
+        elif kind == 1:
+            messages.append('CA%s%04X' % (chr(num % 8), num % 1024))
+        elif kind == 2:
+            messages.append('RD%s%d%08X' % (chr(num % 48), num % 2, num))
+        elif kind == 3:
+            messages.append('RA%s%04X%08X' % (chr(num % 8), num % 1024, num))
+        else:
+            messages.append('PONG')
+    return '\r\n'.join(messages) + '\r\n'
+
+
+def count_messages(stream):
+    """How many messages the readers should find"""
+    return len([line for line in stream.split('\r\n') if line.lstrip(chr(0x0) + '\r\n')])
+
+
+def feed(write_fd, stream):
+    """Write the stream to the pipe and close it"""
+    for start in range(0, len(stream), WRITE_CHUNK):
+        os.write(write_fd, stream[start:start + WRITE_CHUNK])
+    os.close(write_fd)
+
+
+def cpu_per_10k(reader, stream, expected):
+    """Returns (CPU seconds per 10k messages, wall seconds, messages received)"""
+    read_fd, write_fd = os.pipe()
+    board = BenchmarkBoard(PipePort(read_fd), expected)
+    feeder = threading.Thread(target=feed, args=(write_fd, stream))
+    feeder.setDaemon(1)
+    started_cpu = sum(os.times()[:2])
+    started = time.time()
+    feeder.start()
+    reader(board)
+    elapsed = time.time() - started
+    cpu = sum(os.times()[:2]) - started_cpu
+    feeder.join()
+    os.close(read_fd)
+    return cpu * 10000.0 / max(board.received, 1), elapsed, board.received
+
+
+def main(stream_path=None, count=100000):
+    """Run the benchmark, print results"""
+    if stream_path:
+        with open(stream_path, 'rb') as fileobj:
+            stream = fileobj.read()
+    else:
+        stream = synthetic_stream(count)
+    expected = count_messages(stream)
+    print('{} bytes, {} messages'.format(len(stream), expected))
+    for name, reader in (('old', old_serial_reader), ('chunked', ardubus.serial_reader)):
+        cpu, elapsed, received = cpu_per_10k(reader, stream, expected)
+        print('{:>8}: {:.3f} CPU seconds per 10k messages, {} messages in {:.2f}s'.format(name, cpu, received, elapsed))
+    return 0
+
+
+def usage():
+    """Show usage"""
+    print("""Usage:
+
+    python serial_reader.py [raw_stream_file | message_count]
+
+raw_stream_file is the bytes the board sent, for example recorded with: cat /dev/ttyUSB0 > stream.bin
+""")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        usage()
+        sys.exit(1)
+    if len(sys.argv) > 1 and not sys.argv[1].isdigit():
+        sys.exit(main(sys.argv[1]))
+    COUNT = 100000
+    if len(sys.argv) > 1:
+        COUNT = int(sys.argv[1])
+    sys.exit(main(count=COUNT))
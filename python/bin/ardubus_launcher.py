@@ -82,50 +82,73 @@ class my_launcher(launcher.baseclass):
         self.device_objects[device_name] = ardubus(self.devices_config[device_name], self, device_name=device_name, dbus_object_path=self.dbus_object_path.replace('/launcher', "/%s" % device_name), serial_device=serial_device, serial_speed=self.config['speed'], dbus_interface_name="fi.hacklab.ardubus.%s" % device_name)
         return True
 
-    def test_port(self, serial_device):
-        """Tests a given device for a board and if found will spin off a service object for it"""
+    def probe_port(self, serial_device):
+        """Resets the board in the given device and returns the name it identifies with (or None), safe to run in a thread"""
         try:
-            port = serial.Serial(serial_device, self.config['speed'], xonxoff=False, timeout=0.01)
-            # PONDER: are these the right way around...
-            port.setDTR(False) # Reset the arduino by driving DTR for a moment (RS323 signals are active-low)
-            time.sleep(0.050)
-            port.setDTR(True)
-            in_buffer = ""
-            started = time.time()
-            while True:
-                data = port.read(1)
-                in_buffer += data
-                match = self.board_ident_regex.search(in_buffer)
-                if not match:
-                    # Timeout, abort
-                    if ((time.time() - started) > self.board_ident_timeout):
-                        print "Could not find board in %s in %d seconds" % (serial_device, self.board_ident_timeout)
-                        print "buffer: %s" % repr(in_buffer)
-                        port.close()
-                        return False
-                    # Otherwise go back to reading data
-                    continue
-                # Got a match, continue by setting up a new service object
+            port = serial.Serial(serial_device, self.config['speed'], xonxoff=False, timeout=0.05)
+            try:
+                # PONDER: are these the right way around...
+                try:
+                    port.setDTR(False) # Reset the arduino by driving DTR for a moment (RS323 signals are active-low)
+                    time.sleep(0.050)
+                    port.setDTR(True)
+                except (IOError, OSError):
+                    # No modem lines (pty, like the board emulator uses), opening the port was the reset
+                    pass
+                in_buffer = ""
+                started = time.time()
+                while ((time.time() - started) <= self.board_ident_timeout):
+                    # Wait for the first byte (up to the port timeout) and take whatever else came with it
+                    data = port.read(1)
+                    if len(data) == 0:
+                        continue
+                    in_buffer += data + port.read(port.inWaiting())
+                    match = self.board_ident_regex.search(in_buffer)
+                    if match:
+                        print "Found board %s in %s in %f seconds" % (match.group(1), serial_device, time.time() - started)
+                        return match.group(1)
+                print "Could not find board in %s in %d seconds" % (serial_device, self.board_ident_timeout)
+                print "buffer: %s" % repr(in_buffer)
+                return None
+            finally:
                 port.close() # Free the port
-                device_name = match.group(1)
-                if (self.start_board(serial_device, device_name)):
-                    print "Found board %s in %f seconds" % (device_name, time.time() - started)
-                    return True
-                #otherwise init failed
-                return False
-        except serial.SerialException, e:
+        except (IOError, serial.SerialException), e:
             # Problem with port
             print "Got an exception from port %s: %s" % (serial_device, repr(e))
+            return None
+
+    def test_port(self, serial_device):
+        """Tests a given device for a board and if found will spin off a service object for it"""
+        device_name = self.probe_port(serial_device)
+        if not device_name:
             return False
-        # Something weird happened, we should not drop this far
-        print False
+        return self.start_board(serial_device, device_name)
 
     @dbus.service.method(my_signature + '.launcher')
     def scan(self):
-        """Scans the configured serial devices for boards"""
+        """Scans the configured serial devices for boards, all ports are probed at the same time"""
+        import threading, Queue
+        comports = []
         for filespec in self.config['search_ports']:
             for comport in glob.glob(filespec):
-                self.test_port(comport)
+                if comport not in comports:
+                    comports.append(comport)
+        results = Queue.Queue()
+        def probe(comport):
+            device_name = None
+            try:
+                device_name = self.probe_port(comport)
+            finally:
+                results.put((comport, device_name))
+        for comport in comports:
+            thread = threading.Thread(target=probe, args=(comport, ))
+            thread.setDaemon(1)
+            thread.start()
+        # The service objects are created here in the calling (main loop) thread as the probes finish
+        for i in range(len(comports)):
+            comport, device_name = results.get()
+            if device_name:
+                self.start_board(comport, device_name)
 
     @dbus.service.method(my_signature + '.launcher')
     def rescan(self):
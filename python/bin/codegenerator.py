@@ -3,6 +3,21 @@ from __future__ import with_statement
 import sys,os
 import yaml
 
+# devices.yml sections that can be listed in report_sections, see ARDUBUS_REPORT_SECTIONS in ardubus.h
+REPORT_SECTION_DEFINES = {
+    'digital_in_pins': 'ARDUBUS_REPORT_DIGITAL_IN',
+    'digital_out_pins': 'ARDUBUS_REPORT_DIGITAL_OUT',
+    'analog_in_pins': 'ARDUBUS_REPORT_ANALOG_IN',
+    'digital_pwmout_pins': 'ARDUBUS_REPORT_PWM_OUT',
+    'servo_pins': 'ARDUBUS_REPORT_SERVO',
+    'pca9635RGBJBOL_boards': 'ARDUBUS_REPORT_PCA9635RGBJBOL',
+    'spi74XX595': 'ARDUBUS_REPORT_SPI74XX595',
+    'pca9535_inputs': 'ARDUBUS_REPORT_PCA9535_IN',
+    'pca9535_outputs': 'ARDUBUS_REPORT_PCA9535_OUT',
+    'aircore_boards': 'ARDUBUS_REPORT_AIRCORE',
+    'i2cascii_boards': 'ARDUBUS_REPORT_I2CASCII',
+    'pulse_input_pins': 'ARDUBUS_REPORT_PULSE_IN',
+}
 
 
 class codegen:
@@ -21,6 +36,16 @@ class codegen:
                 ret.append(info)
         return ret
 
+    def parse_pin_options(self, numbers_and_aliases, key, default):
+        ret = []
+        for info in numbers_and_aliases:
+            # Plain pin numbers get the default
+            if type(info) == dict:
+                ret.append(int(info.get(key, default)))
+            else:
+                ret.append(default)
+        return ret
+
     def prepare_sketch_file(self):
         self.sketch_dir = os.path.join(os.path.dirname(os.path.realpath(device_config_file)), 'generated', self.name)
         if not os.path.exists(self.sketch_dir):
@@ -75,6 +100,16 @@ class codegen:
             ret = self.add_bounce_include(ret)
             ret += """#define ARDUBUS_DIGITAL_INPUTS { %s }\n""" % ", ".join(map(str, self.parse_pin_numbers(self.config['digital_in_pins'])))
 
+        if self.config.has_key('analog_in_pins'):
+            ret += """#define ARDUBUS_ANALOG_INPUTS { %s }\n""" % ", ".join(map(str, self.parse_pin_numbers(self.config['analog_in_pins'])))
+            # Change reporting filters, see ardubus_analog_in.h
+            deadbands = self.parse_pin_options(self.config['analog_in_pins'], 'deadband', 0)
+            if any(deadbands):
+                ret += """#define ARDUBUS_ANALOG_IN_DEADBANDS { %s }\n""" % ", ".join(map(str, deadbands))
+            min_intervals = self.parse_pin_options(self.config['analog_in_pins'], 'min_interval_ms', 0)
+            if any(min_intervals):
+                ret += """#define ARDUBUS_ANALOG_IN_MIN_INTERVALS { %s }\n""" % ", ".join(map(str, min_intervals))
+
         if self.config.has_key('digital_out_pins'):
             ret += """#define ARDUBUS_DIGITAL_OUTPUTS { %s }\n""" % ", ".join(map(str, self.parse_pin_numbers(self.config['digital_out_pins'])))
 
@@ -102,6 +137,9 @@ class codegen:
                 ret += """#define PCA9535_ENABLE_BOUNCE\n""" # This we might want to leave out to conserve memory...
                 ret += """#define PCA9535_BOUNCE_OPTIMIZEDREADS\n"""
                 ret += """#define ARDUBUS_PCA9535_INPUTS { %s }\n""" % ", ".join(map(str, self.parse_pin_numbers(self.config['pca9535_inputs'])))
+                if self.config.get('pca9535_bitmask'):
+                    # One CW/RW line per board instead of CP/RP per pin, only python3-ardubus decodes these
+                    ret += """#define ARDUBUS_PCA9535_IN_BITMASK\n"""
 
             if self.config.has_key('pca9535_outputs'):
                 ret += """#define ARDUBUS_PCA9535_OUTPUTS { %s }\n""" % ", ".join(map(str, self.parse_pin_numbers(self.config['pca9535_outputs'])))
@@ -123,6 +161,8 @@ class codegen:
 // Get this from https://github.com/rambo/pca9635RGBJBOL
 #include <pca9635RGBJBOL.h>\n"""
             ret += """#define ARDUBUS_PCA9635RGBJBOL_BOARDS { %s }\n""" % ", ".join(map(str, self.config['pca9635RGBJBOL_boards']))
+            # Make room for the "M" command that sets all 48 leds of a board at once
+            ret += """#define ARDUBUS_COMMAND_STRING_SIZE %d\n""" % (2 + 48*2 + 2)
 
         if self.config.has_key('aircore_boards'):
             self.setup_i2c_init = True
@@ -137,6 +177,25 @@ class codegen:
             ret += """#define ARDUBUS_I2CASCII_BUFFER_SIZE %d\n""" % (max([ int(x['chars']) for x in self.config['i2cascii_boards'] ])+1)
 
 
+        # Periodic full report, the host can always ask for one with the "Q" command
+        if self.config.has_key('report_interval_ms'):
+            ret += """#define ARDUBUS_REPORT_INTERVAL %d\n""" % int(self.config['report_interval_ms'])
+
+        if self.config.has_key('report_sections'):
+            defines = []
+            for section in self.config['report_sections']:
+                if not REPORT_SECTION_DEFINES.has_key(section):
+                    print "WARNING: %s has unknown report section %s, ignoring" % (self.name, section)
+                    continue
+                defines.append(REPORT_SECTION_DEFINES[section])
+            if not defines:
+                defines = [ '0' ]
+            ret += """#define ARDUBUS_REPORT_SECTIONS (%s)\n""" % " | ".join(defines)
+
+        if self.config.get('binary_framing'):
+            # Host can switch the board to COBS+CRC8 framed mode with the "F1" command
+            ret += """#define ARDUBUS_BINARY_FRAMING\n"""
+
         ret += """\n// Get this from https://github.com/rambo/arDuBUS
 #include <ardubus.h>
 void setup()
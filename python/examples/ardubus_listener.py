@@ -20,6 +20,8 @@ class ardubus_listener():
         self.bus.add_signal_receiver(self.analog_report, dbus_interface = "fi.hacklab.ardubus", signal_name = "aio_report")
         self.bus.add_signal_receiver(self.alias_changed, dbus_interface = "fi.hacklab.ardubus", signal_name = "alias_change")
         self.bus.add_signal_receiver(self.alias_report, dbus_interface = "fi.hacklab.ardubus", signal_name = "alias_report")
+        # Boards with state_batch_ms in devices.yml also send all the states of the window in one signal
+        self.bus.add_signal_receiver(self.state_batch, dbus_interface = "fi.hacklab.ardubus", signal_name = "state_batch")
 
     def signal_received(self, *args, **kwargs):
         print "Got args: %s" % repr(args)
@@ -54,6 +56,11 @@ class ardubus_listener():
         #print "Pin '%s' has been %d for %dms on %s" % (alias, value, time, sender)
         pass
 
+    def state_batch(self, states, sender):
+        for section, p_index, value, time in states:
+            #print "%s(index) %d has been %d for %dms on %s" % (section, p_index, value, time, sender)
+            pass
+
 
 if __name__ == '__main__':
     dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
@@ -0,0 +1,83 @@
+"""Capture format for the packets going to and coming from a board, see SerialTransport capture option
+
+File layout (little endian): header <6s magic><uint16 version><float64 time.time() at start>, then for each
+packet <uint64 microseconds since start><uint8 flags><uint16 length><packet>. Packets are stored without
+the CRLF / COBS framing, the flags tell the direction and whether binary framing was in use."""
+import logging
+import struct
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+CAPTURE_MAGIC = b'ARDCAP'
+CAPTURE_VERSION = 1
+CAPTURE_HEADER = struct.Struct('<6sHd')
+CAPTURE_RECORD = struct.Struct('<QBH')
+CAPTURE_FROM_DEVICE = 0x0
+CAPTURE_TO_DEVICE = 0x1
+CAPTURE_BINARY_FRAMING = 0x2
+
+
+class CaptureWriter:
+    """Appends packets to a capture file, safe to call from the reader thread and the event loop"""
+    fileobj = None
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.fileobj = open(path, 'wb')
+        self.fileobj.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, time.time()))
+        self.packet_count = 0
+
+    def __str__(self):
+        return '<{}(path={}, packets={})>'.format(self.__class__.__name__, self.path, self.packet_count)
+
+    def __repr__(self):
+        return str(self)
+
+    def write(self, flags, packet):
+        """Write one packet record"""
+        record = CAPTURE_RECORD.pack(int((time.monotonic() - self.started) * 1000000), flags, len(packet))
+        with self.lock:
+            if self.fileobj is None:
+                return
+            self.fileobj.write(record)
+            self.fileobj.write(packet)
+            self.packet_count += 1
+
+    def close(self):
+        """Flush and close the file"""
+        with self.lock:
+            if self.fileobj is None:
+                return
+            self.fileobj.close()
+            self.fileobj = None
+
+
+def is_capture(path):
+    """Does the file start with the capture header"""
+    with open(path, 'rb') as fileobj:
+        return fileobj.read(len(CAPTURE_MAGIC)) == CAPTURE_MAGIC
+
+
+def read_capture(path):
+    """Returns (time.time() at start, [(seconds since start, flags, packet), ...])"""
+    with open(path, 'rb') as fileobj:
+        data = fileobj.read()
+    magic, version, started = CAPTURE_HEADER.unpack_from(data, 0)
+    if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+        raise ValueError('{} is not a version {} capture'.format(path, CAPTURE_VERSION))
+    records = []
+    offset = CAPTURE_HEADER.size
+    unpack_from = CAPTURE_RECORD.unpack_from
+    while offset + CAPTURE_RECORD.size <= len(data):
+        micros, flags, length = unpack_from(data, offset)
+        offset += CAPTURE_RECORD.size
+        if offset + length > len(data):
+            LOGGER.warning('{} ends with a truncated packet'.format(path))
+            break
+        records.append((micros / 1000000, flags, data[offset:offset + length]))
+        offset += length
+    return started, records
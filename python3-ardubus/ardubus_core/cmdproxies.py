@@ -5,6 +5,7 @@ import logging
 # NOTE: this *must* be same as in ardubus.h
 # TODO: Use hex encoded values everywhere to avoid this
 IDX_OFFSET = 32
+JBOL_MANY_MAX_LEDS = 48  # 3 pcs of 16ch drivers per board, ardubus.h reserves command buffer for this many
 LOGGER = logging.getLogger(__name__)
 
 
@@ -13,8 +14,10 @@ def idx2byte(idx):
     return bytes([idx + IDX_OFFSET])
 
 
-def value2safebyte(value):
-    """Take boolean or integer value, convert to byte making sure it's not too large or reserved control char"""
+def value2safebyte(value, exact=False):
+    """Take boolean or integer value, convert to byte making sure it's not too large or reserved control char
+
+    With exact=True (binary framing) the control chars are not a problem and are passed as-is"""
     if isinstance(value, bool):
         if value:
             return b'1'
@@ -23,7 +26,7 @@ def value2safebyte(value):
         raise RuntimeError('Input must be int or bool')
     if value > 255:
         raise RuntimeError('Input is too large')
-    if value in [13, 10]:
+    if value in [13, 10] and not exact:
         value += 1
     return bytes([value])
 
@@ -32,6 +35,7 @@ class BaseProxy:
     """Baseclass for the object proxies"""
     alias = None
     transport = None
+    _target_len = 2  # command char + index byte
 
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
@@ -42,16 +46,27 @@ class BaseProxy:
     def __repr__(self):
         return str(self)
 
-    async def set_value(self, value):
-        """In most cases simple value is enough, needs transport set"""
+    @property
+    def exact_values(self):
+        """In binary framing mode values can be sent without dodging the line ending chars"""
+        return bool(self.transport and self.transport.binary_framing)
+
+    async def set_value(self, value, force=False):
+        """In most cases simple value is enough, needs transport set
+
+        Writing the value the output already has is skipped unless force is set"""
         if not self.transport:
             raise RuntimeError('Transport must be set to use this method')
-        return await self.transport.send_command(self.encode_value(value))
+        return await self.transport.set_output(self, value, force)
 
     def encode_value(self, value):
         """In most cases simple value is enough, returns the encoded command for transport"""
         raise NotImplementedError('Must be overridden')
 
+    def target_key(self, command):
+        """The output the encoded command targets (command char + index bytes), used for coalescing writes"""
+        return command[0:self._target_len]
+
 
 class SimpleProxy(BaseProxy):
     """For very simple cases"""
@@ -61,7 +76,7 @@ class SimpleProxy(BaseProxy):
     def encode_value(self, value):
         if self._command_char is None:
             raise RuntimeError('command_char must be defines')
-        return self._command_char + idx2byte(self.idx) + value2safebyte(value)
+        return self._command_char + idx2byte(self.idx) + value2safebyte(value, self.exact_values)
 
 
 class PWMProxy(SimpleProxy):
@@ -79,17 +94,19 @@ class AirCoreProxy(BaseProxy):
     board_idx = 0
     motorno = 0
     value_correction = 0
+    _target_len = 3
 
     def encode_value(self, value):
         """the value is the aircore position"""
         value = (value + self.value_correction) % 255
-        return b'A' + idx2byte(self.board_idx) + idx2byte(self.motorno) + value2safebyte(value)
+        return b'A' + idx2byte(self.board_idx) + idx2byte(self.motorno) + value2safebyte(value, self.exact_values)
 
 
 class JBOLLedProxy(BaseProxy):
     """Proxy for LEDs controlled with JBOL boards"""
     board_idx = 0
     ledno = 0
+    _target_len = 3
 
     async def reset(self):
         """Reset all PCA9635 devices on the bus"""
@@ -99,7 +116,15 @@ class JBOLLedProxy(BaseProxy):
 
     def encode_value(self, value):
         """the value is the LED PWM"""
-        return b'J' + idx2byte(self.board_idx) + idx2byte(self.ledno) + value2safebyte(value)
+        return b'J' + idx2byte(self.board_idx) + idx2byte(self.ledno) + value2safebyte(value, self.exact_values)
+
+
+def encode_jbol_many(board_idx, led_values, exact=False):
+    """Encode the "M" command that sets many LEDs on one JBOL board, led_values is list of (ledno, value) tuples"""
+    if len(led_values) > JBOL_MANY_MAX_LEDS:
+        raise RuntimeError('Max {} LEDs per command'.format(JBOL_MANY_MAX_LEDS))
+    return b'M' + idx2byte(board_idx) + b''.join(idx2byte(ledno) + value2safebyte(value, exact)
+                                                 for ledno, value in led_values)
 
 
 class SPI595Proxy(BaseProxy):
@@ -171,4 +196,8 @@ class ServoProxy(BaseProxy):
         if value > 180:
             LOGGER.warning('Degrees value is over 180, limiting')
             value = 180
-        return b'S' + idx2byte(self.idx) + value2safebyte(value)
+        return b'S' + idx2byte(self.idx) + value2safebyte(value, self.exact_values)
+
+    def target_key(self, command):
+        """Degrees and usec commands move the same servo"""
+        return b'S' + command[1:self._target_len]
@@ -14,8 +14,10 @@ SECTION_CMDPROXY_MAP = {
     'digital_pwmout_pins': PWMProxy,
 }
 
+# Aliases of all of these go to the same ALIAS_MAP, a duplicate is logged as error and the first one is kept
 GENERIC_ALIAS_SUPPORTED_KEYS = (
     'digital_in_pins',
+    'analog_in_pins',
     'digital_out_pins',
     'pca9535_inputs',
     'pca9535_outputs',
@@ -24,6 +26,17 @@ GENERIC_ALIAS_SUPPORTED_KEYS = (
     'digital_pwmout_pins',
 )
 
+# Device config key for the (alias, pin) tuples indexed by section and index, see build_lookup_tables
+LOOKUP_KEY = 'LOOKUP'
+# Device config key for the (deadband, min_interval_ms) tuples of analog_in_pins, see normalize_analog_in_pins
+ANALOG_IN_FILTERS_KEY = 'ANALOG_IN_FILTERS'
+ANALOG_IN_FILTER_DEFAULTS = (
+    ('deadband', 0),
+    ('min_interval_ms', 0),
+)
+# Device config key for the {board_idx: ((bit, idx), ...)} tables of pca9535_inputs, see build_pca9535_bit_tables
+PCA9535_BITS_KEY = 'PCA9535_BITS'
+
 
 FULL_CONFIG_MAP = {}
 ALIAS_MAP = {}
@@ -79,6 +92,72 @@ def normalize_generic_aliases(devicename, transport=None):
                 item['PROXY'] = klass(idx=idx, transport=transport, alias=item['alias'])
 
 
+def indexed_items(section):
+    """(index, item) pairs of a config section, like BaseEvent.resolve_alias list sections are indexed by
+    position and dict sections by key"""
+    if isinstance(section, dict):
+        return section.items()
+    return enumerate(section)
+
+
+def indexed_table(section, function):
+    """function(item) for each item of the section, indexed the same way (tuple for lists, dict for dicts)"""
+    if isinstance(section, dict):
+        return {key: function(item) for key, item in section.items()}
+    return tuple(function(item) for item in section)
+
+
+def build_lookup_tables(devicename):
+    """Build flat {section_key: ((alias, pin), ...)} lookups for the generic sections so events need no config walking
+
+    Called by normalize_device_config so reloads rebuild these too"""
+    global FULL_CONFIG_MAP, GENERIC_ALIAS_SUPPORTED_KEYS
+    config = FULL_CONFIG_MAP[devicename]
+    lookups = {}
+    for section_key in GENERIC_ALIAS_SUPPORTED_KEYS:
+        if section_key not in config:
+            continue
+        lookups[section_key] = indexed_table(config[section_key], lambda item: (item['alias'], item.get('pin')))
+    config[LOOKUP_KEY] = lookups
+
+
+def normalize_analog_in_pins(devicename):
+    """Set defaults for the change report filter options and build the filter table indexed like the reports"""
+    global FULL_CONFIG_MAP, ANALOG_IN_FILTER_DEFAULTS
+    config = FULL_CONFIG_MAP[devicename]
+    if 'analog_in_pins' not in config:
+        return
+    section = config['analog_in_pins']
+    for _, item in indexed_items(section):
+        for key, default in ANALOG_IN_FILTER_DEFAULTS:
+            try:
+                item[key] = int(item.get(key, default))
+                if item[key] < 0:
+                    raise ValueError('Negative value')
+            except (TypeError, ValueError):
+                LOGGER.error('Invalid {} "{}" for {}:analog_in_pins:{}'.format(
+                    key, item[key], devicename, item['pin']))
+                item[key] = default
+    config[ANALOG_IN_FILTERS_KEY] = indexed_table(section, lambda item: (item['deadband'], item['min_interval_ms']))
+
+
+def build_pca9535_bit_tables(devicename):
+    """Map the bits of the CW/RW bitmask reports to pca9535_inputs indices, pin N is bit N % 16 of board N // 16"""
+    global FULL_CONFIG_MAP
+    config = FULL_CONFIG_MAP[devicename]
+    if 'pca9535_inputs' not in config:
+        return
+    tables = {}
+    for idx, item in indexed_items(config['pca9535_inputs']):
+        try:
+            pin = int(item['pin'])
+        except (TypeError, ValueError):
+            LOGGER.error('Invalid pin "{}" for {}:pca9535_inputs:{}'.format(item['pin'], devicename, idx))
+            continue
+        tables.setdefault(pin // 16, []).append((pin % 16, idx))
+    config[PCA9535_BITS_KEY] = {board_idx: tuple(bits) for board_idx, bits in tables.items()}
+
+
 def normalize_pca9635rgbjbol_boards(devicename, transport=None):  # pylint: disable=R0912
     """Normalize the led remapping with aliases and create command proxies for them"""
     global FULL_CONFIG_MAP
@@ -201,6 +280,9 @@ def normalize_device_config(devicename, transport=None):
     global FULL_CONFIG_MAP, ALIAS_MAP
     ALIAS_MAP[devicename] = {}
     normalize_generic_aliases(devicename, transport)
+    build_lookup_tables(devicename)
+    normalize_analog_in_pins(devicename)
+    build_pca9535_bit_tables(devicename)
     normalize_pca9635rgbjbol_boards(devicename, transport)
     normalize_i2cascii_boards(devicename, transport)
     normalize_aircore_boards(devicename, transport)
@@ -0,0 +1,667 @@
+"""Pure Python stand-in for a board running the arDuBUS sketch, for load testing without hardware
+
+BoardEmulator follows the sketch generated from a devices.yml entry: banner on reset, same command parser
+(echo + ACK/NACK, silence for commands of modules the board does not have, PANIC on overflow), random
+CD/CA/CP (or CW) changes at a configurable rate, PONG and the periodic R* report. The servers expose it
+as a pty (optionally behind a stable symlink) or a TCP port for pyserial socket:// URLs so transport.get,
+DeviceManager and the legacy launcher attach to it like to a real board:
+
+    emulator = BoardEmulator('rod_control_panel', deviceconfig.FULL_CONFIG_MAP['rod_control_panel'], change_rate=50)
+    server = PtyEmulatorServer(emulator, link='/tmp/ttyEMU0')
+    server.start()
+    tr = transport.get('/tmp/ttyEMU0', deviceconfig.FULL_CONFIG_MAP['rod_control_panel'])
+
+Or from the command line: python3 -m ardubus_core.emulator devices.yml rod_control_panel /tmp/ttyEMU0
+"""
+import logging
+import os
+import random
+import select
+import socket
+import sys
+import threading
+import time
+import tty
+
+import yaml
+
+from .errors import InvalidPacketError
+from .framing import decode_frame, encode_frame
+from .reports import ALL_REPORT_SECTIONS, REPORT_SECTION_BITS
+
+LOGGER = logging.getLogger(__name__)
+
+INDEX_OFFSET = 32  # ARDUBUS_INDEX_OFFSET
+ACK = b'6'  # println(0x6)
+NACK = b'21'  # println(0x15)
+COMMAND_STRING_SIZE = 10  # ARDUBUS_COMMAND_STRING_SIZE
+COMMAND_STRING_SIZE_PCA9635 = 100  # With pca9635RGBJBOL boards there's room for the "M" command
+PONG_INTERVAL = 5.0  # seconds, ARDUBUS_PONG_INTERVAL
+DEFAULT_REPORT_INTERVAL_MS = 5000  # ARDUBUS_REPORT_INTERVAL
+BOOT_DELAY = 0.1  # seconds from connect to the banner, also lets the opener finish configuring the port
+TICK_INTERVAL = 0.001  # seconds, how often the servers generate input changes and reports
+MAX_CHANGES_PER_TICK = 1000  # Cap for the changes generated at once if the server thread has been starved
+ANALOG_MAX = 1023
+ANALOG_STEP_MAX = 32  # Random walk step on top of the deadband
+PULSE_LENGTH = 1500  # us, what the emulated pulse inputs report
+
+
+def section_items(config, section_key):
+    """Items of a devices.yml section, the list or dict values"""
+    section = config.get(section_key) or []
+    if isinstance(section, dict):
+        return list(section.values())
+    return list(section)
+
+
+def item_option(item, key, default):
+    """Per pin option of a devices.yml item that may be just the pin number"""
+    if isinstance(item, dict):
+        return int(item.get(key, default))
+    return default
+
+
+class BoardEmulator:  # pylint: disable=R0902
+    """The sketch logic without any IO, the servers pass bytes in and out
+
+    connected() resets the board and returns the banner, feed() returns the responses to the incoming bytes
+    and tick() returns the input changes, PONG and reports that are due. Call them from one thread only."""
+    change_rate = 10.0  # input changes per second, spread over all the emulated inputs
+    pong_interval = PONG_INTERVAL
+    seed = None
+
+    def __init__(self, device_name, device_config, **kwargs):
+        for key in ('change_rate', 'pong_interval', 'seed'):
+            if key in kwargs:
+                setattr(self, key, kwargs.pop(key))
+        if kwargs:
+            raise TypeError('Unknown keyword arguments {}'.format(', '.join(kwargs.keys())))
+        self.device_name = device_name
+        self.config = device_config
+        self.random = random.Random(self.seed)
+        self.digital_in_count = len(section_items(device_config, 'digital_in_pins'))
+        analog_items = section_items(device_config, 'analog_in_pins')
+        self.analog_in_count = len(analog_items)
+        self.analog_in_filters = [(item_option(item, 'deadband', 0), item_option(item, 'min_interval_ms', 0))
+                                  for item in analog_items]
+        self.pca9535_in_pins = []
+        # Like in the generated sketch the pca9535 sections do nothing without the boards
+        if 'pca9535_boards' in device_config:
+            self.pca9535_in_pins = [item_option(item, 'pin', item)
+                                    for item in section_items(device_config, 'pca9535_inputs')]
+        self.pca9535_bitmask = bool(device_config.get('pca9535_bitmask'))
+        self.pulse_in_count = len(section_items(device_config, 'pulse_input_pins'))
+        self.report_interval = int(device_config.get('report_interval_ms', DEFAULT_REPORT_INTERVAL_MS)) / 1000
+        self.report_sections = ALL_REPORT_SECTIONS
+        if 'report_sections' in device_config:
+            self.report_sections = 0
+            for section_key in device_config['report_sections']:
+                self.report_sections |= REPORT_SECTION_BITS[section_key]
+        self.binary_framing_supported = bool(device_config.get('binary_framing'))
+        self.command_string_size = COMMAND_STRING_SIZE
+        if 'pca9635RGBJBOL_boards' in device_config:
+            self.command_string_size = COMMAND_STRING_SIZE_PCA9635
+        self.command_handlers = {}
+        self.outputs = {}  # section_key: {idx: last value written}
+        self.setup_command_handlers()
+        self.input_choices = [choice for choice, count in ((self.change_digital_in, self.digital_in_count),
+                                                           (self.change_analog_in, self.analog_in_count),
+                                                           (self.change_pca9535_in, len(self.pca9535_in_pins)))
+                              if count]
+        self.in_buffer = bytearray()
+        self.binary_mode = False
+        self.reset()
+
+    def __str__(self):
+        return '<{}(name={})>'.format(self.__class__.__name__, self.device_name)
+
+    def __repr__(self):
+        return str(self)
+
+    def setup_command_handlers(self):
+        """Map command chars to the handlers of the modules this board has"""
+        modules = (
+            ('digital_out_pins', (b'D', self.command_state)),
+            ('digital_pwmout_pins', (b'P', self.command_value)),
+            ('servo_pins', (b'S', self.command_value), (b's', self.command_servo_hex)),
+            ('pca9635RGBJBOL_boards', (b'j', self.command_pca9635_reset), (b'J', self.command_led),
+             (b'M', self.command_leds)),
+            ('spi74XX595', (b'B', self.command_state), (b'W', self.command_register)),
+            ('pca9535_outputs', (b'E', self.command_state)),
+            ('aircore_boards', (b'A', self.command_led)),
+            ('i2cascii_boards', (b'w', self.command_i2cascii)),
+        )
+        for section_key, *handlers in modules:
+            if section_key not in self.config:
+                continue
+            if section_key == 'pca9535_outputs' and 'pca9535_boards' not in self.config:
+                continue
+            self.outputs[section_key] = {}
+            for command_char, handler in handlers:
+                self.command_handlers[command_char] = (section_key, handler)
+
+    def reset(self, now=None):
+        """Power on state"""
+        if now is None:
+            now = time.monotonic()
+        self.in_buffer.clear()
+        self.binary_mode = False
+        self.incoming_eol = None
+        self.skip_lf = False
+        # Pull-ups, open inputs read high
+        self.digital_in = [(1, now) for _ in range(self.digital_in_count)]
+        self.analog_in = [(self.random.randint(0, ANALOG_MAX), now) for _ in range(self.analog_in_count)]
+        self.pca9535_in = [(1, now) for _ in self.pca9535_in_pins]
+        for values in self.outputs.values():
+            values.clear()
+        self.last_pong = now
+        self.last_report = now
+        self.last_change = now
+        self.change_carry = 0.0
+
+    def connected(self, now=None):
+        """The host opened the port (which resets a real board), returns the banner"""
+        self.reset(now)
+        name = self.device_name.encode('ascii')
+        return b'\r\nBoard: ' + name + b' initializing\r\nBoard: ' + name + b' ready\r\n'
+
+    def message(self, payload):
+        """Terminate like println does in the current mode"""
+        if self.binary_mode:
+            return encode_frame(payload)
+        return payload + b'\r\n'
+
+    def feed(self, data, now=None):
+        """Bytes from the host, returns the bytes the board responds with"""
+        if now is None:
+            now = time.monotonic()
+        out = bytearray()
+        for byte in data:
+            if self.binary_mode:
+                self.feed_frame_byte(byte, out, now)
+            else:
+                self.feed_ascii_byte(byte, out, now)
+        return bytes(out)
+
+    def feed_ascii_byte(self, byte, out, now):
+        """Same rules as ardubus_read_command_bytes"""
+        if byte in (0xA, 0xD):
+            self.incoming_eol = byte
+            out += self.process_command(bytes(self.in_buffer), now)
+            self.in_buffer.clear()
+            return
+        self.in_buffer.append(byte)
+        if len(self.in_buffer) > self.command_string_size + 2:
+            out += self.message(NACK)
+            out += self.message('PANIC: No end-of-line seen and ardubus_incoming_position={} clearing buffers'.format(
+                len(self.in_buffer)).encode('ascii'))
+            self.in_buffer.clear()
+
+    def feed_frame_byte(self, byte, out, now):
+        """Same rules as ardubus_read_command_frames, NACK for frames that do not decode"""
+        if self.skip_lf:
+            self.skip_lf = False
+            if byte == 0xA:
+                return
+        if byte:
+            self.in_buffer.append(byte)
+            return
+        frame = bytes(self.in_buffer)
+        self.in_buffer.clear()
+        try:
+            command = decode_frame(frame)
+        except InvalidPacketError:
+            out += self.message(NACK)
+            return
+        if len(command) > self.command_string_size + 1:
+            out += self.message(NACK)
+            return
+        out += self.process_command(command, now)
+
+    def process_command(self, command, now):
+        """Returns the response to one command, empty for commands the board does not know"""
+        if not command:
+            return b''
+        command_char = command[:1]
+        # Unset bytes read as null like in the zeroed command buffer
+        command = command + bytes(6)
+        if command_char == b'F' and self.binary_framing_supported:
+            response = self.message(b'F' + command[1:2] + ACK)
+            self.binary_mode = command[1:2] == b'1'
+            self.skip_lf = self.binary_mode and self.incoming_eol == 0xD
+            return response
+        if command_char == b'Q':
+            sections = ALL_REPORT_SECTIONS
+            if command[1]:
+                try:
+                    sections = int(command[1:5], 16)
+                except ValueError:
+                    sections = 0
+            return self.report(sections, now) + self.message(b'Q' + ACK)
+        if command_char not in self.command_handlers:
+            return b''
+        section_key, handler = self.command_handlers[command_char]
+        echo, status = handler(section_key, command)
+        return self.message(echo + (ACK if status else NACK))
+
+    def check_index(self, section_key, idx):
+        """Is the index valid for the section, the real board does not check so this only warns"""
+        if 0 <= idx < len(section_items(self.config, section_key)):
+            return True
+        LOGGER.warning('{} got index {} for {} which has {} items'.format(
+            self, idx, section_key, len(section_items(self.config, section_key))))
+        return False
+
+    def command_state(self, section_key, command):
+        """D/B/E<idx><0|1>"""
+        idx = command[1] - INDEX_OFFSET
+        self.check_index(section_key, idx)
+        self.outputs[section_key][idx] = command[2] == ord(b'1')
+        return command[0:3], True
+
+    def command_value(self, section_key, command):
+        """P/S<idx><value byte>"""
+        idx = command[1] - INDEX_OFFSET
+        self.check_index(section_key, idx)
+        self.outputs[section_key][idx] = command[2]
+        return command[0:3], True
+
+    def command_servo_hex(self, section_key, command):
+        """s<idx><4 hex value>, echoed as S"""
+        idx = command[1] - INDEX_OFFSET
+        self.check_index(section_key, idx)
+        try:
+            self.outputs[section_key][idx] = int(command[2:6], 16)
+        except ValueError:
+            self.outputs[section_key][idx] = 0
+        return b'S' + command[1:6], True
+
+    def command_register(self, section_key, command):
+        """W<register idx><2 hex value>"""
+        try:
+            self.outputs[section_key][command[1] - INDEX_OFFSET] = int(command[2:4], 16)
+        except ValueError:
+            self.outputs[section_key][command[1] - INDEX_OFFSET] = 0
+        return command[0:4], True
+
+    def command_pca9635_reset(self, section_key, command):
+        """j, resets all the leds"""
+        self.outputs[section_key].clear()
+        return command[0:1], True
+
+    def command_led(self, section_key, command):
+        """J/A<board idx><led idx><value byte>, NACK for boards that do not exist (the I2C write would fail)"""
+        idx = command[1] - INDEX_OFFSET
+        status = self.check_index(section_key, idx)
+        if status:
+            self.outputs[section_key][(idx, command[2] - INDEX_OFFSET)] = command[3]
+        return command[0:4], status
+
+    def command_leds(self, section_key, command):
+        """M<board idx><led idx><value byte>[<led idx><value byte>...]"""
+        idx = command[1] - INDEX_OFFSET
+        status = self.check_index(section_key, idx)
+        # The led bytes are offset so a null one ends the command, values can be anything
+        pos = 2
+        while pos < self.command_string_size and command[pos]:
+            if status:
+                self.outputs[section_key][(idx, command[pos] - INDEX_OFFSET)] = command[pos + 1]
+            pos += 2
+        return command[0:2], status
+
+    def command_i2cascii(self, section_key, command):
+        """w<board idx><ascii>"""
+        idx = command[1] - INDEX_OFFSET
+        chars = 0
+        if self.check_index(section_key, idx):
+            chars = int(section_items(self.config, section_key)[idx]['chars'])
+        text = command[2:].split(b'\x00', 1)[0][:chars]
+        self.outputs[section_key][idx] = text
+        return b'w' + command[1:2] + text, True
+
+    def int_as_4hex(self, value):
+        """ardubus_print_int_as_4hex"""
+        if self.binary_mode:
+            return value.to_bytes(2, 'big')
+        return '{:04X}'.format(value).encode('ascii')
+
+    def ulong_as_8hex(self, value):
+        """ardubus_print_ulong_as_8hex"""
+        if self.binary_mode:
+            return value.to_bytes(4, 'big')
+        return '{:08X}'.format(value).encode('ascii')
+
+    @staticmethod
+    def duration_ms(changed, now):
+        """Milliseconds since the change, wraps like millis()"""
+        return int((now - changed) * 1000) & 0xFFFFFFFF
+
+    def pca9535_words(self):
+        """{board idx: (state bits, input bits, time.monotonic() of the latest change)} of the pca9535 inputs"""
+        words = {}
+        for pin, (state, changed) in zip(self.pca9535_in_pins, self.pca9535_in):
+            bits, inputs, latest = words.get(pin // 16, (0, 0, changed))
+            bit = 1 << (pin % 16)
+            words[pin // 16] = (bits | (bit if state else 0), inputs | bit, max(latest, changed))
+        return words
+
+    def report(self, sections, now):
+        """ardubus_report, only the input modules report anything"""
+        out = bytearray()
+        if sections & REPORT_SECTION_BITS['digital_in_pins']:
+            for idx, (state, changed) in enumerate(self.digital_in):
+                out += self.message(b'RD' + bytes((idx, ord(b'0') + state)) + self.ulong_as_8hex(
+                    self.duration_ms(changed, now)))
+        if sections & REPORT_SECTION_BITS['analog_in_pins']:
+            for idx, (value, changed) in enumerate(self.analog_in):
+                out += self.message(b'RA' + bytes((idx,)) + self.int_as_4hex(value) + self.ulong_as_8hex(
+                    self.duration_ms(changed, now)))
+        if sections & REPORT_SECTION_BITS['pca9535_inputs']:
+            if self.pca9535_bitmask:
+                for board_idx, (bits, inputs, changed) in sorted(self.pca9535_words().items()):
+                    out += self.message(b'RW' + bytes((board_idx,)) + self.int_as_4hex(bits) + self.int_as_4hex(
+                        inputs) + self.ulong_as_8hex(self.duration_ms(changed, now)))
+            else:
+                for idx, (state, changed) in enumerate(self.pca9535_in):
+                    out += self.message(b'RP' + bytes((idx, ord(b'0') + state)) + self.ulong_as_8hex(
+                        self.duration_ms(changed, now)))
+        if sections & REPORT_SECTION_BITS['pulse_input_pins']:
+            for idx in range(self.pulse_in_count):
+                out += self.message(b'RS' + bytes((idx,)) + self.int_as_4hex(PULSE_LENGTH))
+        return bytes(out)
+
+    def change_digital_in(self, now):
+        """Toggle a random digital input"""
+        idx = self.random.randrange(self.digital_in_count)
+        state = 1 - self.digital_in[idx][0]
+        self.digital_in[idx] = (state, now)
+        return self.message(b'CD' + bytes((idx, ord(b'0') + state)))
+
+    def change_analog_in(self, now):
+        """Random walk step on a random analog input, respecting its deadband and rate limit"""
+        idx = self.random.randrange(self.analog_in_count)
+        value, changed = self.analog_in[idx]
+        deadband, min_interval_ms = self.analog_in_filters[idx]
+        if (now - changed) * 1000 < min_interval_ms:
+            return b''
+        step = deadband + self.random.randint(1, ANALOG_STEP_MAX)
+        if value + step > ANALOG_MAX or (value - step >= 0 and self.random.random() < 0.5):
+            step = -step
+        value += step
+        self.analog_in[idx] = (value, now)
+        return self.message(b'CA' + bytes((idx,)) + self.int_as_4hex(value))
+
+    def change_pca9535_in(self, now):
+        """Toggle a random pca9535 input"""
+        idx = self.random.randrange(len(self.pca9535_in_pins))
+        state = 1 - self.pca9535_in[idx][0]
+        self.pca9535_in[idx] = (state, now)
+        if not self.pca9535_bitmask:
+            return self.message(b'CP' + bytes((idx, ord(b'0') + state)))
+        pin = self.pca9535_in_pins[idx]
+        bits = self.pca9535_words()[pin // 16][0]
+        return self.message(b'CW' + bytes((pin // 16,)) + self.int_as_4hex(bits) + self.int_as_4hex(1 << (pin % 16)))
+
+    def tick(self, now=None):
+        """Returns the input changes, PONG and report that are due"""
+        if now is None:
+            now = time.monotonic()
+        out = bytearray()
+        if self.change_rate and self.input_choices:
+            self.change_carry += (now - self.last_change) * self.change_rate
+            changes = min(int(self.change_carry), MAX_CHANGES_PER_TICK)
+            self.change_carry -= int(self.change_carry)
+            for _ in range(changes):
+                out += self.random.choice(self.input_choices)(now)
+        self.last_change = now
+        if now - self.last_pong > self.pong_interval:
+            out += self.message(b'PONG')
+            self.last_pong = now
+        if self.report_interval and now - self.last_report > self.report_interval:
+            out += self.report(self.report_sections, now)
+            self.last_report = now
+        return bytes(out)
+
+
+class EmulatorServer:
+    """Runs the emulator in a thread, subclasses connect it to something the host can open"""
+    tick_interval = TICK_INTERVAL
+    boot_delay = BOOT_DELAY
+    thread = None
+
+    def __init__(self, emulator, **kwargs):
+        for key in ('tick_interval', 'boot_delay'):
+            if key in kwargs:
+                setattr(self, key, kwargs.pop(key))
+        if kwargs:
+            raise TypeError('Unknown keyword arguments {}'.format(', '.join(kwargs.keys())))
+        self.emulator = emulator
+        self.running = False
+        self.boot_at = None  # time.monotonic() when the banner is due, None when not connected
+        self.online = False
+
+    def __str__(self):
+        return '<{}(emulator={}, port={})>'.format(self.__class__.__name__, self.emulator, self.port)
+
+    def __repr__(self):
+        return str(self)
+
+    @property
+    def port(self):
+        """What the host should open"""
+        raise NotImplementedError()
+
+    def start(self):
+        """Start serving in a daemon thread"""
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=str(self), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop serving and wait for the thread"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        """Serve until stopped"""
+        try:
+            while self.running:
+                self.serve_once()
+        except Exception:  # pylint: disable=W0703
+            LOGGER.exception('{} crashed'.format(self))
+        finally:
+            self.close()
+
+    def host_connected(self):
+        """The host opened the port, the board boots"""
+        LOGGER.debug('{} host connected'.format(self))
+        self.online = False
+        self.boot_at = time.monotonic() + self.boot_delay
+
+    def host_disconnected(self):
+        """The host closed the port"""
+        LOGGER.debug('{} host disconnected'.format(self))
+        self.online = False
+        self.boot_at = None
+
+    def output(self, incoming=b''):
+        """The bytes to send to the host after this round"""
+        now = time.monotonic()
+        if not self.online:
+            if self.boot_at is None or now < self.boot_at:
+                # Still in the bootloader, the incoming bytes are lost
+                return b''
+            self.online = True
+            return self.emulator.connected(now)
+        out = b''
+        if incoming:
+            out += self.emulator.feed(incoming, now)
+        return out + self.emulator.tick(now)
+
+    def serve_once(self):
+        """Wait up to tick_interval for data, respond and send what's due"""
+        raise NotImplementedError()
+
+    def close(self):
+        """Release the resources"""
+        raise NotImplementedError()
+
+
+class PtyEmulatorServer(EmulatorServer):
+    """The emulator behind a pseudo terminal, link makes a stable symlink to it
+
+    A pty has no DTR, instead the board resets whenever the host opens the port (like most Arduinos do)"""
+    link = None
+
+    def __init__(self, emulator, link=None, **kwargs):
+        super().__init__(emulator, **kwargs)
+        self.master, slave = os.openpty()
+        # Raw mode sticks to the pty, so the host sees the bytes as is even before it configures the port
+        tty.setraw(slave)
+        self.slave_name = os.ttyname(slave)
+        # Holding the slave open would hide the host closing it
+        os.close(slave)
+        self.poller = select.poll()
+        self.poller.register(self.master, select.POLLIN)
+        if link:
+            if os.path.lexists(link):
+                os.unlink(link)
+            os.symlink(self.slave_name, link)
+            self.link = link
+
+    @property
+    def port(self):
+        """The symlink if there's one"""
+        return self.link or self.slave_name
+
+    def serve_once(self):
+        """The master reports POLLHUP while nobody has the slave open"""
+        events = self.poller.poll(self.tick_interval * 1000)
+        hangup = any(event & select.POLLHUP for _, event in events)
+        if hangup:
+            if self.boot_at is not None:
+                self.host_disconnected()
+            # poll returns at once while hung up
+            time.sleep(self.tick_interval)
+            return
+        if self.boot_at is None:
+            self.host_connected()
+        incoming = b''
+        if events:
+            incoming = os.read(self.master, 4096)
+        out = self.output(incoming)
+        if out:
+            os.write(self.master, out)
+
+    def close(self):
+        """Close the pty and remove the symlink"""
+        if self.link and os.path.islink(self.link):
+            os.unlink(self.link)
+        os.close(self.master)
+
+
+class TcpEmulatorServer(EmulatorServer):
+    """The emulator behind a TCP port, for socket://host:port URLs, one host at a time
+
+    Each new connection resets the board"""
+    connection = None
+
+    def __init__(self, emulator, host='localhost', port=0, **kwargs):
+        super().__init__(emulator, **kwargs)
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(1)
+        self.address = self.listener.getsockname()
+
+    @property
+    def port(self):
+        """The pyserial URL"""
+        return 'socket://{}:{}'.format(*self.address)
+
+    def serve_once(self):
+        """Accept a new host (dropping the old one) or talk to the current one"""
+        readable = select.select([self.listener] + ([self.connection] if self.connection else []), [], [],
+                                 self.tick_interval)[0]
+        if self.listener in readable:
+            self.drop_connection()
+            self.connection = self.listener.accept()[0]
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.host_connected()
+        if self.connection is None:
+            return
+        incoming = b''
+        if self.connection in readable:
+            try:
+                incoming = self.connection.recv(4096)
+            except OSError:
+                incoming = b''
+            if not incoming:
+                self.drop_connection()
+                return
+        out = self.output(incoming)
+        if out:
+            try:
+                self.connection.sendall(out)
+            except OSError:
+                self.drop_connection()
+
+    def drop_connection(self):
+        """Close the current host connection"""
+        if self.connection is None:
+            return
+        self.connection.close()
+        self.connection = None
+        self.host_disconnected()
+
+    def close(self):
+        """Close the connection and the listener"""
+        self.drop_connection()
+        self.listener.close()
+
+
+def main(configfile, device_name, where, change_rate):
+    """Serve one emulated board until interrupted"""
+    logging.basicConfig(level=logging.INFO)
+    with open(configfile, 'rt') as filepointer:
+        config = yaml.safe_load(filepointer)
+    emulator = BoardEmulator(device_name, config[device_name], change_rate=change_rate)
+    if where.startswith('socket://'):
+        host, port = where[len('socket://'):].rsplit(':', 1)
+        server = TcpEmulatorServer(emulator, host, int(port))
+    else:
+        server = PtyEmulatorServer(emulator, link=where)
+    server.start()
+    LOGGER.info('Serving {} in {}'.format(emulator, server.port))
+    try:
+        while server.thread.is_alive():
+            server.thread.join(1)
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    return 0
+
+
+def usage():
+    """Show usage"""
+    print("""Usage:
+
+    python3 -m ardubus_core.emulator devices.yml device_name [where] [changes_per_second]
+
+where is the path for the pty symlink (default /tmp/ttyEMU0) or socket://host:port
+""")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] in ('-h', '--help'):
+        usage()
+        sys.exit(1)
+    WHERE = '/tmp/ttyEMU0'
+    CHANGE_RATE = BoardEmulator.change_rate
+    if len(sys.argv) > 3:
+        WHERE = sys.argv[3]
+    if len(sys.argv) > 4:
+        CHANGE_RATE = float(sys.argv[4])
+    sys.exit(main(sys.argv[1], sys.argv[2], WHERE, CHANGE_RATE))
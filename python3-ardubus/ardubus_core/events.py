@@ -1,22 +1,34 @@
 """Event messages coming back from the serialport abstracted"""
 import logging
 
+from .deviceconfig import LOOKUP_KEY, PCA9535_BITS_KEY
+
 # pylint: disable=R0903
 
 LOGGER = logging.getLogger(__name__)
 
 
 class BaseEvent:
-    """baseclass for events"""
-    alias = None
-    idx = None
+    """baseclass for events
+
+    Events use __slots__ (no per-instance dict), subclasses list only the attributes they add and
+    set them in __init__ before calling the parent __init__ directly (cheaper than super() with **kwargs)"""
+    __slots__ = ('idx', 'alias', 'pin')
     _configkey = None
 
-    def __init__(self, device_config_map, idx, **kwargs):
+    def __init__(self, device_config_map, idx, alias=None, pin=None):
         self.idx = idx
-        self.__dict__.update(kwargs)
-        if self.alias is None:
-            self.alias = self.resolve_alias(device_config_map, idx, **kwargs)
+        if alias is None:
+            alias, pin = self.resolve(device_config_map, idx)
+        self.alias = alias
+        self.pin = pin
+
+    def resolve(self, device_config_map, idx):
+        """Get (alias, pin) from the lookup tables built by deviceconfig, walks the config if they're missing"""
+        try:
+            return device_config_map[LOOKUP_KEY][self._configkey][idx]
+        except (KeyError, IndexError):
+            return self.resolve_alias(device_config_map, idx), None
 
     def resolve_alias(self, device_config_map, idx, **kwargs):  # pylint: disable=W0613
         """Resolve the alias from config based on the given index"""
@@ -26,15 +38,24 @@ class BaseEvent:
         config = device_config_map[self._configkey]
         try:
             item = config[idx]
-        except (KeyError, AttributeError):
-            LOGGER.exception('Could not get item')
+        except (KeyError, IndexError, AttributeError):
+            LOGGER.warning('No index {} in {}'.format(idx, self._configkey))
             return None
         if 'alias' in item:
             return item['alias']
         return None
 
+    def as_dict(self):
+        """The set attributes as dict"""
+        result = {}
+        for klass in reversed(type(self).__mro__):
+            for name in getattr(klass, '__slots__', ()):
+                if hasattr(self, name):
+                    result[name] = getattr(self, name)
+        return result
+
     def __str__(self):
-        return '<{}(**{})>'.format(self.__class__.__name__, self.__dict__)
+        return '<{}(**{})>'.format(self.__class__.__name__, self.as_dict())
 
     def __repr__(self):
         return str(self)
@@ -42,53 +63,138 @@ class BaseEvent:
 
 class Change(BaseEvent):
     """Change events"""
+    __slots__ = ()
 
 
 class Status(BaseEvent):
-    """Report status"""
-    reported_ms = None
+    """Report status, the concrete classes provide the reported_ms slot (mixins can't both have slots)"""
+    __slots__ = ()
 
 
 class PinEvent(BaseEvent):
     """MCU digital input events"""
-    pin = None
-    state = False
+    __slots__ = ('state',)
     _configkey = 'digital_in_pins'
 
+    def __init__(self, device_config_map, idx, state=False, alias=None, pin=None):
+        self.state = state
+        BaseEvent.__init__(self, device_config_map, idx, alias, pin)
+
 
 class PinChange(PinEvent, Change):
     """MCU digital input state changes"""
+    __slots__ = ()
 
 
 class PinStatus(PinEvent, Status):
     """MCU digital input status reports"""
+    __slots__ = ('reported_ms',)
+
+    def __init__(self, device_config_map, idx, state=False, reported_ms=None, alias=None, pin=None):
+        self.reported_ms = reported_ms
+        PinEvent.__init__(self, device_config_map, idx, state, alias, pin)
 
 
 class AnalogPinEvent(BaseEvent):
     """MCU analog input events"""
-    pin = None
-    value = 0
+    __slots__ = ('value',)
     _configkey = 'analog_in_pins'
 
+    def __init__(self, device_config_map, idx, value=0, alias=None, pin=None):
+        self.value = value
+        BaseEvent.__init__(self, device_config_map, idx, alias, pin)
+
 
 class AnalogPinChange(AnalogPinEvent, Change):
     """MCU analog input changes"""
+    __slots__ = ()
 
 
 class AnalogPinStatus(AnalogPinEvent, Status):
     """MCU analog input status reports"""
+    __slots__ = ('reported_ms',)
+
+    def __init__(self, device_config_map, idx, value=0, reported_ms=None, alias=None, pin=None):
+        self.reported_ms = reported_ms
+        AnalogPinEvent.__init__(self, device_config_map, idx, value, alias, pin)
 
 
 class PCA9535PinEvent(BaseEvent):
     """PCA953 I2C digital io-expander events"""
-    pin = None
-    state = False
+    __slots__ = ('state',)
     _configkey = 'pca9535_inputs'
 
+    def __init__(self, device_config_map, idx, state=False, alias=None, pin=None):
+        self.state = state
+        BaseEvent.__init__(self, device_config_map, idx, alias, pin)
+
 
 class PCA9535PinChange(PCA9535PinEvent, Change):
     """PCA953 pin change"""
+    __slots__ = ()
 
 
 class PCA9535PinStatus(PCA9535PinEvent, Status):
     """PCA953 pin status report"""
+    __slots__ = ('reported_ms',)
+
+    def __init__(self, device_config_map, idx, state=False, reported_ms=None, alias=None, pin=None):
+        self.reported_ms = reported_ms
+        PCA9535PinEvent.__init__(self, device_config_map, idx, state, alias, pin)
+
+
+class PCA9535WordEvent(BaseEvent):
+    """All the inputs of one PCA9535 board at once (from the CW/RW bitmask reports), idx is the board index
+
+    state has bit N set when pin N of the board is high, see pin_events for the per-pin events"""
+    __slots__ = ('state', 'mask')
+    _configkey = 'pca9535_boards'
+
+    def __init__(self, device_config_map, idx, state=0, mask=0, alias=None, pin=None):
+        self.state = state
+        self.mask = mask
+        BaseEvent.__init__(self, device_config_map, idx, alias, pin)
+
+    def resolve(self, device_config_map, idx):
+        """Boards have no alias, pin is the I2C address of the board"""
+        try:
+            return None, device_config_map[self._configkey][idx]
+        except (KeyError, IndexError):
+            return None, None
+
+    def pin_states(self, device_config_map):
+        """Yields (pca9535_inputs idx, state) for the inputs with their bit set in mask"""
+        try:
+            bits = device_config_map[PCA9535_BITS_KEY][self.idx]
+        except KeyError:
+            LOGGER.warning('No pca9535_inputs on board index {}'.format(self.idx))
+            return
+        for bit, idx in bits:
+            if self.mask >> bit & 1:
+                yield idx, bool(self.state >> bit & 1)
+
+
+class PCA9535WordChange(PCA9535WordEvent, Change):
+    """PCA9535 board inputs changed, mask has the bits that changed"""
+    __slots__ = ()
+
+    def pin_events(self, device_config_map):
+        """The equivalent PCA9535PinChange events"""
+        return [PCA9535PinChange(device_config_map, idx, state)
+                for idx, state in self.pin_states(device_config_map)]
+
+
+class PCA9535WordStatus(PCA9535WordEvent, Status):
+    """PCA9535 board inputs status report, mask has the bits of the inputs
+
+    reported_ms is the time since the latest change of any input on the board"""
+    __slots__ = ('reported_ms',)
+
+    def __init__(self, device_config_map, idx, state=0, mask=0, reported_ms=None, alias=None, pin=None):
+        self.reported_ms = reported_ms
+        PCA9535WordEvent.__init__(self, device_config_map, idx, state, mask, alias, pin)
+
+    def pin_events(self, device_config_map):
+        """The equivalent PCA9535PinStatus events, reported_ms is a lower bound for each pin"""
+        return [PCA9535PinStatus(device_config_map, idx, state, self.reported_ms)
+                for idx, state in self.pin_states(device_config_map)]
@@ -0,0 +1,142 @@
+"""Event subscriptions, each consumer gets its own bounded queue so a slow one does not hold up the others"""
+import collections
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+EVENT_QUEUE_SIZE = 1000
+# Events an OVERFLOW_BLOCK subscription holds on top of maxsize, after that the oldest held are dropped
+BLOCK_OVERFLOW_MAX = 10000
+# When the queue is full: throw away the oldest event
+OVERFLOW_DROP_OLDEST = 'drop-oldest'
+# When the queue is full: hold the further events (up to BLOCK_OVERFLOW_MAX) until the consumer catches up
+OVERFLOW_BLOCK = 'block'
+# Newer event for the same alias replaces the queued one, when full with distinct aliases drop the oldest
+OVERFLOW_COALESCE = 'coalesce-by-alias'
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_BLOCK, OVERFLOW_COALESCE)
+
+
+class EventSubscription:
+    """Async iterator over the events of one transport, see BaseTransport.events
+
+    Events are queued from the moment the subscription is created, close() (or leaving the
+    async with block) unsubscribes."""
+    transport = None
+    waiter = None
+    closed = False
+
+    def __init__(self, transport, types=None, aliases=None, maxsize=EVENT_QUEUE_SIZE, policy=OVERFLOW_DROP_OLDEST):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError('policy must be one of {}'.format(OVERFLOW_POLICIES))
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        self.transport = transport
+        self.types = tuple(types) if types else None
+        self.aliases = frozenset(aliases) if aliases else None
+        self.maxsize = maxsize
+        self.policy = policy
+        if policy == OVERFLOW_COALESCE:
+            self.queue = collections.OrderedDict()
+        else:
+            self.queue = collections.deque()
+        # OVERFLOW_BLOCK events that came while the queue was full
+        self.overflow = collections.deque()
+        self.delivered_count = 0
+        self.dropped_count = 0
+        self.coalesced_count = 0
+
+    def __str__(self):
+        return '<{}(policy={}, queued={}, held={}, delivered={}, dropped={}, coalesced={})>'.format(
+            self.__class__.__name__, self.policy, len(self.queue), len(self.overflow), self.delivered_count,
+            self.dropped_count, self.coalesced_count)
+
+    def __repr__(self):
+        return str(self)
+
+    @property
+    def full(self):
+        """Is the queue at (or over) maxsize"""
+        return len(self.queue) >= self.maxsize
+
+    def wants(self, event):
+        """Does the event pass the types and aliases filters"""
+        if self.types is not None and not isinstance(event, self.types):
+            return False
+        if self.aliases is not None and event.alias not in self.aliases:
+            return False
+        return True
+
+    def deliver(self, event):
+        """Queue the event according to the overflow policy, called in the event loop
+
+        OVERFLOW_BLOCK holds the events that do not fit in the queue, they move to the queue as it's consumed"""
+        if self.closed:
+            return
+        if self.policy == OVERFLOW_COALESCE:
+            key = event.alias
+            if key is None:
+                key = (event.__class__, event.idx)
+            if key in self.queue:
+                self.coalesced_count += 1
+            elif self.full:
+                self.queue.popitem(last=False)
+                self.dropped_count += 1
+            self.queue[key] = event
+        elif self.policy == OVERFLOW_BLOCK and self.full:
+            if len(self.overflow) >= BLOCK_OVERFLOW_MAX:
+                self.overflow.popleft()
+                if not self.dropped_count % BLOCK_OVERFLOW_MAX:
+                    LOGGER.warning('{} is not keeping up, dropping held events'.format(self))
+                self.dropped_count += 1
+            self.overflow.append(event)
+        else:
+            if self.policy == OVERFLOW_DROP_OLDEST and self.full:
+                self.queue.popleft()
+                self.dropped_count += 1
+            self.queue.append(event)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def get_nowait(self):
+        """Pop the oldest queued event, raises IndexError if there are none"""
+        if self.policy == OVERFLOW_COALESCE:
+            if not self.queue:
+                raise IndexError('No events queued')
+            _, event = self.queue.popitem(last=False)
+        else:
+            event = self.queue.popleft()
+        self.delivered_count += 1
+        if self.overflow:
+            self.queue.append(self.overflow.popleft())
+        elif self.policy == OVERFLOW_BLOCK and len(self.queue) == self.maxsize - 1:
+            self.transport.subscription_drained()
+        return event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.queue:
+            if self.closed:
+                raise StopAsyncIteration
+            self.waiter = self.transport.loop.create_future()
+            try:
+                await self.waiter
+            finally:
+                self.waiter = None
+        return self.get_nowait()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def close(self):
+        """Unsubscribe, iteration ends once the queued events have been consumed"""
+        if self.closed:
+            return
+        self.closed = True
+        self.transport.unsubscribe(self)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
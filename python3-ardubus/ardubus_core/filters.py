@@ -0,0 +1,87 @@
+"""Host side filtering of input reports, for boards running firmware that does not filter them itself"""
+import logging
+import threading
+import time
+
+from .deviceconfig import ANALOG_IN_FILTERS_KEY
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AnalogInFilter:
+    """Deadband and rate limit for analog change events, same rules as ardubus_analog_in.h
+
+    A change is passed on if it differs from the last passed value by more than the deadband of the pin.
+    Changes that come sooner than min_interval_ms after the previous one are held back and the latest
+    of them is passed on once the interval has passed, so the final position is never lost.
+    Boards that already filter pass through unchanged."""
+    transport = None
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.last_values = {}  # idx: value of the last passed event
+        self.last_times = {}  # idx: time.monotonic() of the last passed event
+        self.held = {}  # idx: latest event waiting for the interval to pass
+        self.filtered_count = 0
+        # passes runs in the reader thread and flush in the event loop
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        return '<{}(filtered={}, held={})>'.format(self.__class__.__name__, self.filtered_count, len(self.held))
+
+    def __repr__(self):
+        return str(self)
+
+    def reset(self):
+        """Forget the state, call when the board has been reset"""
+        with self.lock:
+            self.last_values.clear()
+            self.last_times.clear()
+            self.held.clear()
+
+    def passes(self, event):
+        """Should the event be passed on now, may be called from the reader thread"""
+        try:
+            deadband, min_interval_ms = self.transport.device_config_map[ANALOG_IN_FILTERS_KEY][event.idx]
+        except (KeyError, IndexError):
+            return True
+        idx = event.idx
+        with self.lock:
+            last_value = self.last_values.get(idx)
+            if last_value is not None and abs(event.value - last_value) <= deadband:
+                # Back within the deadband, whatever was held is moot
+                self.held.pop(idx, None)
+                self.filtered_count += 1
+                return False
+            now = time.monotonic()
+            # Without an event loop we could not pass on the held event later, so no rate limiting
+            if min_interval_ms and idx in self.last_times and self.transport.loop is not None:
+                wait = self.last_times[idx] + min_interval_ms / 1000 - now
+                if wait > 0:
+                    if idx not in self.held:
+                        self.schedule_flush(idx, wait)
+                    self.held[idx] = event
+                    self.filtered_count += 1
+                    return False
+            self.held.pop(idx, None)
+            self.last_values[idx] = event.value
+            self.last_times[idx] = now
+        return True
+
+    def schedule_flush(self, idx, delay):
+        """Pass on the held event for idx after delay seconds"""
+        loop = self.transport.loop
+        if self.transport.threaded_reader:
+            loop.call_soon_threadsafe(loop.call_later, delay, self.flush, idx)
+        else:
+            loop.call_later(delay, self.flush, idx)
+
+    def flush(self, idx):
+        """Pass on the held event, called in the event loop"""
+        with self.lock:
+            event = self.held.pop(idx, None)
+            if event is None:
+                return
+            self.last_values[idx] = event.value
+            self.last_times[idx] = time.monotonic()
+        self.transport.emit_event(event)
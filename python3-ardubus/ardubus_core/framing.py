@@ -0,0 +1,78 @@
+"""Binary framing: COBS encoded payload + CRC8, terminated with null, see ARDUBUS_BINARY_FRAMING in ardubus.h"""
+from .errors import InvalidPacketError
+
+FRAME_DELIMITER = b'\x00'
+CRC8_POLYNOMIAL = 0x07
+
+
+def _crc8_table():
+    """Precalculate the CRC for each byte value"""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ CRC8_POLYNOMIAL) & 0xff
+            else:
+                crc = (crc << 1) & 0xff
+        table.append(crc)
+    return table
+
+
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data):
+    """CRC-8 with polynomial 0x07, same as ardubus_crc8 in ardubus.h"""
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def cobs_encode(data):
+    """Consistent Overhead Byte Stuffing, the result contains no nulls"""
+    encoded = bytearray()
+    for block in bytes(data).split(b'\x00'):
+        # Blocks longer than 254 bytes are split to 0xFF blocks that do not imply the null
+        while len(block) >= 254:
+            encoded.append(0xFF)
+            encoded += block[:254]
+            block = block[254:]
+        encoded.append(len(block) + 1)
+        encoded += block
+    return bytes(encoded)
+
+
+def cobs_decode(data):
+    """Reverse cobs_encode, raises InvalidPacketError on malformed input"""
+    decoded = bytearray()
+    idx = 0
+    while idx < len(data):
+        code = data[idx]
+        if code == 0:
+            raise InvalidPacketError('Null inside COBS frame')
+        end = idx + code
+        if end > len(data):
+            raise InvalidPacketError('COBS block overruns the frame')
+        decoded += data[idx + 1:end]
+        idx = end
+        if code < 0xFF and idx < len(data):
+            decoded.append(0)
+    return bytes(decoded)
+
+
+def encode_frame(payload):
+    """Add CRC, COBS encode and terminate"""
+    return cobs_encode(payload + bytes([crc8(payload)])) + FRAME_DELIMITER
+
+
+def decode_frame(frame):
+    """Decode the frame (without the terminating null), check and strip the CRC"""
+    decoded = cobs_decode(frame)
+    if len(decoded) < 2:
+        raise InvalidPacketError('Frame too short: {}'.format(repr(frame)))
+    payload, checksum = decoded[:-1], decoded[-1]
+    if crc8(payload) != checksum:
+        raise InvalidPacketError('CRC mismatch in frame {}'.format(repr(frame)))
+    return payload
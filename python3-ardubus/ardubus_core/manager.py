@@ -0,0 +1,175 @@
+"""Find the boards in serial ports and keep track of their transports"""
+import asyncio
+import concurrent.futures
+import functools
+import glob
+import logging
+import time
+
+import serial
+
+from . import deviceconfig
+from .transport import (BOARD_INITIALIZING_RE, DEFAULT_BAUDRATE,
+                        TRANSPORT_KWARGS, SerialTransport, reset_board)
+
+BOARD_IDENT_TIMEOUT = 4.0  # seconds from reset to the "Board: <name> initializing" banner
+PROBE_READ_TIMEOUT = 0.05  # seconds, serial read timeout while probing
+
+LOGGER = logging.getLogger(__name__)
+
+
+def probe_port(serial_url, timeout=BOARD_IDENT_TIMEOUT, reset=True, **serial_kwargs):
+    """Reset the board in the port and wait for the banner, blocking
+
+    Returns (device_name, port, received) with the port left open, or (None, None, None) if no board answered.
+    received is what was read from the banner on (the ready line, maybe the first reports), pass it on to
+    the transport as initial_data"""
+    if 'baudrate' not in serial_kwargs:
+        serial_kwargs['baudrate'] = DEFAULT_BAUDRATE
+    try:
+        port = serial.serial_for_url(serial_url, timeout=PROBE_READ_TIMEOUT, **serial_kwargs)
+        if reset:
+            reset_board(port)
+        in_buffer = bytearray()
+        started = time.time()
+        while (time.time() - started) < timeout:
+            in_buffer += port.read(port.in_waiting or 1)
+            match = BOARD_INITIALIZING_RE.search(in_buffer)
+            if match:
+                device_name = match.group(1).decode('ascii')
+                LOGGER.info('Found board {} in {} in {:.2f}s'.format(device_name, serial_url, time.time() - started))
+                return device_name, port, bytes(in_buffer[match.start():])
+        LOGGER.info('Could not find board in {} in {}s, buffer: {}'.format(serial_url, timeout, repr(in_buffer)))
+        port.close()
+    except (serial.SerialException, OSError) as exc:
+        LOGGER.warning('Got an exception from port {}: {}'.format(serial_url, repr(exc)))
+    return None, None, None
+
+
+class DeviceManager:  # pylint: disable=R0902
+    """Probes the search ports concurrently and wires the found boards to devices.yml configs
+
+        manager = DeviceManager('devices.yml', ['/dev/ttyUSB*', '/dev/ttyACM*'])
+        await manager.start()
+        manager.transports['rod_control_panel']
+
+    Keywords listed in transport.TRANSPORT_KWARGS are passed to the transports, rest to serial_for_url"""
+    transport_class = SerialTransport
+    probe_timeout = BOARD_IDENT_TIMEOUT
+    reset = True
+
+    def __init__(self, devices_yml, search_ports, **kwargs):
+        self.devices_yml = devices_yml
+        self.search_ports = search_ports
+        self.transport_class = kwargs.pop('transport_class', self.transport_class)
+        self.probe_timeout = kwargs.pop('probe_timeout', self.probe_timeout)
+        self.reset = kwargs.pop('reset', self.reset)
+        self.transport_kwargs = {}
+        for key in TRANSPORT_KWARGS:
+            if key in kwargs:
+                self.transport_kwargs[key] = kwargs.pop(key)
+        self.serial_kwargs = kwargs
+        self.transports = {}
+        self.serial_urls = {}
+
+    def __str__(self):
+        return '<{}(devices={})>'.format(self.__class__.__name__, self.serial_urls)
+
+    def __repr__(self):
+        return str(self)
+
+    def candidate_ports(self):
+        """The ports matching search_ports, minus the ones we already have boards in"""
+        in_use = set(self.serial_urls.values())
+        candidates = []
+        for filespec in self.search_ports:
+            matches = glob.glob(filespec)
+            if not glob.has_magic(filespec) and not matches:
+                # Not a path pattern, probably an url like socket://host:port
+                matches = [filespec]
+            for serial_url in sorted(matches):
+                if serial_url not in in_use and serial_url not in candidates:
+                    candidates.append(serial_url)
+        return candidates
+
+    async def discover(self):
+        """Probe all candidate ports at the same time, returns {device_name: (serial_url, port, received)}"""
+        candidates = self.candidate_ports()
+        if not candidates:
+            return {}
+        loop = asyncio.get_event_loop()
+        # One thread per port so all the probes really run in parallel
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(executor, functools.partial(
+                    probe_port, serial_url, self.probe_timeout, self.reset, **self.serial_kwargs))
+                for serial_url in candidates
+            ))
+        found = {}
+        for serial_url, (device_name, port, received) in zip(candidates, results):
+            if device_name is None:
+                continue
+            if device_name in found or device_name in self.transports:
+                LOGGER.error('Board {} found in {} but it is already connected, ignoring'.format(
+                    device_name, serial_url))
+                port.close()
+                continue
+            found[device_name] = (serial_url, port, received)
+        return found
+
+    def connect(self, found):
+        """Create transports for the discovered boards, returns the new transports by device name"""
+        new_transports = {}
+        for device_name, (serial_url, port, received) in found.items():
+            # the device_config_map gets set when the config is normalized with the transport
+            new_transports[device_name] = self.transport_class(port, {}, device_name=device_name,
+                                                               initial_data=received, **self.transport_kwargs)
+            self.serial_urls[device_name] = serial_url
+        self.transports.update(new_transports)
+        return new_transports
+
+    async def start(self):
+        """Discover the boards and load devices.yml with their transports, returns the transports by device name"""
+        self.connect(await self.discover())
+        await self.reload()
+        return self.transports
+
+    async def reload(self):
+        """(Re)load devices.yml, unloads boards that no longer have config"""
+        deviceconfig.load_devices_yml(self.devices_yml, device_transports=self.transports)
+        await self.unload_unconfigured(list(self.transports.keys()))
+
+    async def rescan(self):
+        """Probe the ports that have no known board, returns the newly found transports by device name"""
+        new_transports = self.connect(await self.discover())
+        await self.unload_unconfigured(list(new_transports.keys()))
+        for device_name in list(new_transports.keys()):
+            if device_name not in self.transports:
+                del new_transports[device_name]
+                continue
+            deviceconfig.normalize_device_config(device_name, new_transports[device_name])
+        return new_transports
+
+    async def unload_unconfigured(self, device_names):
+        """Unload the given boards if devices.yml has no config for them"""
+        for device_name in device_names:
+            if device_name in deviceconfig.FULL_CONFIG_MAP:
+                continue
+            LOGGER.error('Found board {} in {} but there is no config in {}'.format(
+                device_name, self.serial_urls[device_name], self.devices_yml))
+            await self.unload_device(device_name)
+
+    def forget(self, device_name):
+        """Remove the board from our books (does not close the transport)"""
+        del self.transports[device_name]
+        del self.serial_urls[device_name]
+
+    async def unload_device(self, device_name):
+        """Quit the transport of the board and forget it"""
+        await self.transports[device_name].quit()
+        self.forget(device_name)
+
+    async def quit(self):
+        """Quit all transports"""
+        for device_name in list(self.transports.keys()):
+            await self.unload_device(device_name)
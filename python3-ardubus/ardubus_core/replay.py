@@ -0,0 +1,99 @@
+"""Feed a capture (see capture module) back through the transport machinery without a board"""
+import asyncio
+import logging
+import time
+
+from .capture import CAPTURE_BINARY_FRAMING, CAPTURE_TO_DEVICE, read_capture
+from .transport import SerialTransport
+
+LOGGER = logging.getLogger(__name__)
+
+REPLAY_AS_FAST_AS_POSSIBLE = 0
+REPLAY_YIELD_EVERY = 64  # packets, how often an as-fast-as-possible replay lets the other tasks run
+
+
+class ReplayTransport(SerialTransport):
+    """Replays the packets the board sent, parsed by the same code as SerialTransport
+
+        tr = ReplayTransport('capture.bin', deviceconfig.FULL_CONFIG_MAP['rod_control_panel'], speed=10)
+        deviceconfig.normalize_device_config('rod_control_panel', tr)
+        packet_count = await tr.replay()
+
+    speed is the multiplier to the captured timing, REPLAY_AS_FAST_AS_POSSIBLE (0) does not wait at all.
+    Commands are not sent anywhere, they succeed immediately. Packets the host sent are skipped."""
+    threaded_reader = False
+    binary_framing = False  # Follows the flags of the replayed packets
+    speed = 1.0
+    replay_allowed = None
+    records = None
+    started = None
+
+    def __init__(self, capture_path, device_config_map, *args, **kwargs):
+        if 'speed' in kwargs:
+            self.speed = kwargs.pop('speed')
+        # Capturing the replay would be confusing
+        kwargs.pop('capture', None)
+        super().__init__(capture_path, device_config_map, *args, **kwargs)
+
+    def __str__(self):
+        return '<{}(name={}, capture={})>'.format(self.__class__.__name__, self.device_name, self.capture_path)
+
+    def start_reader(self, serial_device):
+        """Load the capture instead of opening a port"""
+        self.capture_path = serial_device
+        self.started, self.records = read_capture(serial_device)
+
+    def bind_loop(self):
+        """The pause/resume Event belongs to the loop too"""
+        if asyncio.get_event_loop() is self.loop:
+            return
+        super().bind_loop()
+        self.replay_allowed = asyncio.Event()
+        self.replay_allowed.set()
+
+    async def replay(self):
+        """Pass the captured packets from the board to message_received, returns the number of packets"""
+        self.bind_loop()
+        packet_count = 0
+        replay_started = time.monotonic()
+        for offset, flags, packet in self.records:
+            if self.closed:
+                break
+            if flags & CAPTURE_TO_DEVICE:
+                continue
+            if not self.replay_allowed.is_set():
+                await self.replay_allowed.wait()
+            if self.speed:
+                delay = replay_started + offset / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif packet_count % REPLAY_YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+            self.binary_framing = bool(flags & CAPTURE_BINARY_FRAMING)
+            self.message_received(packet)
+            packet_count += 1
+        LOGGER.debug('{} replayed {} packets in {:.2f}s'.format(self, packet_count, time.monotonic() - replay_started))
+        return packet_count
+
+    async def send_command(self, command, timeout=None, wait_online=True):
+        """Nothing to send to, pretend the board acknowledged"""
+        self.bind_loop()
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug('{} not sending {}'.format(self, repr(command)))
+
+    async def ensure_framing(self):
+        """The captured packets decide the framing"""
+        return
+
+    def pause_reading(self):
+        """Blocking subscription is full, hold the replay"""
+        self.replay_allowed.clear()
+
+    def resume_reading(self):
+        """Continue the replay"""
+        if self.replay_allowed is not None:
+            self.replay_allowed.set()
+
+    def close_reader(self):
+        """Nothing to close"""
+        return
@@ -0,0 +1,151 @@
+"""Decoders for the unsolicited reports, dispatch tables are keyed by the 2-byte report prefix"""
+import struct
+
+from .events import (AnalogPinChange, AnalogPinStatus, PCA9535PinChange,
+                     PCA9535PinStatus, PCA9535WordChange, PCA9535WordStatus,
+                     PinChange, PinStatus)
+
+STATE_ON = ord(b'1')
+UINT16 = struct.Struct('>H')
+UINT32 = struct.Struct('>I')
+UINT16_UINT32 = struct.Struct('>HI')
+UINT16_UINT16 = struct.Struct('>HH')
+UINT16_UINT16_UINT32 = struct.Struct('>HHI')
+# devices.yml sections by their bit in the "Q" (full report) command mask, see ARDUBUS_REPORT_SECTIONS in ardubus.h
+REPORT_SECTION_BITS = {
+    'digital_in_pins': 0x1,
+    'digital_out_pins': 0x2,
+    'analog_in_pins': 0x4,
+    'digital_pwmout_pins': 0x8,
+    'servo_pins': 0x10,
+    'pca9635RGBJBOL_boards': 0x20,
+    'spi74XX595': 0x40,
+    'pca9535_inputs': 0x80,
+    'pca9535_outputs': 0x100,
+    'aircore_boards': 0x200,
+    'i2cascii_boards': 0x400,
+    'pulse_input_pins': 0x800,
+}
+ALL_REPORT_SECTIONS = 0xFFFF
+
+# pylint: disable=C0111
+
+
+def state_change(klass):
+    """<prefix><idx><state char>, same in both modes"""
+    def decoder(device_config_map, buffer):
+        return klass(device_config_map, idx=buffer[2], state=buffer[3] == STATE_ON)
+    return decoder
+
+
+def state_status_ascii(klass):
+    """<prefix><idx><state char><8 hex reported_ms>"""
+    def decoder(device_config_map, buffer):
+        return klass(device_config_map, idx=buffer[2], state=buffer[3] == STATE_ON,
+                     reported_ms=int(buffer[4:12], 16))
+    return decoder
+
+
+def state_status_binary(klass):
+    """<prefix><idx><state char><uint32 reported_ms>"""
+    unpack_from = UINT32.unpack_from
+
+    def decoder(device_config_map, buffer):
+        return klass(device_config_map, idx=buffer[2], state=buffer[3] == STATE_ON,
+                     reported_ms=unpack_from(buffer, 4)[0])
+    return decoder
+
+
+def value_change_ascii(klass):
+    """<prefix><idx><4 hex value>"""
+    def decoder(device_config_map, buffer):
+        return klass(device_config_map, idx=buffer[2], value=int(buffer[3:7], 16))
+    return decoder
+
+
+def value_change_binary(klass):
+    """<prefix><idx><uint16 value>"""
+    unpack_from = UINT16.unpack_from
+
+    def decoder(device_config_map, buffer):
+        return klass(device_config_map, idx=buffer[2], value=unpack_from(buffer, 3)[0])
+    return decoder
+
+
+def value_status_ascii(klass):
+    """<prefix><idx><4 hex value><8 hex reported_ms>"""
+    def decoder(device_config_map, buffer):
+        return klass(device_config_map, idx=buffer[2], value=int(buffer[3:7], 16),
+                     reported_ms=int(buffer[7:15], 16))
+    return decoder
+
+
+def value_status_binary(klass):
+    """<prefix><idx><uint16 value><uint32 reported_ms>"""
+    unpack_from = UINT16_UINT32.unpack_from
+
+    def decoder(device_config_map, buffer):
+        value, reported_ms = unpack_from(buffer, 3)
+        return klass(device_config_map, idx=buffer[2], value=value, reported_ms=reported_ms)
+    return decoder
+
+
+def word_change_ascii(klass):
+    """<prefix><board idx><4 hex state><4 hex changed bits>"""
+    def decoder(device_config_map, buffer):
+        return klass(device_config_map, idx=buffer[2], state=int(buffer[3:7], 16), mask=int(buffer[7:11], 16))
+    return decoder
+
+
+def word_change_binary(klass):
+    """<prefix><board idx><uint16 state><uint16 changed bits>"""
+    unpack_from = UINT16_UINT16.unpack_from
+
+    def decoder(device_config_map, buffer):
+        state, mask = unpack_from(buffer, 3)
+        return klass(device_config_map, idx=buffer[2], state=state, mask=mask)
+    return decoder
+
+
+def word_status_ascii(klass):
+    """<prefix><board idx><4 hex state><4 hex input bits><8 hex reported_ms>"""
+    def decoder(device_config_map, buffer):
+        return klass(device_config_map, idx=buffer[2], state=int(buffer[3:7], 16), mask=int(buffer[7:11], 16),
+                     reported_ms=int(buffer[11:19], 16))
+    return decoder
+
+
+def word_status_binary(klass):
+    """<prefix><board idx><uint16 state><uint16 input bits><uint32 reported_ms>"""
+    unpack_from = UINT16_UINT16_UINT32.unpack_from
+
+    def decoder(device_config_map, buffer):
+        state, mask, reported_ms = unpack_from(buffer, 3)
+        return klass(device_config_map, idx=buffer[2], state=state, mask=mask, reported_ms=reported_ms)
+    return decoder
+
+
+ASCII_REPORT_DECODERS = {
+    b'CD': state_change(PinChange),
+    b'CP': state_change(PCA9535PinChange),
+    b'CA': value_change_ascii(AnalogPinChange),
+    b'RD': state_status_ascii(PinStatus),
+    b'RP': state_status_ascii(PCA9535PinStatus),
+    b'RA': value_status_ascii(AnalogPinStatus),
+    b'CW': word_change_ascii(PCA9535WordChange),
+    b'RW': word_status_ascii(PCA9535WordStatus),
+}
+
+BINARY_REPORT_DECODERS = {
+    b'CD': state_change(PinChange),
+    b'CP': state_change(PCA9535PinChange),
+    b'CA': value_change_binary(AnalogPinChange),
+    b'RD': state_status_binary(PinStatus),
+    b'RP': state_status_binary(PCA9535PinStatus),
+    b'RA': value_status_binary(AnalogPinStatus),
+    b'CW': word_change_binary(PCA9535WordChange),
+    b'RW': word_status_binary(PCA9535WordStatus),
+}
+
+# Decoders raise these on truncated or garbled packets
+DECODE_ERRORS = (ValueError, IndexError, struct.error)
@@ -0,0 +1,64 @@
+"""Output command scheduling, coalesces writes to the same output so only the latest value gets sent"""
+import asyncio
+import collections
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CoalescingScheduler:
+    """Last-write-wins queue in front of transport.send_command
+
+    Pending commands are keyed by their target (see BaseProxy.target_key), a newer command for
+    the same target replaces the queued one and everyone waiting for either gets the same result.
+    Up to transport.pipeline_depth commands are sent at the same time."""
+    transport = None
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.pending = collections.OrderedDict()
+        self.active_workers = 0
+        self.submitted_count = 0
+        self.coalesced_count = 0
+        self.sent_count = 0
+
+    def __str__(self):
+        return '<{}(submitted={}, coalesced={}, sent={}, pending={})>'.format(
+            self.__class__.__name__, self.submitted_count, self.coalesced_count, self.sent_count, len(self.pending))
+
+    def __repr__(self):
+        return str(self)
+
+    async def submit(self, key, command):
+        """Queue the command for the target key replacing any older queued command for it, wait until sent"""
+        self.submitted_count += 1
+        if key in self.pending:
+            _, future = self.pending[key]
+            self.pending[key] = (command, future)
+            self.coalesced_count += 1
+            LOGGER.debug('Coalesced {} for target {}'.format(repr(command), repr(key)))
+        else:
+            future = asyncio.get_event_loop().create_future()
+            self.pending[key] = (command, future)
+            if self.active_workers < self.transport.pipeline_depth:
+                self.active_workers += 1
+                asyncio.ensure_future(self.worker())
+        # Shield so that one cancelled caller does not cancel the write for the others
+        return await asyncio.shield(future)
+
+    async def worker(self):
+        """Sends pending commands oldest first until there are none left"""
+        try:
+            while self.pending:
+                _, (command, future) = self.pending.popitem(last=False)
+                try:
+                    result = await self.transport.send_command(command)
+                except Exception as exc:  # pylint: disable=W0703
+                    if not future.done():
+                        future.set_exception(exc)
+                    continue
+                self.sent_count += 1
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.active_workers -= 1
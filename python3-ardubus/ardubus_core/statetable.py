@@ -0,0 +1,280 @@
+"""Memory mapped table of the current input states, local processes can poll it instead of subscribing to events
+
+One file per device, the transport writes it and any number of StateTableReaders read it without locking:
+every slot has a seqlock counter that is odd while the slot is being written, readers retry until they
+get the same even counter before and after reading the slot.
+
+File layout (little endian):
+
+  - header: magic, version, state (live/stale), directory length
+  - directory: JSON {section: [offset, count, [alias, ...]]}
+  - slots: <uint32 seqlock counter><int32 value><float64 time.time() of the last change>
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from .deviceconfig import LOOKUP_KEY
+from .errors import TransportError
+from .events import AnalogPinEvent, PCA9535WordEvent, Status
+
+LOGGER = logging.getLogger(__name__)
+
+STATE_TABLE_MAGIC = b'ARDS'
+STATE_TABLE_VERSION = 1
+STATE_LIVE = 1
+# The writer has replaced the file (config reload) or quit, readers should reopen
+STATE_STALE = 2
+HEADER = struct.Struct('<4sHHI')
+SEQLOCK = struct.Struct('<I')
+SEQLOCK_MASK = 0xFFFFFFFF
+SLOT_DATA = struct.Struct('<id')
+SLOT = struct.Struct('<Iid')
+# Sections with input events, values are the pin state (0/1) or the analog value
+STATE_TABLE_SECTIONS = ('digital_in_pins', 'analog_in_pins', 'pca9535_inputs')
+READ_TIMEOUT = 0.1  # seconds, how long a reader retries a slot that's being written
+STATE_TABLE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def slot_entries(lookup):
+    """(alias, pin) for each slot, lookups of dict config sections are keyed by index and may have gaps"""
+    if not isinstance(lookup, dict):
+        return lookup
+    indices = [idx for idx in lookup if isinstance(idx, int) and idx >= 0]
+    if not indices:
+        return ()
+    return tuple(lookup.get(idx, (None, None)) for idx in range(max(indices) + 1))
+
+
+def state_table_path(directory, device_name):
+    """Where the table of the device lives"""
+    return os.path.join(directory, 'ardubus-{}.state'.format(device_name))
+
+
+class StateTable:
+    """The writing side, see SerialTransport state_table option
+
+    Only one writer per file, the transport writes from its reader (thread or event loop)"""
+    mmap = None
+
+    def __init__(self, path, device_config_map):
+        self.path = path
+        self.device_config_map = device_config_map
+        self.sections = {}  # section: (offset, count)
+        self.create()
+
+    def __str__(self):
+        return '<{}(path={})>'.format(self.__class__.__name__, self.path)
+
+    def __repr__(self):
+        return str(self)
+
+    def create(self, keep_states=False):
+        """Write the header and empty slots to a new file and replace the old one with it
+
+        With keep_states the slots of the indices that exist in both are copied from the old table"""
+        lookups = self.device_config_map.get(LOOKUP_KEY, {})
+        directory = {}
+        counts = []
+        entries = {}
+        for section in STATE_TABLE_SECTIONS:
+            if section in lookups:
+                entries[section] = slot_entries(lookups[section])
+                counts.append((section, len(entries[section])))
+        # Directory length depends on the offsets, lay out the slots after a generous guess and fix if needed
+        slots_start = 0
+        while True:
+            offset = slots_start
+            for section, count in counts:
+                directory[section] = [offset, count, [alias for alias, _ in entries[section]]]
+                offset += count * SLOT.size
+            encoded = json.dumps(directory).encode('utf-8')
+            needed = HEADER.size + len(encoded)
+            needed += -needed % 8  # Align the slots
+            if needed <= slots_start:
+                break
+            slots_start = needed
+        size = max(offset, slots_start, HEADER.size)
+        temp_path = self.path + '.new'
+        with open(temp_path, 'wb') as fileobj:
+            fileobj.write(HEADER.pack(STATE_TABLE_MAGIC, STATE_TABLE_VERSION, STATE_LIVE, len(encoded)))
+            fileobj.write(encoded)
+            fileobj.truncate(size)
+        with open(temp_path, 'r+b') as fileobj:
+            new_mmap = mmap.mmap(fileobj.fileno(), size)
+        sections = {section: (offset, count) for section, (offset, count, _) in directory.items()}
+        if keep_states and self.mmap is not None:
+            # Nobody reads the new file yet so no need for the seqlock
+            for section, (old_offset, old_count) in self.sections.items():
+                if section not in sections:
+                    continue
+                offset, count = sections[section]
+                length = min(old_count, count) * SLOT.size
+                new_mmap[offset:offset + length] = self.mmap[old_offset:old_offset + length]
+        os.replace(temp_path, self.path)
+        if self.mmap is not None:
+            self.mark_stale()
+            self.mmap.close()
+        self.mmap = new_mmap
+        self.sections = sections
+
+    def rebuild(self, device_config_map):
+        """New table for the reloaded config, keeps the states of the indices that still exist"""
+        self.device_config_map = device_config_map
+        self.create(keep_states=True)
+
+    def mark_stale(self):
+        """Tell the readers of the current file to reopen"""
+        if self.mmap is None:
+            return
+        HEADER.pack_into(self.mmap, 0, STATE_TABLE_MAGIC, STATE_TABLE_VERSION, STATE_STALE,
+                         HEADER.unpack_from(self.mmap, 0)[3])
+
+    def set(self, section, idx, value, changed):
+        """Write one slot"""
+        offset, count = self.sections[section]
+        if idx >= count:
+            raise IndexError('No index {} in {}'.format(idx, section))
+        offset += idx * SLOT.size
+        seq = SEQLOCK.unpack_from(self.mmap, offset)[0]
+        SEQLOCK.pack_into(self.mmap, offset, (seq + 1) & SEQLOCK_MASK)
+        SLOT_DATA.pack_into(self.mmap, offset + SEQLOCK.size, value, changed)
+        # The counter wraps around to an even value so the parity still tells, but 0 means never written
+        SEQLOCK.pack_into(self.mmap, offset, (seq + 2) & SEQLOCK_MASK or 2)
+
+    def update(self, section, idx, value, status_age_ms=None):
+        """Write the value, for status reports only if it differs (or the slot has never been written)"""
+        offset, count = self.sections.get(section, (None, 0))
+        if idx >= count:
+            return
+        now = time.time()
+        if status_age_ms is not None:
+            seq, old_value, _ = SLOT.unpack_from(self.mmap, offset + idx * SLOT.size)
+            if seq and old_value == value:
+                return
+            now -= status_age_ms / 1000
+        self.set(section, idx, value, now)
+
+    def update_from_event(self, event):
+        """Write the state the event tells"""
+        status_age_ms = None
+        if isinstance(event, Status):
+            status_age_ms = event.reported_ms or 0
+        if isinstance(event, PCA9535WordEvent):
+            for idx, state in event.pin_states(self.device_config_map):
+                self.update('pca9535_inputs', idx, int(state), status_age_ms)
+            return
+        if isinstance(event, AnalogPinEvent):
+            self.update(event._configkey, event.idx, event.value, status_age_ms)  # pylint: disable=W0212
+            return
+        self.update(event._configkey, event.idx, int(event.state), status_age_ms)  # pylint: disable=W0212
+
+    def close(self, remove=False):
+        """Mark the table stale for the readers and unmap it"""
+        if self.mmap is None:
+            return
+        self.mark_stale()
+        self.mmap.close()
+        self.mmap = None
+        if remove:
+            os.unlink(self.path)
+
+
+class StateTableReader:
+    """The reading side, for any local process
+
+        reader = StateTableReader(state_table_path(STATE_TABLE_DIR, 'rod_control_panel'))
+        value, changed = reader.read('analog_in_pins', 0)
+        snapshot = reader.snapshot()
+
+    Each slot is read consistently, a snapshot is not one atomic read of the whole table"""
+    mmap = None
+
+    def __init__(self, path):
+        self.path = path
+        self.sections = {}  # section: (offset, count)
+        self.aliases = {}  # alias: (section, idx)
+        self.open()
+
+    def __str__(self):
+        return '<{}(path={})>'.format(self.__class__.__name__, self.path)
+
+    def __repr__(self):
+        return str(self)
+
+    def open(self):
+        """(Re)open the table and read the directory"""
+        self.close()
+        with open(self.path, 'rb') as fileobj:
+            self.mmap = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, directory_length = HEADER.unpack_from(self.mmap, 0)
+        if magic != STATE_TABLE_MAGIC or version != STATE_TABLE_VERSION:
+            self.close()
+            raise ValueError('{} is not a version {} state table'.format(self.path, STATE_TABLE_VERSION))
+        directory = json.loads(self.mmap[HEADER.size:HEADER.size + directory_length].decode('utf-8'))
+        self.sections = {}
+        self.aliases = {}
+        for section, (offset, count, aliases) in directory.items():
+            self.sections[section] = (offset, count)
+            for idx, alias in enumerate(aliases):
+                if alias is not None:
+                    self.aliases[alias] = (section, idx)
+
+    @property
+    def stale(self):
+        """Has the writer replaced or closed the table"""
+        return HEADER.unpack_from(self.mmap, 0)[2] != STATE_LIVE
+
+    def refresh(self):
+        """Reopen if the table is stale, returns True if it was"""
+        if not self.stale:
+            return False
+        self.open()
+        return True
+
+    def read_slot(self, offset):
+        """Returns (value, changed) once the writer is not in the middle of writing the slot"""
+        started = time.monotonic()
+        while True:
+            seq, value, changed = SLOT.unpack_from(self.mmap, offset)
+            if seq & 1 or SEQLOCK.unpack_from(self.mmap, offset)[0] != seq:
+                if time.monotonic() - started > READ_TIMEOUT:
+                    break
+                time.sleep(0)
+                continue
+            if not seq:
+                # Never written, no state received yet
+                return None, None
+            return value, changed
+        raise TransportError('Could not read slot at {} in {}'.format(offset, self.path))
+
+    def read(self, section, idx):
+        """Returns (value, time.time() of the last change), (None, None) if the board has not told yet"""
+        offset, count = self.sections[section]
+        if idx >= count:
+            raise IndexError('No index {} in {}'.format(idx, section))
+        return self.read_slot(offset + idx * SLOT.size)
+
+    def read_alias(self, alias):
+        """Like read but by alias"""
+        section, idx = self.aliases[alias]
+        return self.read(section, idx)
+
+    def snapshot(self):
+        """Returns {section: [(value, changed), ...]} of the whole table, reopens first if it's stale"""
+        self.refresh()
+        result = {}
+        for section, (offset, count) in self.sections.items():
+            result[section] = [self.read_slot(offset + idx * SLOT.size) for idx in range(count)]
+        return result
+
+    def close(self):
+        """Unmap the table"""
+        if self.mmap is None:
+            return
+        self.mmap.close()
+        self.mmap = None
@@ -1,27 +1,102 @@
 """Handle serial transport"""
 import asyncio
+import collections
 import logging
+import os
 import re
 import time
 
 import serial
 import serial.threaded
 
+from .capture import (CAPTURE_BINARY_FRAMING, CAPTURE_FROM_DEVICE,
+                      CAPTURE_TO_DEVICE, CaptureWriter)
+from .cmdproxies import JBOL_MANY_MAX_LEDS, JBOLLedProxy, encode_jbol_many
 from .errors import InvalidPacketError, NACKError, TransportError
-from .events import (AnalogPinChange, AnalogPinStatus, PCA9535PinChange,
-                     PCA9535PinStatus, PinChange, PinStatus)
+from .events import AnalogPinChange, PCA9535WordEvent
+from .eventstream import (EVENT_QUEUE_SIZE, OVERFLOW_BLOCK,
+                          OVERFLOW_DROP_OLDEST, EventSubscription)
+from .filters import AnalogInFilter
+from .framing import FRAME_DELIMITER, decode_frame, encode_frame
+from .reports import (ALL_REPORT_SECTIONS, ASCII_REPORT_DECODERS,
+                      BINARY_REPORT_DECODERS, DECODE_ERRORS,
+                      REPORT_SECTION_BITS)
+from .scheduler import CoalescingScheduler
+from .statetable import STATE_TABLE_DIR, StateTable, state_table_path
 
+DEFAULT_BAUDRATE = 115200
 SERIAL_WRITE_TIMEOUT = 0.5
+SERIAL_READ_CHUNK = 4096  # bytes, max read per readiness callback in AsyncSerialTransport
+COMMAND_TIMEOUT = 1.0  # seconds to wait for the command response before giving up
+PIPELINE_DEPTH = 1  # How many commands may wait for their response at the same time
+DEAD_BOARD_TIMEOUT = 15  # seconds, suggested watchdog timeout, the sketch sends PONG every 5s
+RECONNECT_MIN_DELAY = 0.5  # seconds, first reconnect attempt, doubles on each failure
+RECONNECT_MAX_DELAY = 30  # seconds
+BOARD_BOOT_TIMEOUT = 5.0  # seconds to wait for the "Board: <name> ready" banner after reconnect
+OUTAGE_QUEUE_SIZE = 100  # How many commands can wait for the reconnect
+FULL_REPORT_TIMEOUT = 5.0  # seconds, the board answers the "Q" command only after sending the whole report
+TRANSPORT_KWARGS = ('device_name', 'command_timeout', 'pipeline_depth', 'coalesce_outputs', 'binary_framing',
+                    'dead_board_timeout', 'reconnect', 'outage_queue_size', 'analog_filter', 'pca9535_words',
+                    'state_table', 'capture')
+
+# First bytes of the commands the sketch understands, responses start with the same byte
+COMMAND_CHARS = b'PDAJjMWBEwsSFQ'
+# Some commands are echoed back with different command char
+RESPONSE_ECHO_MAP = {
+    ord(b's'): ord(b'S'),
+}
+# Unsolicited messages that could otherwise be mistaken for command responses by the first byte
+REPORT_PREFIXES = (b'CD', b'CA', b'CP', b'CS', b'CW', b'RD', b'RA', b'RP', b'RS', b'RW', b'PONG', b'PANIC', b'DEBUG:',
+                   b'Board: ')
+# The sketch uses Serial.println(0x6) so we get the decimal number, accept the raw bytes too
+ACK_SUFFIXES = (b'\x06', b'6')
+NACK_SUFFIXES = (b'\x15', b'21')
+# Board always boots to ASCII mode, if we see this while in binary framing mode the board has been reset
+BOARD_BANNER_MARKER = b'Board: '
 
 LOGGER = logging.getLogger(__name__)
 BOARD_IDENTIFY_RE = re.compile(rb'^Board: (\w+) \w+')
+BOARD_INITIALIZING_RE = re.compile(rb'Board: (\w+) initializing\r\n')
+
+
+def _set_future_result(future, result):
+    """Resolve the future unless it's already done (timed out or cancelled)"""
+    if not future.done():
+        future.set_result(result)
 
 
 class BaseTransport:
     """Baseclass for tranport layers, abstracts away details, must be subclassed to implement"""
     message_callback = None
     unsolicited_message_callback = None
-    lock = asyncio.Lock()
+    events_callback = None
+    pending_responses = None
+    subscriptions = None
+    command_timeout = COMMAND_TIMEOUT
+    pipeline_depth = PIPELINE_DEPTH
+    window = None
+    loop = None
+    lock = None
+    scheduler = None
+    binary_framing = False
+    threaded_reader = True  # message_received is called from a background thread
+    last_received = None  # time.monotonic() of the latest message from the device
+    output_state = None
+    output_shadow = None
+    outputs_in_flight = None
+    suppressed_count = 0
+    capture = None  # capture.CaptureWriter
+
+    def __init__(self):
+        # (command, future) tuples in the order the commands were written
+        self.pending_responses = collections.deque()
+        self.subscriptions = []
+        # target_key: (proxy, value) of the last acknowledged value for each output
+        self.output_state = collections.OrderedDict()
+        # target_key: encoded command the board is known to have applied, cleared when the board resets
+        self.output_shadow = {}
+        # target_key: number of writes not yet acknowledged
+        self.outputs_in_flight = collections.Counter()
 
     def __str__(self):
         return '<{}(**{})>'.format(self.__class__.__name__, self.__dict__)
@@ -33,14 +108,202 @@ class BaseTransport:
         """Must shutdown all background threads (if any)"""
         raise NotImplementedError()
 
-    async def send_command(self, command):
+    async def send_command(self, command, timeout=None):
         """Sends a complete command to the device, line termination, write timeouts etc are handled by the transport
         note: the transport probably should handle locking transparently using
-        'with (await self.lock):' as context manager"""
+        'async with self.lock:' as context manager (after calling self.bind_loop())"""
         raise NotImplementedError()
 
+    async def ensure_framing(self):
+        """Make sure the framing mode is settled, call before encoding commands since it affects the encoding"""
+        return
+
+    async def wait_online(self):
+        """Wait until the device is reachable, override in transports that can reconnect"""
+        return
+
+    def bind_loop(self):
+        """Make sure loop, lock and window belong to the currently running event loop
+
+        Each transport has its own lock so commands to different boards do not block each other"""
+        loop = asyncio.get_event_loop()
+        if loop is self.loop:
+            return
+        if self.pending_responses:
+            self.fail_pending(TransportError('Event loop changed'))
+        self.loop = loop
+        self.lock = asyncio.Lock()
+        self.window = asyncio.Semaphore(self.pipeline_depth)
+
+    async def set_output(self, proxy, value, force=False):
+        """Encode and send the value for the proxy (via scheduler if set), remember it for reapply_outputs
+
+        Skips the write if the board already has this value (see output_shadow) unless force is set"""
+        self.bind_loop()
+        await self.wait_online()
+        await self.ensure_framing()
+        command = proxy.encode_value(value)
+        key = proxy.target_key(command)
+        if not force and self.shadowed(key, command):
+            return None
+        self.outputs_in_flight[key] += 1
+        try:
+            if self.scheduler is not None:
+                result = await self.scheduler.submit(key, command)
+            else:
+                result = await self.send_command(command)
+        except Exception:
+            # We don't know what the board has now
+            self.output_shadow.pop(key, None)
+            raise
+        finally:
+            self.outputs_in_flight[key] -= 1
+            if not self.outputs_in_flight[key]:
+                del self.outputs_in_flight[key]
+        self.output_shadow[key] = command
+        self.output_state[key] = (proxy, value)
+        return result
+
+    def shadowed(self, key, command):
+        """Does the board already have this command applied (and no other write to the same target is underway)"""
+        if key in self.outputs_in_flight or self.output_shadow.get(key) != command:
+            return False
+        self.suppressed_count += 1
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug('Skipping redundant {}'.format(repr(command)))
+        return True
+
+    def invalidate_shadow(self):
+        """Forget what we know of the board outputs, call when the board has been reset"""
+        self.output_shadow.clear()
+
+    async def set_many(self, proxy_values, force=False):
+        """Set values for many proxies ({proxy: value, ...}) with as few commands as possible
+
+        LEDs on the same JBOL board are combined into one "M" command, rest are sent as separate commands
+        (pipelined if pipeline_depth allows). Bypasses the coalescing scheduler.
+        Values the board already has are skipped unless force is set."""
+        self.bind_loop()
+        await self.wait_online()
+        await self.ensure_framing()
+        jbol_boards = collections.OrderedDict()
+        commands = []
+        targets = {}
+        for proxy, value in proxy_values.items():
+            single_command = proxy.encode_value(value)
+            key = proxy.target_key(single_command)
+            if not force and self.shadowed(key, single_command):
+                continue
+            targets[key] = (proxy, value, single_command)
+            if isinstance(proxy, JBOLLedProxy):
+                jbol_boards.setdefault(proxy.board_idx, []).append((proxy.ledno, value))
+                continue
+            commands.append(single_command)
+        for board_idx, led_values in jbol_boards.items():
+            for start in range(0, len(led_values), JBOL_MANY_MAX_LEDS):
+                commands.append(encode_jbol_many(board_idx, led_values[start:start + JBOL_MANY_MAX_LEDS],
+                                                 self.binary_framing))
+        self.outputs_in_flight.update(targets.keys())
+        try:
+            await asyncio.gather(*(self.send_command(command) for command in commands))
+        except Exception:
+            for key in targets:
+                self.output_shadow.pop(key, None)
+            raise
+        finally:
+            self.outputs_in_flight.subtract(targets.keys())
+            for key in targets:
+                if not self.outputs_in_flight[key]:
+                    del self.outputs_in_flight[key]
+        for key, (proxy, value, single_command) in targets.items():
+            self.output_shadow[key] = single_command
+            self.output_state[key] = (proxy, value)
+
+    def events(self, types=None, aliases=None, maxsize=EVENT_QUEUE_SIZE, policy=OVERFLOW_DROP_OLDEST):
+        """Subscribe to events: async for event in transport.events(types=(PinChange,), aliases=('button1',))
+
+        Each subscription has its own queue of maxsize events, see eventstream for the overflow policies"""
+        self.bind_loop()
+        subscription = EventSubscription(self, types, aliases, maxsize, policy)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove the subscription, use subscription.close() instead of calling this directly"""
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+        self.subscription_drained()
+
+    def emit_event(self, event):
+        """Pass the event to events_callback and the subscriptions, may be called from a background thread"""
+        if self.events_callback is None and not self.subscriptions:
+            LOGGER.warning('Got event {} but no callback'.format(event))
+            return
+        if self.events_callback is not None:
+            self.events_callback(event)  # pylint: disable=E1102
+        if not self.subscriptions:
+            return
+        if self.threaded_reader:
+            self.loop.call_soon_threadsafe(self.publish_event, event)
+        else:
+            self.publish_event(event)
+
+    def publish_event(self, event):
+        """Queue the event to the subscriptions that want it, called in the event loop
+
+        A full OVERFLOW_BLOCK subscription holds the events in its own overflow, the others keep receiving
+        and the port is still read so command responses keep coming"""
+        blocked = False
+        for subscription in self.subscriptions:
+            if subscription.wants(event):
+                subscription.deliver(event)
+                if subscription.policy == OVERFLOW_BLOCK and subscription.full:
+                    blocked = True
+        if blocked:
+            self.pause_reading()
+
+    def subscription_drained(self):
+        """Resume when no blocking subscription is full anymore"""
+        for subscription in self.subscriptions:
+            if subscription.policy == OVERFLOW_BLOCK and subscription.full:
+                return
+        self.resume_reading()
+
+    def pause_reading(self):
+        """A blocking subscription is full, override in subclasses that can hold their input without losing
+        command responses (ReplayTransport)"""
+        return
+
+    def resume_reading(self):
+        """Counterpart of pause_reading"""
+        return
+
+    def close_subscriptions(self):
+        """End iteration for all subscribers"""
+        for subscription in list(self.subscriptions):
+            subscription.close()
+
+    def is_response(self, message):  # pylint: disable=W0613,R0201
+        """Tells if the message is a command response, override in subclasses that know the protocol"""
+        return True
+
+    def response_matches(self, command, response):  # pylint: disable=W0613,R0201
+        """Tells if the response belongs to the command, override in subclasses that know the protocol"""
+        return True
+
     def message_received(self, message):
-        """Passes the message to the callback expecting it, or to the unsolicited callback"""
+        """Passes the message to the future or callback expecting it, or to the unsolicited callback
+
+        May be called from a background thread, futures are resolved in their own loop"""
+        self.last_received = time.monotonic()
+        if self.capture is not None:
+            self.capture.write(CAPTURE_BINARY_FRAMING if self.binary_framing else CAPTURE_FROM_DEVICE, message)
+        if self.pending_responses and self.is_response(message):
+            if self.threaded_reader:
+                self.loop.call_soon_threadsafe(self.response_received, message)
+            else:
+                self.response_received(message)
+            return
         if self.message_callback is not None:
             self.message_callback(message)  # pylint: disable=E1102
             self.message_callback = None
@@ -51,26 +314,101 @@ class BaseTransport:
             return
         LOGGER.warning("Got unsolicited message but have no callback to send it to")
 
+    def response_received(self, message):
+        """Resolve the oldest pending command the response matches, called in the event loop
+
+        Commands written before the matching one have lost their responses, those get TransportError"""
+        for position, (command, _) in enumerate(self.pending_responses):
+            if self.response_matches(command, message):
+                break
+        else:
+            LOGGER.warning('Response {} does not match any pending command'.format(repr(message)))
+            return
+        for _ in range(position):
+            command, future = self.pending_responses.popleft()
+            if not future.done():
+                future.set_exception(TransportError('Response lost, command was {}'.format(repr(command))))
+        _, future = self.pending_responses.popleft()
+        _set_future_result(future, message)
+
+    def fail_pending(self, exc):
+        """Fail all commands still waiting for response with the given exception"""
+        while self.pending_responses:
+            _, future = self.pending_responses.popleft()
+            if not future.done():
+                future.set_exception(exc)
+
 
 class SerialProtocol(serial.threaded.Packetizer):
-    """Handle the serial io"""
+    """Handle the serial io, CRLF terminated lines or binary frames (see framing module)"""
 
     TERMINATOR = b'\r\n'
+    binary = False
+    lost_callback = None
+    initial_data = b''
 
     def connection_made(self, transport):
-        """Overridden to make sure we have write_timeout set"""
+        """Overridden to make sure we have write_timeout set, handles initial_data before the first read"""
         super().connection_made(transport)
         # Make sure we have a write timeout of expected size
         self.transport.write_timeout = SERIAL_WRITE_TIMEOUT
+        if self.initial_data:
+            data, self.initial_data = self.initial_data, b''
+            self.data_received(data)
+
+    def data_received(self, data):
+        """Split the data to packets by the current framing mode"""
+        self.buffer.extend(data)
+        while True:
+            if self.binary:
+                terminator = FRAME_DELIMITER
+                banner_at = self.buffer.find(BOARD_BANNER_MARKER)
+                delimiter_at = self.buffer.find(terminator)
+                if banner_at >= 0 and (delimiter_at < 0 or banner_at < delimiter_at):
+                    LOGGER.info('Board was reset, back to ASCII mode')
+                    self.binary = False
+                    del self.buffer[:banner_at]
+                    continue
+            else:
+                terminator = self.TERMINATOR
+            if terminator not in self.buffer:
+                return
+            packet, self.buffer = self.buffer.split(terminator, 1)
+            if self.binary:
+                try:
+                    packet = decode_frame(packet)
+                except InvalidPacketError as exc:
+                    LOGGER.warning('Dropping invalid frame: {}'.format(exc))
+                    continue
+            packet = bytes(packet)
+            self.update_framing(packet)
+            self.handle_packet(packet)
+
+    def update_framing(self, packet):
+        """Switch framing mode when the board acknowledges the "F" command, the ACK uses the old mode"""
+        if packet[0:1] != b'F' or not packet.endswith(ACK_SUFFIXES):
+            return
+        self.binary = packet[1:2] == b'1'
+        LOGGER.info('Binary framing is now {}'.format(self.binary))
 
     def handle_packet(self, packet):
         raise TransportError("This should have been overloaded by SerialTransport")
 
+    def connection_lost(self, exc):
+        """Tell the transport instead of raising exc in the reader thread, exc is None on normal close"""
+        self.transport = None
+        if self.lost_callback is not None:
+            self.lost_callback(exc)  # pylint: disable=E1102
+
     def write_packet(self, packet):
         """Sanity-check and write the packet"""
         if not isinstance(packet, bytes):
             raise InvalidPacketError('Packet has wrong type: {}'.format(type(packet)))
 
+        if self.binary:
+            self.transport.write(encode_frame(packet))
+            return
+
         if b'\r'in packet or b'\n' in packet:
             raise InvalidPacketError('Packet contains line ending characters')
 
@@ -80,25 +418,195 @@ class SerialProtocol(serial.threaded.Packetizer):
 class SerialTransport(BaseTransport):
     """Uses PySerials ReaderThread in the background to save us some pain"""
     serialhandler = None
-    events_callback = None
     device_name = None
     command_wait_response = True
+    binary_framing_requested = False
+    framing_attempted = False
+    reconnect_binary = False  # Framing the board was in when the connection was lost
+    dead_board_timeout = None
+    reconnect = False
+    outage_queue_size = OUTAGE_QUEUE_SIZE
+    outage_waiting = 0
+    closed = False
+    online = None
+    board_ready = None
+    watchdog_task = None
+    reconnect_task = None
+    analog_filter = None
+    pca9535_words = False
+    state_table_dir = None
+    state_table = None
+    initial_data = b''  # Already read from the port (see manager.probe_port), parsed before anything else
 
-    def __init__(self, serial_device, device_config_map, *args, **kwargs):
+    def __init__(self, serial_device, device_config_map, *args, **kwargs):  # pylint: disable=R0912
         self.device_config_map = device_config_map
         self.update_proxy_transports(self.device_config_map)
-        self.serialhandler = serial.threaded.ReaderThread(serial_device, SerialProtocol)
-        self.serialhandler.start()
-        self.serialhandler.protocol.handle_packet = self.message_received
         self.unsolicited_message_callback = self.parse_report
         if 'device_name' in kwargs:
             self.device_name = kwargs.pop('device_name')
+        if 'command_timeout' in kwargs:
+            self.command_timeout = kwargs.pop('command_timeout')
+        if 'pipeline_depth' in kwargs:
+            self.pipeline_depth = kwargs.pop('pipeline_depth')
+        if kwargs.pop('coalesce_outputs', False):
+            self.scheduler = CoalescingScheduler(self)
+        if 'binary_framing' in kwargs:
+            self.binary_framing_requested = kwargs.pop('binary_framing')
+        if 'dead_board_timeout' in kwargs:
+            self.dead_board_timeout = kwargs.pop('dead_board_timeout')
+        if 'reconnect' in kwargs:
+            self.reconnect = kwargs.pop('reconnect')
+        if 'outage_queue_size' in kwargs:
+            self.outage_queue_size = kwargs.pop('outage_queue_size')
+        if kwargs.pop('analog_filter', False):
+            self.analog_filter = AnalogInFilter(self)
+        if 'pca9535_words' in kwargs:
+            self.pca9535_words = kwargs.pop('pca9535_words')
+        state_table_dir = kwargs.pop('state_table', None)
+        if state_table_dir is True:
+            state_table_dir = STATE_TABLE_DIR
+        if state_table_dir:
+            self.state_table_dir = state_table_dir
+        self.initial_data = kwargs.pop('initial_data', None) or b''
+        capture_path = kwargs.pop('capture', None)
+        if capture_path:
+            self.capture = CaptureWriter(capture_path)
         super().__init__(*args, **kwargs)
+        self.start_reader(serial_device)
+
+    def start_reader(self, serial_device):
+        """Start reading the port in the background"""
+        self.last_received = time.monotonic()
+        self.serialhandler = serial.threaded.ReaderThread(serial_device, self.protocol_factory)
+        self.serialhandler.start()
+
+    def protocol_factory(self):
+        """Create the protocol with our packet handler in place before the reader thread gets any data"""
+        protocol = SerialProtocol()
+        protocol.handle_packet = self.message_received
+        protocol.lost_callback = self.reader_lost
+        # Only for the first reader, a reconnect starts from scratch
+        protocol.initial_data, self.initial_data = self.initial_data, b''
+        # The board keeps its framing over a reconnect unless it resets, the banner switches back to ASCII
+        protocol.binary = self.reconnect_binary
+        return protocol
+
+    def bind_loop(self):
+        """Loop bound state for the watchdog and reconnects too"""
+        if asyncio.get_event_loop() is self.loop:
+            return
+        super().bind_loop()
+        self.online = asyncio.Event()
+        if self.reconnect_task is None:
+            self.online.set()
+        self.board_ready = asyncio.Event()
+        if self.dead_board_timeout and not self.closed:
+            self.watchdog_task = asyncio.ensure_future(self.watchdog())
+
+    def reader_lost(self, exc):
+        """The reader stopped, exc is None if we closed it ourselves. May be called from the reader thread"""
+        if exc is None or self.closed:
+            return
+        if self.loop is None:
+            LOGGER.error('{} lost connection before it was used: {}'.format(self, exc))
+            return
+        if self.threaded_reader:
+            self.loop.call_soon_threadsafe(self.connection_lost, exc)
+        else:
+            self.connection_lost(exc)
+
+    def connection_lost(self, exc):
+        """Fail whatever was waiting for responses, start reconnecting if enabled, called in the event loop"""
+        LOGGER.error('{} connection lost: {}'.format(self, exc))
+        self.invalidate_shadow()
+        self.reconnect_binary = self.binary_framing
+        # Negotiate again (if requested) once the port is back, before reapply_outputs and the queued commands
+        self.framing_attempted = False
+        self.fail_pending(TransportError('Connection lost: {}'.format(exc)))
+        if not self.reconnect or self.closed:
+            self.close_subscriptions()
+            return
+        if self.reconnect_task is not None:
+            return
+        self.online.clear()
+        self.reconnect_task = asyncio.ensure_future(self.reconnect_port())
+
+    async def watchdog(self):
+        """Consider the connection lost if we have not heard from the board in dead_board_timeout seconds
+
+        Any message counts, the sketch sends PONG every ARDUBUS_REPORT_INTERVAL"""
+        while not self.closed:
+            await asyncio.sleep(self.dead_board_timeout / 4)
+            if self.reconnect_task is not None:
+                continue
+            silent_for = time.monotonic() - self.last_received
+            if silent_for > self.dead_board_timeout:
+                self.serialhandler.close()
+                self.connection_lost(TransportError('No messages for {:.1f}s'.format(silent_for)))
+
+    async def reconnect_port(self):
+        """Reopen the port with exponential backoff, reapply outputs and let the queued commands through"""
+        serial_device = self.serialhandler.serial
+        attempt = 0
+        try:
+            while not self.closed:
+                await asyncio.sleep(min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** attempt))
+                attempt += 1
+                try:
+                    self.close_reader()
+                    serial_device.open()
+                    self.board_ready.clear()
+                    self.start_reader(serial_device)
+                except (serial.SerialException, OSError) as exc:
+                    LOGGER.warning('{} reconnect attempt {} failed: {}'.format(self, attempt, exc))
+                    continue
+                LOGGER.info('{} reconnected after {} attempts'.format(self, attempt))
+                break
+            if self.closed:
+                return
+            try:
+                # Opening the port usually resets the board
+                await asyncio.wait_for(self.board_ready.wait(), BOARD_BOOT_TIMEOUT)
+            except asyncio.TimeoutError:
+                LOGGER.info('{} did not reset on reconnect'.format(self))
+            await self.reapply_outputs()
+        finally:
+            self.reconnect_task = None
+            self.online.set()
+
+    def close_reader(self):
+        """Close the reader and the port, ignoring errors from an already broken port"""
+        try:
+            self.serialhandler.close()
+        except (serial.SerialException, OSError) as exc:
+            LOGGER.debug('Error closing {}: {}'.format(self, exc))
+
+    async def reapply_outputs(self):
+        """Send the last acknowledged value of each output again, after the board has been reset"""
+        if not self.output_state:
+            return
+        LOGGER.info('{} reapplying {} outputs'.format(self, len(self.output_state)))
+        await self.ensure_framing()
+        for key in list(self.output_state.keys()):
+            proxy, value = self.output_state[key]
+            command = proxy.encode_value(value)
+            try:
+                await self.send_command(command, wait_online=False)
+            except TransportError as exc:
+                LOGGER.warning('{} could not reapply {}: {}'.format(self, proxy, exc))
+                continue
+            self.output_shadow[key] = command
 
     def __str__(self):
         return '<{}(name={}, port={})>'.format(self.__class__.__name__, self.device_name,
                                                self.serialhandler.serial.port)
 
+    @property
+    def binary_framing(self):
+        """Is the binary framing currently in use"""
+        protocol = self.serialhandler.protocol
+        return protocol is not None and protocol.binary
+
     def update_proxy_transports(self, config_level):
         """recursively Add transport to proxies that are missing it"""
         if isinstance(config_level, dict):
@@ -119,16 +627,59 @@ class SerialTransport(BaseTransport):
         # PONDER: Do we have other iterable types we need to consider ??
         return
 
-    def parse_report(self, input_buffer):  # pylint: disable=R0911,R0912
+    def parse_report(self, input_buffer):
         """Parses the unsolicited reports, sends events to callback"""
-        event = None
-        LOGGER.debug('got {}'.format(repr(input_buffer)))
-
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug('got {}'.format(repr(input_buffer)))
         if not input_buffer:
             # Empty buffer, skip
             return
-        if input_buffer.startswith(b'DEBUG:'):
-            # It's logged above anyway
+        if self.binary_framing:
+            decoder = BINARY_REPORT_DECODERS.get(input_buffer[0:2])
+        else:
+            decoder = ASCII_REPORT_DECODERS.get(input_buffer[0:2])
+        if decoder is None:
+            self.parse_other(input_buffer)
+            return
+        try:
+            event = decoder(self.device_config_map, input_buffer)
+        except DECODE_ERRORS:
+            LOGGER.error('Could not parse packet: {}'.format(repr(input_buffer)))
+            return
+        if self.state_table_dir is not None:
+            self.update_state_table(event)
+        if self.analog_filter is not None and isinstance(event, AnalogPinChange) \
+                and not self.analog_filter.passes(event):
+            return
+        if isinstance(event, PCA9535WordEvent) and not self.pca9535_words:
+            # Bitmask report from ARDUBUS_PCA9535_IN_BITMASK sketch, pass on as the usual per-pin events
+            for pin_event in event.pin_events(self.device_config_map):
+                self.emit_event(pin_event)
+        else:
+            self.emit_event(event)
+
+    def update_state_table(self, event):
+        """Write the event to the shared memory table, (re)creates the table when the device config has changed"""
+        table = self.state_table
+        if table is None or table.device_config_map is not self.device_config_map:
+            path = state_table_path(self.state_table_dir, self.device_name)
+            try:
+                if table is None:
+                    table = self.state_table = StateTable(path, self.device_config_map)
+                else:
+                    table.rebuild(self.device_config_map)
+            except OSError as exc:
+                LOGGER.error('Could not create state table {}, disabling it: {}'.format(path, repr(exc)))
+                self.state_table_dir = None
+                self.state_table = None
+                return
+            LOGGER.info('{} writing input states to {}'.format(self, path))
+        table.update_from_event(event)
+
+    def parse_other(self, input_buffer):
+        """Handle the messages that are not input reports"""
+        if input_buffer.startswith((b'DEBUG:', b'PONG')):
+            # DEBUG is logged in parse_report anyway
             return
         # Get the device name
         if input_buffer.startswith(b'Board: '):
@@ -140,87 +691,358 @@ class SerialTransport(BaseTransport):
             if self.device_name and self.device_name != new_name:
                 LOGGER.warning('We had device_name "{}" but got "{}" from buffer'.format(self.device_name, new_name))
             self.device_name = new_name
+            # Board was reset to ASCII mode, negotiate framing again on next command
+            self.framing_attempted = False
+            if input_buffer.endswith(b' initializing'):
+                if self.loop is not None:
+                    self.loop.call_soon_threadsafe(self.board_reset_started)
+                else:
+                    self.board_reset_started()
+            if input_buffer.endswith(b' ready') and self.loop is not None:
+                self.loop.call_soon_threadsafe(self.board_reset_done)
+            return
+        if input_buffer.startswith(b'PANIC'):
+            LOGGER.error('{} panicked: {}'.format(self, repr(input_buffer)))
             return
+        if input_buffer[0] in COMMAND_CHARS:
+            # Command status that we missed
+            LOGGER.debug('Missed command (n)ack {}'.format(repr(input_buffer)))
+            if input_buffer.endswith(NACK_SUFFIXES):
+                LOGGER.warning('Missed command NACK {}'.format(repr(input_buffer)))
+            return
+        LOGGER.error('Could not parse packet: {}'.format(repr(input_buffer)))
 
-        if input_buffer[0:2] == b'CP':
-            event = PCA9535PinChange(self.device_config_map, idx=input_buffer[2],
-                                     state=bool(int(chr(input_buffer[3]))))
+    def board_reset_started(self):
+        """Board has printed the initializing banner, what we knew of its state is gone"""
+        self.invalidate_shadow()
+        if self.analog_filter is not None:
+            self.analog_filter.reset()
 
-        if input_buffer[0:2] == b'CD':
-            event = PinChange(self.device_config_map, idx=input_buffer[2],
-                              state=bool(int(chr(input_buffer[3]))))
+    def board_reset_done(self):
+        """Board has printed the ready banner, reapply the outputs unless the reconnect handles it"""
+        self.board_ready.set()
+        if self.reconnect_task is None and self.output_state:
+            asyncio.ensure_future(self.reapply_outputs())
 
-        if input_buffer[0:2] == b'CA':
-            event = AnalogPinChange(self.device_config_map, idx=input_buffer[2],
-                                    value=int(input_buffer[3:7], 16))
+    def is_response(self, message):
+        """Command responses start with the command char, reports have their own prefixes"""
+        if not message or message.startswith(REPORT_PREFIXES):
+            return False
+        return message in NACK_SUFFIXES or message[0] in COMMAND_CHARS
 
-        if input_buffer[0:2] == b'RP':
-            event = PCA9535PinStatus(self.device_config_map, idx=input_buffer[2],
-                                     state=bool(int(chr(input_buffer[3]))), reported_ms=int(input_buffer[4:12], 16))
+    def response_matches(self, command, response):
+        """The sketch echoes the command char back, bare NACK is sent when the command buffer overflows"""
+        if response in NACK_SUFFIXES:
+            return True
+        return response[0] == RESPONSE_ECHO_MAP.get(command[0], command[0])
 
-        if input_buffer[0:2] == b'RD':
-            event = PinStatus(self.device_config_map, idx=input_buffer[2],
-                              state=bool(int(chr(input_buffer[3]))), reported_ms=int(input_buffer[4:12], 16))
+    async def send_command(self, command, timeout=None, wait_online=True):
+        """Wrapper for write_line on the protocol with some sanity checks
 
-        if input_buffer[0:2] == b'RA':
-            event = AnalogPinStatus(self.device_config_map, idx=input_buffer[2],
-                                    value=int(input_buffer[3:7], 16), reported_ms=int(input_buffer[6:15], 16))
+        Up to self.pipeline_depth commands can be waiting for their responses at the same time,
+        responses are matched to the commands in the order they were written.
 
-        if input_buffer[0] in b'PDAJjWBEwsS':
-            # Command status that we missed
-            LOGGER.debug('Missed command (n)ack {}'.format(repr(input_buffer)))
-            if input_buffer[-1] == 21:
-                LOGGER.warning('Missed command NACK {}'.format(repr(input_buffer)))
-            return
+        While reconnecting up to self.outage_queue_size commands wait for the connection to come back.
 
-        if event is None:
-            LOGGER.error('Could not parse packet: {}'.format(repr(input_buffer)))
+        Waits for the response up to timeout (or self.command_timeout) seconds, raises TransportError on timeout"""
+        if timeout is None:
+            timeout = self.command_timeout
+        self.bind_loop()
+        if wait_online:
+            await self.wait_online()
+        if self.closed or not self.serialhandler or not self.serialhandler.is_alive():
+            raise TransportError('Serial handler not ready')
+        await self.ensure_framing()
+        if not self.command_wait_response:
+            async with self.lock:
+                self.write_packet(command)
             return
-        if self.events_callback is None:
-            LOGGER.warning('Got event {} but no callback'.format(event))
+
+        async with self.window:
+            async with self.lock:
+                response_future = self.write_command(command)
+            try:
+                response = await asyncio.wait_for(response_future, timeout)
+            except asyncio.TimeoutError:
+                raise TransportError('No response in {}s, command was {}'.format(timeout, repr(command)))
+            finally:
+                self.discard_pending(command, response_future)
+        LOGGER.debug('response is: {}'.format(response))
+        # Parse response
+        if response.endswith(NACK_SUFFIXES):
+            raise NACKError('Got explicit NACK, command was {}'.format(repr(command)))
+        if not response.endswith(ACK_SUFFIXES):
+            raise NACKError('Did not get ACK, command was {}'.format(repr(command)))
+
+    async def wait_online(self):
+        """Wait for the reconnect to finish, raises TransportError if too many are waiting already"""
+        if self.online.is_set():
             return
-        self.events_callback(event)  # pylint: disable=E1102
-        return
+        if self.outage_waiting >= self.outage_queue_size:
+            raise TransportError('{} is offline and {} commands are already waiting'.format(
+                self, self.outage_waiting))
+        self.outage_waiting += 1
+        try:
+            await self.online.wait()
+        finally:
+            self.outage_waiting -= 1
 
-    async def send_command(self, command):
-        """Wrapper for write_line on the protocol with some sanity checks"""
-        if not self.serialhandler or not self.serialhandler.is_alive():
+    def write_command(self, command):
+        """Write the command and queue future for the response, caller must hold self.lock"""
+        response_future = self.loop.create_future()
+        # Queue before writing, the response may arrive before write returns
+        self.pending_responses.append((command, response_future))
+        try:
+            self.write_packet(command)
+        except Exception:
+            self.pending_responses.remove((command, response_future))
+            raise
+        return response_future
+
+    def discard_pending(self, command, response_future):
+        """Forget the command if it's still waiting (timed out or cancelled), its late response is then unsolicited
+
+        Otherwise the next command with the same command char would get that response and lose its own"""
+        try:
+            self.pending_responses.remove((command, response_future))
+        except ValueError:
+            # Already resolved
+            pass
+
+    def write_packet(self, packet):
+        """Write via the protocol, raises TransportError if the reader has already stopped"""
+        protocol = self.serialhandler.protocol
+        if protocol is None:
             raise TransportError('Serial handler not ready')
-        with await self.lock:
-            if not self.command_wait_response:
-                self.serialhandler.protocol.write_packet(command)
-                return
+        if self.capture is not None:
+            self.capture.write(CAPTURE_TO_DEVICE | (CAPTURE_BINARY_FRAMING if protocol.binary else 0), packet)
+        protocol.write_packet(packet)
+
+    async def ensure_framing(self):
+        """Negotiate binary framing if requested and not yet tried since the board was reset"""
+        if self.binary_framing_requested and not self.framing_attempted and not self.binary_framing:
+            self.bind_loop()
+            await self.negotiate_framing()
+
+    async def negotiate_framing(self, timeout=None):
+        """Ask the board to switch to binary framing, returns True if it did
+
+        Holds the lock until the board responds so no commands are written in the wrong mode.
+        Boards without ARDUBUS_BINARY_FRAMING do not answer so we stay in ASCII mode"""
+        self.framing_attempted = True
+        if timeout is None:
+            timeout = self.command_timeout
+        self.bind_loop()
+        async with self.lock:
+            response_future = self.write_command(b'F1')
+            try:
+                await asyncio.wait_for(response_future, timeout)
+            except (asyncio.TimeoutError, TransportError):
+                LOGGER.info('{} did not switch to binary framing, staying in ASCII mode'.format(self))
+                return False
+            finally:
+                self.discard_pending(b'F1', response_future)
+        return self.binary_framing
 
-            response = None
-
-            def set_response(message):
-                """Callback for setting the response"""
-                nonlocal response
-                response = message
-            self.message_callback = set_response
-            # FIXME: we have a race condition here with reports and change signals
-            self.serialhandler.protocol.write_packet(command)
-            while response is None:
-                await asyncio.sleep(0)
-            LOGGER.debug('response is: {}'.format(response))
-            # Parse response
-            if response == b'\x15':
-                raise NACKError('Got explicit NACK, command was {}'.format(repr(command)))
-            # until the race condition is fixed this is dangerous
-            # if not response.endswith(b'\x06'):
-            #     raise NACKError('Did not get ACK, command was {}'.format(repr(command)))
+    async def request_report(self, sections=None, timeout=FULL_REPORT_TIMEOUT):
+        """Ask the board for a full report now, returns once the board has sent it
+
+        sections is an iterable of devices.yml section names (see reports.REPORT_SECTION_BITS), default all.
+        The report lines come as the usual *Status events, also when the periodic report is disabled
+        with report_interval_ms: 0 in devices.yml"""
+        if sections is None:
+            mask = ALL_REPORT_SECTIONS
+        else:
+            mask = 0
+            for section in sections:
+                if section not in REPORT_SECTION_BITS:
+                    raise ValueError('Unknown report section {}'.format(section))
+                mask |= REPORT_SECTION_BITS[section]
+        await self.send_command(b'Q%04X' % mask, timeout=timeout)
 
     async def quit(self):
         """Closes the port and background threads"""
-        self.serialhandler.close()
+        self.closed = True
+        for task in (self.watchdog_task, self.reconnect_task):
+            if task is not None:
+                task.cancel()
+        if self.online is not None:
+            # Wake up the commands waiting for reconnect, they will see we're closed
+            self.online.set()
+        # Stop the reader first so no more events come to the closed subscriptions
+        self.close_reader()
+        self.close_subscriptions()
+        if self.state_table is not None:
+            self.state_table.close()
+        if self.capture is not None:
+            self.capture.close()
+        self.fail_pending(TransportError('Transport closed'))
+
+
+class AsyncioSerialReader:
+    """Reads and writes the serial port file descriptor in the event loop, stand-in for ReaderThread
+
+    Needs a port with a real file descriptor (tty, pty), pyserial keeps those in non-blocking mode."""
+    serial = None
+    protocol = None
+    loop = None
+    alive = False
+    lost_callback = None
 
+    def __init__(self, serial_instance, protocol_factory, loop, lost_callback=None):
+        self.serial = serial_instance
+        self.protocol_factory = protocol_factory
+        self.loop = loop
+        self.lost_callback = lost_callback
+        self.write_buffer = bytearray()
+        self.fileno = serial_instance.fileno()
 
-def get(serial_url, device_config_map, **serial_kwargs):
-    """Shorthand for creating the port from url and initializing the transport"""
+    def __str__(self):
+        return '<{}(port={}, alive={})>'.format(self.__class__.__name__, self.serial.port, self.alive)
+
+    def __repr__(self):
+        return str(self)
+
+    def start(self):
+        """Create the protocol and start watching the fd"""
+        self.alive = True
+        self.protocol = self.protocol_factory()
+        self.protocol.connection_made(self)
+        self.loop.add_reader(self.fileno, self.read_ready)
+
+    def is_alive(self):
+        """Same as Thread.is_alive for ReaderThread"""
+        return self.alive
+
+    def move_to_loop(self, loop):
+        """Watch the fd in another event loop, pending writes are kept"""
+        if loop is self.loop:
+            return
+        if self.alive:
+            self.loop.remove_reader(self.fileno)
+            if self.write_buffer:
+                self.loop.remove_writer(self.fileno)
+        self.loop = loop
+        if self.alive:
+            self.loop.add_reader(self.fileno, self.read_ready)
+            if self.write_buffer:
+                self.loop.add_writer(self.fileno, self.write_ready)
+
+    def read_ready(self):
+        """Called by the loop when the fd is readable"""
+        try:
+            data = os.read(self.fileno, SERIAL_READ_CHUNK)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as exc:
+            self.connection_lost(exc)
+            return
+        if not data:
+            self.connection_lost(TransportError('Port closed (EOF)'))
+            return
+        self.protocol.data_received(data)
+
+    def write(self, data):
+        """Write what we can right away, buffer the rest until the fd is writable"""
+        if not self.alive:
+            raise TransportError('Port is closed')
+        if self.write_buffer:
+            self.write_buffer.extend(data)
+            return
+        try:
+            written = os.write(self.fileno, data)
+        except (BlockingIOError, InterruptedError):
+            written = 0
+        except OSError as exc:
+            self.connection_lost(exc)
+            raise TransportError('Write failed: {}'.format(exc))
+        if written < len(data):
+            self.write_buffer.extend(data[written:])
+            self.loop.add_writer(self.fileno, self.write_ready)
+
+    def write_ready(self):
+        """Called by the loop when the fd is writable and we have buffered data"""
+        try:
+            written = os.write(self.fileno, self.write_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as exc:
+            self.connection_lost(exc)
+            return
+        del self.write_buffer[:written]
+        if not self.write_buffer:
+            self.loop.remove_writer(self.fileno)
+
+    def connection_lost(self, exc):
+        """Stop watching the port and let the callback know"""
+        if not self.alive:
+            return
+        LOGGER.error('{} lost connection: {}'.format(self, exc))
+        self.stop()
+        if self.lost_callback is not None:
+            self.lost_callback(exc)  # pylint: disable=E1102
+
+    def stop(self):
+        """Remove the fd from the loop"""
+        if not self.alive:
+            return
+        self.alive = False
+        self.loop.remove_reader(self.fileno)
+        if self.write_buffer:
+            self.loop.remove_writer(self.fileno)
+            self.write_buffer.clear()
+
+    def close(self):
+        """Stop and close the port"""
+        self.stop()
+        self.serial.close()
+
+
+class AsyncSerialTransport(SerialTransport):
+    """Like SerialTransport but reads the port in the event loop instead of a background thread
+
+    Any number of boards can share the one loop thread, but events are only delivered while the loop runs."""
+    threaded_reader = False
+
+    def start_reader(self, serial_device):
+        """Attach to the current event loop"""
+        self.bind_loop()
+        self.last_received = time.monotonic()
+        self.serialhandler = AsyncioSerialReader(serial_device, self.protocol_factory, self.loop,
+                                                 lost_callback=self.reader_lost)
+        self.serialhandler.start()
+
+    def bind_loop(self):
+        """Move the fd watch along when the loop changes"""
+        super().bind_loop()
+        if self.serialhandler is not None:
+            self.serialhandler.move_to_loop(self.loop)
+
+
+def get(serial_url, device_config_map, transport_class=SerialTransport, **serial_kwargs):
+    """Shorthand for creating the port from url and initializing the transport
+
+    Keywords listed in TRANSPORT_KWARGS are passed to the transport, rest to serial_for_url.
+    Use transport_class=AsyncSerialTransport to read the port in the event loop instead of a thread"""
+    transport_kwargs = {}
+    for key in TRANSPORT_KWARGS:
+        if key in serial_kwargs:
+            transport_kwargs[key] = serial_kwargs.pop(key)
     if 'baudrate' not in serial_kwargs:
-        serial_kwargs['baudrate'] = 115200
+        serial_kwargs['baudrate'] = DEFAULT_BAUDRATE
     port = serial.serial_for_url(serial_url, **serial_kwargs)
-    port.setDTR(False)  # Reset the arduino by driving DTR for a moment (RS323 signals are active-low)
+    reset_board(port)
+    return transport_class(port, device_config_map, **transport_kwargs)
+
+
+def reset_board(port):
+    """Reset the arduino by driving DTR for a moment (RS323 signals are active-low)
+
+    Ports without modem lines (ptys, like the emulator uses) are left as is, opening them is the reset"""
+    try:
+        port.setDTR(False)
+    except OSError as exc:
+        LOGGER.debug('Could not drive DTR of {}: {}'.format(port.name, repr(exc)))
+        return
     time.sleep(0.050)
     port.setDTR(True)
-    return SerialTransport(port, device_config_map)
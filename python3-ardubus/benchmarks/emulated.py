@@ -0,0 +1,92 @@
+"""Several emulated boards in ptys, commands and input changes at the same time, reports rates and losses"""
+import asyncio
+import copy
+import logging
+import os
+import sys
+import time
+
+import ardubus_core
+import ardubus_core.deviceconfig
+import ardubus_core.transport
+from ardubus_core.emulator import BoardEmulator, PtyEmulatorServer
+
+DEVICE_CONFIG = {
+    'digital_in_pins': list(range(2, 18)),
+    'analog_in_pins': list(range(54, 62)),
+    'digital_pwmout_pins': [3, 5, 6, 9],
+}
+SETTLE_TIME = 0.5  # seconds for the last changes to arrive
+
+
+async def drive_board(board, commands):
+    """PWM commands one by one"""
+    for num in range(commands):
+        await board.send_command(b'P' + bytes((32 + num % 4, 32 + num % 64)))
+
+
+async def run_benchmark(boards, commands, change_rate):
+    """Start the emulators, time the commands, count the events"""
+    servers = []
+    transports = []
+    counts = [0] * boards
+    for idx in range(boards):
+        name = 'emu{}'.format(idx)
+        server = PtyEmulatorServer(BoardEmulator(name, DEVICE_CONFIG, change_rate=change_rate, seed=idx))
+        server.start()
+        servers.append(server)
+        ardubus_core.deviceconfig.FULL_CONFIG_MAP[name] = copy.deepcopy(DEVICE_CONFIG)
+        transport = ardubus_core.transport.get(server.port, {}, device_name=name)
+        ardubus_core.deviceconfig.normalize_device_config(name, transport)
+        transport.events_callback = lambda event, idx=idx: counts.__setitem__(idx, counts[idx] + 1)
+        transports.append(transport)
+    # Let the boards boot
+    await asyncio.sleep(0.5)
+    counts[:] = [0] * boards
+    started = time.time()
+    await asyncio.gather(*(drive_board(board, commands) for board in transports))
+    elapsed = time.time() - started
+    await asyncio.sleep(SETTLE_TIME)
+    for board in transports:
+        await board.quit()
+    for server in servers:
+        server.stop()
+    return elapsed, sum(counts)
+
+
+def main(boards, commands, change_rate):
+    """Run the benchmark, print results"""
+    ardubus_core.init_logging(logging.ERROR)
+    elapsed, events = asyncio.get_event_loop().run_until_complete(run_benchmark(boards, commands, change_rate))
+    total = boards * commands
+    expected = boards * change_rate * (elapsed + SETTLE_TIME)
+    print('{} boards, {} commands each, {} input changes/second each, {} CPUs'.format(
+        boards, commands, change_rate, os.cpu_count()))
+    print('{} commands in {:.3f}s, {:.0f} commands/second'.format(total, elapsed, total / elapsed))
+    print('{} events, about {:.0f} expected, {:.0f} events/second'.format(
+        events, expected, events / (elapsed + SETTLE_TIME)))
+    return 0
+
+
+def usage():
+    """Show usage"""
+    print("""Usage:
+
+    python3 emulated.py [boards] [commands_per_board] [input_changes_per_second_per_board]
+""")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        usage()
+        sys.exit(1)
+    BOARDS = 4
+    COMMANDS = 2000
+    CHANGE_RATE = 500
+    if len(sys.argv) > 1:
+        BOARDS = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        COMMANDS = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        CHANGE_RATE = float(sys.argv[3])
+    sys.exit(main(BOARDS, COMMANDS, CHANGE_RATE))
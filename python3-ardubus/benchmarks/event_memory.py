@@ -0,0 +1,101 @@
+"""Memory and allocation benchmark, __slots__ events vs the old per-instance dict events"""
+import gc
+import logging
+import sys
+import time
+import tracemalloc
+
+import ardubus_core
+import ardubus_core.deviceconfig
+from ardubus_core.events import AnalogPinChange, PinChange
+
+SYNTHETIC_DEVICE_NAME = 'synthetic_board'
+SYNTHETIC_DEVICE_CONFIG = {
+    'digital_in_pins': [{'pin': pin, 'alias': 'din_{}'.format(pin)} for pin in range(60)],
+    'analog_in_pins': [{'pin': pin, 'alias': 'ain_{}'.format(pin)} for pin in range(16)],
+}
+
+
+# pylint: disable=R0903,C0111
+class LegacyEvent:
+    """The dict based event used before __slots__, for comparison"""
+    alias = None
+    pin = None
+    idx = None
+    _configkey = None
+
+    def __init__(self, device_config_map, idx, **kwargs):
+        self.idx = idx
+        self.__dict__.update(kwargs)
+        if self.alias is None:
+            self.alias, self.pin = device_config_map[ardubus_core.deviceconfig.LOOKUP_KEY][self._configkey][idx]
+
+
+class LegacyPinChange(LegacyEvent):
+    state = False
+    _configkey = 'digital_in_pins'
+
+
+class LegacyAnalogPinChange(LegacyEvent):
+    value = 0
+    _configkey = 'analog_in_pins'
+
+
+def construct_events(device_config_map, pin_class, analog_class, count):
+    """Mostly analog chatter"""
+    events = []
+    for num in range(count):
+        if num % 4:
+            events.append(analog_class(device_config_map, idx=num % 16, value=num % 1024))
+        else:
+            events.append(pin_class(device_config_map, idx=num % 60, state=bool(num % 2)))
+    return events
+
+
+def measure(device_config_map, pin_class, analog_class, count):
+    """Returns (bytes retained per event, peak bytes per event, gc collections, seconds)"""
+    gc.collect()
+    collections_before = sum(stat['collections'] for stat in gc.get_stats())
+    tracemalloc.start()
+    started = time.perf_counter()
+    events = construct_events(device_config_map, pin_class, analog_class, count)
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    collections = sum(stat['collections'] for stat in gc.get_stats()) - collections_before
+    del events
+    return current / count, peak / count, collections, elapsed
+
+
+def main(count=200000):
+    """Run the benchmark, print results"""
+    ardubus_core.init_logging(logging.WARNING)
+    ardubus_core.deviceconfig.FULL_CONFIG_MAP[SYNTHETIC_DEVICE_NAME] = SYNTHETIC_DEVICE_CONFIG
+    ardubus_core.deviceconfig.normalize_device_config(SYNTHETIC_DEVICE_NAME)
+    device_config_map = ardubus_core.deviceconfig.FULL_CONFIG_MAP[SYNTHETIC_DEVICE_NAME]
+
+    print('{} events retained'.format(count))
+    for label, pin_class, analog_class in (('dict events: ', LegacyPinChange, LegacyAnalogPinChange),
+                                           ('slots events:', PinChange, AnalogPinChange)):
+        current, peak, collections, elapsed = measure(device_config_map, pin_class, analog_class, count)
+        print('{} {:.0f} bytes/event retained, {:.0f} bytes/event peak, {} gc runs, {:.0f} events/second'.format(
+            label, current, peak, collections, count / elapsed))
+    return 0
+
+
+def usage():
+    """Show usage"""
+    print("""Usage:
+
+    python3 event_memory.py [count]
+""")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        usage()
+        sys.exit(1)
+    COUNT = 200000
+    if len(sys.argv) > 1:
+        COUNT = int(sys.argv[1])
+    sys.exit(main(COUNT))
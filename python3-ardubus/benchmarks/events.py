@@ -0,0 +1,70 @@
+"""Microbenchmark for event construction, precomputed lookup tables vs walking the device config"""
+import copy
+import logging
+import sys
+import time
+
+import ardubus_core
+import ardubus_core.deviceconfig
+from ardubus_core.events import AnalogPinChange, PinChange, PinStatus
+
+SYNTHETIC_DEVICE_NAME = 'synthetic_board'
+SYNTHETIC_DEVICE_CONFIG = {
+    'digital_in_pins': [{'pin': pin, 'alias': 'din_{}'.format(pin)} for pin in range(60)],
+    'analog_in_pins': [{'pin': pin, 'alias': 'ain_{}'.format(pin)} for pin in range(16)],
+}
+
+
+def construct_events(device_config_map, count):
+    """Mix of the common event types, returns elapsed seconds"""
+    started = time.perf_counter()
+    for num in range(count):
+        kind = num % 4
+        if kind < 2:
+            AnalogPinChange(device_config_map, idx=num % 16, value=num % 1024)
+        elif kind == 2:
+            PinChange(device_config_map, idx=num % 60, state=bool(num % 2))
+        else:
+            PinStatus(device_config_map, idx=num % 60, state=bool(num % 2), reported_ms=num)
+    return time.perf_counter() - started
+
+
+def time_construction(device_config_map, count, rounds):
+    """Returns best events/second over the rounds"""
+    return count / min(construct_events(device_config_map, count) for _ in range(rounds))
+
+
+def main(count=200000, rounds=5):
+    """Run the benchmark, print results"""
+    ardubus_core.init_logging(logging.WARNING)
+    ardubus_core.deviceconfig.FULL_CONFIG_MAP[SYNTHETIC_DEVICE_NAME] = SYNTHETIC_DEVICE_CONFIG
+    ardubus_core.deviceconfig.normalize_device_config(SYNTHETIC_DEVICE_NAME)
+    device_config_map = ardubus_core.deviceconfig.FULL_CONFIG_MAP[SYNTHETIC_DEVICE_NAME]
+    walking_config_map = copy.deepcopy(device_config_map)
+    del walking_config_map[ardubus_core.deviceconfig.LOOKUP_KEY]
+
+    walking_rate = time_construction(walking_config_map, count, rounds)
+    rate = time_construction(device_config_map, count, rounds)
+    print('{} events'.format(count))
+    print('config walk:   {:.0f} events/second ({:.1f}M/minute)'.format(walking_rate, walking_rate * 60 / 1e6))
+    print('lookup tables: {:.0f} events/second ({:.1f}M/minute, {:.2f}x)'.format(
+        rate, rate * 60 / 1e6, rate / walking_rate))
+    return 0
+
+
+def usage():
+    """Show usage"""
+    print("""Usage:
+
+    python3 events.py [count]
+""")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        usage()
+        sys.exit(1)
+    COUNT = 200000
+    if len(sys.argv) > 1:
+        COUNT = int(sys.argv[1])
+    sys.exit(main(COUNT))
@@ -0,0 +1,73 @@
+"""Drive several simulated boards concurrently and report the aggregate command rate"""
+import asyncio
+import logging
+import sys
+import time
+
+import ardubus_core
+import ardubus_core.transport
+
+# The loop:// port echoes back everything we write, using "6" as the PWM value makes the echo a valid ACK
+COMMAND = b'P!6'
+
+
+async def drive_board(board, commands):
+    """Send the commands one by one"""
+    for _ in range(commands):
+        await board.send_command(COMMAND)
+
+
+async def drive_board_pipelined(board, commands):
+    """Send all the commands at once and let the transport window them"""
+    await asyncio.gather(*(board.send_command(COMMAND) for _ in range(commands)))
+
+
+async def run_benchmark(boards, commands, pipeline_depth):
+    """Init the transports and time the concurrent sends"""
+    transports = []
+    for idx in range(boards):
+        transports.append(ardubus_core.transport.get('loop://', {}, device_name='sim{}'.format(idx),
+                                                     pipeline_depth=pipeline_depth))
+    driver = drive_board
+    if pipeline_depth > 1:
+        driver = drive_board_pipelined
+    started = time.time()
+    await asyncio.gather(*(driver(board, commands) for board in transports))
+    elapsed = time.time() - started
+    for board in transports:
+        await board.quit()
+    return elapsed
+
+
+def main(boards, commands, pipeline_depth):
+    """Run the benchmark, print results"""
+    ardubus_core.init_logging(logging.WARNING)
+    elapsed = asyncio.get_event_loop().run_until_complete(run_benchmark(boards, commands, pipeline_depth))
+    total = boards * commands
+    print('{} boards, {} commands each, pipeline_depth={}'.format(boards, commands, pipeline_depth))
+    print('{} commands in {:.3f}s, {:.0f} commands/second'.format(total, elapsed, total / elapsed))
+    return 0
+
+
+def usage():
+    """Show usage"""
+    print("""Usage:
+
+    python3 multiboard.py [boards] [commands_per_board] [pipeline_depth]
+""")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        usage()
+        sys.exit(1)
+    BOARDS = 4
+    COMMANDS = 2000
+    DEPTH = 1
+    if len(sys.argv) > 1:
+        BOARDS = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        COMMANDS = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        DEPTH = int(sys.argv[3])
+    sys.exit(main(BOARDS, COMMANDS, DEPTH))
@@ -0,0 +1,151 @@
+"""Microbenchmark for SerialTransport.parse_report over a packet corpus"""
+import asyncio
+import logging
+import sys
+import time
+
+import serial
+
+import ardubus_core
+import ardubus_core.capture
+import ardubus_core.deviceconfig
+import ardubus_core.transport
+from ardubus_core.events import (AnalogPinChange, AnalogPinStatus,
+                                 PCA9535PinChange, PCA9535PinStatus, PinChange,
+                                 PinStatus)
+
+SYNTHETIC_DEVICE_NAME = 'synthetic_board'
+SYNTHETIC_DEVICE_CONFIG = {
+    'digital_in_pins': [{'pin': pin, 'alias': 'din_{}'.format(pin)} for pin in range(60)],
+    'analog_in_pins': [{'pin': pin, 'alias': 'ain_{}'.format(pin)} for pin in range(4)],
+    'pca9535_inputs': [{'pin': pin, 'alias': 'pin_{}'.format(pin)} for pin in range(8)],
+}
+LOGGER = logging.getLogger('ardubus_core.transport')
+
+
+def synthetic_corpus(count):
+    """Analog chatter with some digital changes and periodic reports mixed in"""
+    packets = []
+    for num in range(count):
+        kind = num % 10
+        if kind < 6:
+            packets.append(b'CA' + bytes([num % 4]) + b'%0.4X' % (num % 1024))
+        elif kind == 6:
+            packets.append(b'CD' + bytes([num % 60]) + (b'1' if num % 2 else b'0'))
+        elif kind == 7:
+            packets.append(b'CP' + bytes([num % 8]) + (b'1' if num % 2 else b'0'))
+        elif kind == 8:
+            packets.append(b'RD' + bytes([num % 60]) + b'1' + b'%0.8X' % num)
+        else:
+            packets.append(b'RA' + bytes([num % 4]) + b'%0.4X' % (num % 1024) + b'%0.8X' % num)
+    return packets
+
+
+def load_corpus(filepath):
+    """Transport capture (see capture option) or raw capture of the serial port (for example
+    cat /dev/ttyUSB0 > capture.bin), split to packets"""
+    if ardubus_core.capture.is_capture(filepath):
+        _, records = ardubus_core.capture.read_capture(filepath)
+        return [packet for _, flags, packet in records
+                if not flags & (ardubus_core.capture.CAPTURE_TO_DEVICE | ardubus_core.capture.CAPTURE_BINARY_FRAMING)]
+    with open(filepath, 'rb') as filepointer:
+        return [packet for packet in filepointer.read().split(b'\r\n') if packet]
+
+
+def legacy_parse_report(transport, input_buffer):  # pylint: disable=R0911,R0912
+    """The if-chain parse_report used before the dispatch tables, for comparison"""
+    event = None
+    LOGGER.debug('got {}'.format(repr(input_buffer)))
+    if not input_buffer:
+        return
+    if input_buffer.startswith(b'DEBUG:'):
+        return
+    if input_buffer.startswith(b'Board: '):
+        return
+    if input_buffer[0:2] == b'CP':
+        event = PCA9535PinChange(transport.device_config_map, idx=input_buffer[2],
+                                 state=bool(int(chr(input_buffer[3]))))
+    if input_buffer[0:2] == b'CD':
+        event = PinChange(transport.device_config_map, idx=input_buffer[2],
+                          state=bool(int(chr(input_buffer[3]))))
+    if input_buffer[0:2] == b'CA':
+        event = AnalogPinChange(transport.device_config_map, idx=input_buffer[2],
+                                value=int(input_buffer[3:7], 16))
+    if input_buffer[0:2] == b'RP':
+        event = PCA9535PinStatus(transport.device_config_map, idx=input_buffer[2],
+                                 state=bool(int(chr(input_buffer[3]))), reported_ms=int(input_buffer[4:12], 16))
+    if input_buffer[0:2] == b'RD':
+        event = PinStatus(transport.device_config_map, idx=input_buffer[2],
+                          state=bool(int(chr(input_buffer[3]))), reported_ms=int(input_buffer[4:12], 16))
+    if input_buffer[0:2] == b'RA':
+        event = AnalogPinStatus(transport.device_config_map, idx=input_buffer[2],
+                                value=int(input_buffer[3:7], 16), reported_ms=int(input_buffer[6:15], 16))
+    if input_buffer[0] in b'PDAJjWBEwsS':
+        return
+    if event is None:
+        return
+    transport.events_callback(event)  # pylint: disable=E1102
+
+
+def time_parsers(parsers, packets, rounds):
+    """Returns best packets/second over the rounds for each parser, the parsers take turns in each round
+    so CPU frequency changes and other noise hit all of them alike"""
+    best = [None] * len(parsers)
+    for _ in range(rounds):
+        for num, parser in enumerate(parsers):
+            started = time.perf_counter()
+            for packet in packets:
+                parser(packet)
+            elapsed = time.perf_counter() - started
+            if best[num] is None or elapsed < best[num]:
+                best[num] = elapsed
+    return [len(packets) / elapsed for elapsed in best]
+
+
+def main(corpusfile=None, configfile=None, device_name=None, count=100000, rounds=10):
+    """Run the benchmark, print results"""
+    ardubus_core.init_logging(logging.WARNING)
+    if configfile:
+        ardubus_core.deviceconfig.load_devices_yml(configfile)
+    else:
+        device_name = SYNTHETIC_DEVICE_NAME
+        ardubus_core.deviceconfig.FULL_CONFIG_MAP[device_name] = SYNTHETIC_DEVICE_CONFIG
+        ardubus_core.deviceconfig.normalize_device_config(device_name)
+    packets = synthetic_corpus(count)
+    if corpusfile:
+        packets = load_corpus(corpusfile)
+    transport = ardubus_core.transport.SerialTransport(serial.serial_for_url('loop://'),
+                                                       ardubus_core.deviceconfig.FULL_CONFIG_MAP[device_name])
+    transport.events_callback = lambda event: None
+    legacy_rate, rate = time_parsers((lambda packet: legacy_parse_report(transport, packet), transport.parse_report),
+                                     packets, rounds)
+    print('{} packets'.format(len(packets)))
+    print('legacy if-chain: {:.0f} packets/second'.format(legacy_rate))
+    print('dispatch table:  {:.0f} packets/second ({:.2f}x)'.format(rate, rate / legacy_rate))
+    asyncio.get_event_loop().run_until_complete(transport.quit())
+    return 0
+
+
+def usage():
+    """Show usage"""
+    print("""Usage:
+
+    python3 parse_report.py [/path/to/capture.bin [/path/to/devices.yml device_name]]
+
+Without arguments uses synthetic corpus and device config
+""")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        usage()
+        sys.exit(1)
+    CORPUSPATH = None
+    CONFIGPATH = None
+    DEVICE_NAME = None
+    if len(sys.argv) > 1:
+        CORPUSPATH = sys.argv[1]
+    if len(sys.argv) > 3:
+        CONFIGPATH = sys.argv[2]
+        DEVICE_NAME = sys.argv[3]
+    sys.exit(main(CORPUSPATH, CONFIGPATH, DEVICE_NAME))
@@ -0,0 +1,90 @@
+"""Throughput of the whole receive path (parse_report, event dispatch, subscriptions) via ReplayTransport"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import ardubus_core
+import ardubus_core.deviceconfig
+from ardubus_core.capture import CAPTURE_FROM_DEVICE, CaptureWriter
+from ardubus_core.replay import REPLAY_AS_FAST_AS_POSSIBLE, ReplayTransport
+from parse_report import (SYNTHETIC_DEVICE_CONFIG, SYNTHETIC_DEVICE_NAME,
+                          synthetic_corpus)
+
+
+def write_synthetic_capture(path, count):
+    """Capture of the synthetic corpus"""
+    writer = CaptureWriter(path)
+    for packet in synthetic_corpus(count):
+        writer.write(CAPTURE_FROM_DEVICE, packet)
+    writer.close()
+
+
+async def replay_rate(capture_path, device_name, subscribers):
+    """Returns (packets/second, events delivered to each subscriber)"""
+    transport = ReplayTransport(capture_path, {}, speed=REPLAY_AS_FAST_AS_POSSIBLE)
+    ardubus_core.deviceconfig.normalize_device_config(device_name, transport)
+    transport.events_callback = lambda event: None
+    counts = [0] * subscribers
+
+    async def consume(num, subscription):
+        async for _ in subscription:
+            counts[num] += 1
+
+    consumers = [asyncio.ensure_future(consume(num, transport.events())) for num in range(subscribers)]
+    started = time.perf_counter()
+    packet_count = await transport.replay()
+    await transport.quit()
+    await asyncio.gather(*consumers)
+    return packet_count / (time.perf_counter() - started), counts
+
+
+def main(capture_path=None, configfile=None, device_name=None, count=100000):
+    """Run the benchmark, print results"""
+    ardubus_core.init_logging(logging.WARNING)
+    temp_path = None
+    if configfile:
+        ardubus_core.deviceconfig.load_devices_yml(configfile)
+    else:
+        device_name = SYNTHETIC_DEVICE_NAME
+        ardubus_core.deviceconfig.FULL_CONFIG_MAP[device_name] = SYNTHETIC_DEVICE_CONFIG
+    if not capture_path:
+        temp_fd, temp_path = tempfile.mkstemp(suffix='.bin')
+        os.close(temp_fd)
+        write_synthetic_capture(temp_path, count)
+        capture_path = temp_path
+    loop = asyncio.get_event_loop()
+    try:
+        for subscribers in (0, 1, 4):
+            rate, counts = loop.run_until_complete(replay_rate(capture_path, device_name, subscribers))
+            print('{} subscribers: {:.0f} packets/second, events per subscriber {}'.format(subscribers, rate, counts))
+    finally:
+        if temp_path:
+            os.unlink(temp_path)
+    return 0
+
+
+def usage():
+    """Show usage"""
+    print("""Usage:
+
+    python3 replay.py [/path/to/capture.bin /path/to/devices.yml device_name]
+
+Without arguments uses synthetic capture and device config
+""")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        usage()
+        sys.exit(1)
+    CAPTUREPATH = None
+    CONFIGPATH = None
+    DEVICE_NAME = None
+    if len(sys.argv) > 3:
+        CAPTUREPATH = sys.argv[1]
+        CONFIGPATH = sys.argv[2]
+        DEVICE_NAME = sys.argv[3]
+    sys.exit(main(CAPTUREPATH, CONFIGPATH, DEVICE_NAME))
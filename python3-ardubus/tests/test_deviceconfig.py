@@ -0,0 +1,38 @@
+"""Tests for the device config normalization, run with pytest from the python3-ardubus directory"""
+import copy
+
+from ardubus_core import deviceconfig
+from ardubus_core.events import AnalogPinChange, PinChange
+
+DEVICE_NAME = 'test_board'
+DEVICE_CONFIG = {
+    'digital_in_pins': {
+        3: {'pin': 7, 'alias': 'door'},
+        1: {'pin': 5, 'alias': 'lid'},
+    },
+    'analog_in_pins': [
+        {'pin': 14, 'alias': 'knob', 'deadband': 4},
+        15,
+    ],
+}
+
+
+def normalized_config():
+    deviceconfig.FULL_CONFIG_MAP[DEVICE_NAME] = copy.deepcopy(DEVICE_CONFIG)
+    deviceconfig.normalize_device_config(DEVICE_NAME)
+    return deviceconfig.FULL_CONFIG_MAP.pop(DEVICE_NAME)
+
+
+def test_lookup_tables_match_config_walk():
+    """Dict sections are indexed by key in the lookup tables too, like the config walk does"""
+    config = normalized_config()
+    walking_config = copy.deepcopy(config)
+    del walking_config[deviceconfig.LOOKUP_KEY]
+    for idx, alias, pin in ((3, 'door', 7), (1, 'lid', 5)):
+        event = PinChange(config, idx=idx, state=True)
+        assert (event.alias, event.pin) == (alias, pin)
+        assert PinChange(walking_config, idx=idx, state=True).alias == alias
+    event = AnalogPinChange(config, idx=0, value=100)
+    assert (event.alias, event.pin) == ('knob', 14)
+    assert AnalogPinChange(config, idx=1, value=100).alias is None
+    assert config[deviceconfig.ANALOG_IN_FILTERS_KEY] == ((4, 0), (0, 0))
@@ -0,0 +1,137 @@
+"""Tests for the transport command/response handling, run with pytest from the python3-ardubus directory"""
+import asyncio
+
+import pytest
+import serial
+
+from ardubus_core import deviceconfig
+from ardubus_core.emulator import BoardEmulator, PtyEmulatorServer
+from ardubus_core.errors import TransportError
+from ardubus_core.events import PinChange
+from ardubus_core.eventstream import OVERFLOW_BLOCK
+from ardubus_core.transport import AsyncSerialTransport, SerialTransport, get
+
+
+class RecordingTransport(SerialTransport):
+    """Records the written packets instead of writing them, responses are fed with message_received"""
+    written = None
+
+    def write_packet(self, packet):
+        if self.written is None:
+            self.written = []
+        self.written.append(packet)
+
+
+@pytest.fixture
+def transport():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    port = serial.serial_for_url('loop://')
+    transport = RecordingTransport(port, {}, device_name='test_board', command_timeout=0.1)
+    yield transport
+    loop.run_until_complete(transport.quit())
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+def test_timeout_does_not_take_next_response(transport):
+    """A timed out command must not get the response of the next command with the same command char"""
+    loop = asyncio.get_event_loop()
+
+    async def lost_then_answered():
+        with pytest.raises(TransportError):
+            await transport.send_command(b'J 7\x01')
+        assert not transport.pending_responses
+        for value in (b'\x02', b'\x03'):
+            command = transport.send_command(b'J 7' + value)
+            task = asyncio.ensure_future(command)
+            while not transport.pending_responses:
+                await asyncio.sleep(0)
+            transport.message_received(b'J 7' + value + b'6')
+            await task
+        assert not transport.pending_responses
+
+    loop.run_until_complete(lost_then_answered())
+    assert transport.written == [b'J 7\x01', b'J 7\x02', b'J 7\x03']
+
+
+def test_full_blocking_subscription_does_not_stop_commands(transport):
+    """Events are held for the full subscription, command responses and other subscriptions still get through"""
+    loop = asyncio.get_event_loop()
+
+    async def blocked():
+        subscription = transport.events(maxsize=2, policy=OVERFLOW_BLOCK)
+        other = transport.events(maxsize=10)
+        for number in range(5):
+            transport.emit_event(number)
+        await asyncio.sleep(0)
+        assert len(subscription.queue) == 2
+        assert len(subscription.overflow) == 3
+        assert list(other.queue) == [0, 1, 2, 3, 4]
+        task = asyncio.ensure_future(transport.send_command(b'D 1'))
+        while not transport.pending_responses:
+            await asyncio.sleep(0)
+        transport.message_received(b'D 16')
+        await task
+        received = []
+        async for event in subscription:
+            received.append(event)
+            if len(received) == 5:
+                break
+        assert received == [0, 1, 2, 3, 4]
+        assert not subscription.overflow
+
+    loop.run_until_complete(blocked())
+
+
+def test_reconnect_keeps_board_framing(transport):
+    """The reader after a reconnect starts in the framing the board was in, until the board prints its banner"""
+    loop = asyncio.get_event_loop()
+
+    async def lost():
+        transport.bind_loop()
+        _, reader_protocol = transport.serialhandler.connect()
+        reader_protocol.binary = True
+        transport.framing_attempted = True
+        transport.connection_lost(TransportError('test'))
+        assert not transport.framing_attempted
+        protocol = transport.protocol_factory()
+        assert protocol.binary
+        protocol.data_received(b'\r\nBoard: test_board initializing\r\n')
+        assert not protocol.binary
+
+    loop.run_until_complete(lost())
+
+
+def test_async_transport_on_emulator_pty():
+    """AsyncSerialTransport reading an emulated board in the event loop gets command ACKs and input events"""
+    device_config = {
+        'digital_out_pins': [{'pin': 13, 'alias': 'led'}],
+        'digital_in_pins': [{'pin': 2, 'alias': 'button'}],
+    }
+    emulator = BoardEmulator('pty_board', device_config, change_rate=20, seed=1)
+    server = PtyEmulatorServer(emulator, boot_delay=0.1)
+    server.start()
+    deviceconfig.FULL_CONFIG_MAP['pty_board'] = device_config
+    deviceconfig.normalize_device_config('pty_board')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    transport = get(server.port, device_config, transport_class=AsyncSerialTransport, command_timeout=1.0)
+
+    async def exercise():
+        await asyncio.wait_for(transport.board_ready.wait(), 2)
+        assert transport.device_name == 'pty_board'
+        subscription = transport.events(types=(PinChange,))
+        # Raises unless the board ACKs
+        await transport.send_command(device_config['digital_out_pins'][0]['PROXY'].encode_value(True))
+        assert emulator.outputs['digital_out_pins'] == {0: True}
+        event = await asyncio.wait_for(subscription.__anext__(), 2)
+        assert event.alias == 'button'
+
+    try:
+        loop.run_until_complete(exercise())
+    finally:
+        loop.run_until_complete(transport.quit())
+        loop.close()
+        server.stop()
+        deviceconfig.FULL_CONFIG_MAP.pop('pty_board')